@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import unicodedata
+
+from corpus import DATA_DIR, corpus_hash
+from quick_replies import all_canned_questions
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+# File lưu câu trả lời đã tạo sẵn cho các câu hỏi gợi ý cố định
+ANSWER_INDEX_PATH = os.getenv(
+    "ANSWER_INDEX_PATH",
+    os.path.join(DATA_DIR, "answer_index", "quick_reply_answers.json"),
+)
+# Câu hỏi tạo câu trả lời lỗi được thử lại sau ANSWER_INDEX_RETRY_BASE giây, nhân đôi sau mỗi lần lỗi
+# (tối đa ANSWER_INDEX_RETRY_MAX), thay vì làm cả index bị coi là cũ ở mỗi vòng kiểm tra
+ANSWER_INDEX_RETRY_BASE = int(os.getenv("ANSWER_INDEX_RETRY_BASE", "600"))
+ANSWER_INDEX_RETRY_MAX = int(os.getenv("ANSWER_INDEX_RETRY_MAX", "86400"))
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalizes a question for exact-match lookups: Unicode NFC, lowercase,
+    collapsed whitespace and no trailing punctuation.
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    text = " ".join(text.split())
+    return text.rstrip(" ?!.？！。")
+
+
+class AnswerIndex:
+    """
+    Pre-generated answers for canned questions, keyed by normalized question text. `failures` records
+    questions whose generation failed (attempt count, last error, next retry time). `prompt_version`
+    holds the prompt registry fingerprint the answers were generated with.
+    """
+
+    def __init__(self, entries=None, corpus_hash=None, prompt_version=None, built_at=None, failures=None):
+        self.entries = entries or {}
+        self.corpus_hash = corpus_hash
+        self.prompt_version = prompt_version
+        self.built_at = built_at
+        self.failures = failures or {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, path=ANSWER_INDEX_PATH):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(
+                entries=data.get("entries", {}),
+                corpus_hash=data.get("corpus_hash"),
+                prompt_version=data.get("prompt_version"),
+                built_at=data.get("built_at"),
+                failures=data.get("failures", {}),
+            )
+        except Exception as e:
+            logger.warning(f"Không thể đọc answer index tại '{path}': {e}")
+            return None
+
+    def save(self, path=ANSWER_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "corpus_hash": self.corpus_hash,
+                "prompt_version": self.prompt_version,
+                "built_at": self.built_at,
+                "entries": self.entries,
+                "failures": self.failures,
+            }, f, ensure_ascii=False, indent=4)
+        # Ghi vào file tạm rồi đổi tên để các worker khác không bao giờ đọc phải file ghi dở
+        os.replace(tmp_path, path)
+
+    def missing_questions(self, questions):
+        return [(q, lang) for q, lang in questions if normalize_question(q) not in self.entries]
+
+    def matches(self, current_corpus_hash, prompt_version) -> bool:
+        return self.corpus_hash == current_corpus_hash and self.prompt_version == prompt_version
+
+    def pending_questions(self, questions=None, now=None):
+        """
+        Missing questions that are due for generation (never attempted, or past their retry time).
+        """
+        now = time.time() if now is None else now
+        questions = questions if questions is not None else all_canned_questions()
+        return [
+            (q, lang) for q, lang in self.missing_questions(questions)
+            if self.failures.get(normalize_question(q), {}).get("retry_at", 0) <= now
+        ]
+
+    def is_fresh(self, current_corpus_hash, prompt_version, questions=None, now=None) -> bool:
+        """
+        True if the index was built from the current corpus and prompt version and every canned
+        question is either answered or waiting for its retry after a failure.
+        """
+        if not self.matches(current_corpus_hash, prompt_version):
+            return False
+        return not self.pending_questions(questions, now)
+
+    def record_failure(self, question, lang, error, now=None):
+        now = time.time() if now is None else now
+        key = normalize_question(question)
+        attempts = self.failures.get(key, {}).get("attempts", 0) + 1
+        delay = min(ANSWER_INDEX_RETRY_MAX, ANSWER_INDEX_RETRY_BASE * 2 ** (attempts - 1))
+        self.failures[key] = {
+            "question": question,
+            "lang": lang,
+            "attempts": attempts,
+            "last_error": str(error)[:500],
+            "retry_at": now + delay,
+        }
+        return delay
+
+    def record_answer(self, question, response):
+        key = normalize_question(question)
+        self.entries[key] = {
+            "question": question,
+            "answer": response.answer,
+            "lang": response.lang,
+            "suggestions": response.suggestions,
+        }
+        self.failures.pop(key, None)
+
+    def lookup(self, message: str):
+        return self.entries.get(normalize_question(message))
+
+
+async def build_answer_index(answer_fn, questions, current_corpus_hash, prompt_version, concurrency=4, base=None):
+    """
+    Runs `answer_fn(question, lang)` for the given questions with bounded concurrency and returns a new
+    AnswerIndex. `answer_fn` must return a ChatResponse and raise on failure; failures are recorded
+    with a retry time instead of an answer. When `base` (an index of the same corpus and prompt
+    version) is given, its answers and failure records are kept and only `questions` are generated.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    index = AnswerIndex(
+        entries=dict(base.entries) if base is not None else {},
+        corpus_hash=current_corpus_hash,
+        prompt_version=prompt_version,
+        failures=dict(base.failures) if base is not None else {},
+    )
+    answered = 0
+    start_time = time.time()
+
+    async def answer_one(question, lang):
+        nonlocal answered
+        async with semaphore:
+            try:
+                response = await answer_fn(question, lang)
+            except Exception as e:
+                delay = index.record_failure(question, lang, e)
+                logger.warning(f"Không thể tạo sẵn câu trả lời cho '{question}': {e}. Thử lại sau {delay}s.")
+                return
+        index.record_answer(question, response)
+        answered += 1
+
+    await asyncio.gather(*(answer_one(q, lang) for q, lang in questions))
+    logger.info(
+        f"Đã tạo sẵn {answered}/{len(questions)} câu trả lời gợi ý, index có {len(index)} câu "
+        f"(thời gian: {time.time() - start_time:.2f}s)."
+    )
+    index.built_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return index
+
+
+if __name__ == "__main__":
+    # Job offline: khởi tạo backend (LLM, Embedding, Qdrant) rồi tạo lại toàn bộ answer index
+    import app as backend_app
+
+    async def main():
+        await backend_app.initialize()
+        index = await backend_app.rebuild_answer_index(full=True)
+        print(f"Đã lưu {len(index)} câu trả lời vào '{ANSWER_INDEX_PATH}' (corpus hash: {corpus_hash()}).")
+
+    asyncio.run(main())
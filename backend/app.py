@@ -1,42 +1,60 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
-import json
 import logging
 import traceback
-from langdetect import detect, DetectorFactory
 from dotenv import load_dotenv
 import asyncio
 import time
+import contextlib
+import math
+import secrets
 
-# Import QdrantClient từ thư viện qdrant-client
-from qdrant_client import QdrantClient 
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
 
-# LangChain imports
-from langchain_google_genai import ChatGoogleGenerativeAI 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import Qdrant 
-from langchain_core.prompts import ChatPromptTemplate # Vẫn dùng để tạo prompt
-# Không cần RunnablePassthrough và StrOutputParser nếu không dùng LCEL chain
-# from langchain_core.runnables import RunnablePassthrough 
-# from langchain_core.output_parsers import StrOutputParser
+# Các thư viện nặng (langchain_google_genai, qdrant_client, langchain_qdrant, langdetect, torch...)
+# được import khi dùng lần đầu thay vì lúc import module, để giảm thời gian cold start.
+# Xem `python backend/startup_profile.py` để đo thời gian import.
 
-# Thiết lập seed cho langdetect
-DetectorFactory.seed = 0 
-
-# --- Cấu hình ---
+# Nạp .env trước khi import các module backend (một số module đọc biến môi trường lúc import)
 load_dotenv() # Load environment variables from .env file
 
+from prompts import build_prompt_registry
+from quick_replies import get_contextual_quick_replies, get_initial_suggestions, all_canned_questions
+from answer_index import AnswerIndex, ANSWER_INDEX_PATH, build_answer_index, normalize_question
+from singleflight import SingleFlight
+from batch_chat import parse_jsonl_questions
+from corpus import corpus_hash, load_chunks, DATA_CHUNKS_PATH
+from embedding_backends import create_embeddings, embed_queries, embedding_prefixes, EMBEDDING_BACKEND
+from compression import CompressionMiddleware
+from serialization import FastJSONResponse, ndjson_line, dumps, loads
+from rate_limit import RateLimiter, FairScheduler, RateLimitExceeded, client_key_for, RATE_LIMIT_ENABLED
+from disk_cache import TieredCache, create_cache, cache_version
+from token_accounting import TokenAccountant, prompt_token_breakdown, apply_usage_metadata, merge_usage_metadata, truncate_context_documents, normal_retrieval_limits, BUDGET_NORMAL, BUDGET_CACHED_ONLY
+from profiling import ProfilingMiddleware, SlowRequestLog, StackSampler, trace_stage, record_stage, annotate, untraced, PROFILE_SAMPLER_ENABLED
+from dual_index import IndexComparison, fuse_documents, DUAL_INDEX_MODE, SECONDARY_EMBEDDING_MODEL_NAME, SECONDARY_QDRANT_COLLECTION_NAME
+
+# --- Cấu hình ---
 QDRANT_CLOUD_URL = os.getenv("QDRANT_CLOUD_URL") 
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") 
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "apec_chatbot_data")
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") 
 
-if not QDRANT_CLOUD_URL:
+# Nguồn truy vấn context: "qdrant" (Qdrant Cloud) hoặc "local" (index numpy trong bộ nhớ, dựng từ file chunk)
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "qdrant").lower()
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "10"))
+
+if RETRIEVER_MODE not in ("qdrant", "local"):
+    raise ValueError(f"RETRIEVER_MODE không hợp lệ: '{RETRIEVER_MODE}'. Các giá trị hợp lệ: 'qdrant', 'local'.")
+if RETRIEVER_MODE == "qdrant" and not QDRANT_CLOUD_URL:
     raise ValueError("Biến môi trường 'QDRANT_CLOUD_URL' chưa được thiết lập. Vui lòng thêm vào file .env")
-if not QDRANT_API_KEY:
+if RETRIEVER_MODE == "qdrant" and not QDRANT_API_KEY:
     raise ValueError("Biến môi trường 'QDRANT_API_KEY' chưa được thiết lập. Vui lòng thêm vào file .env")
 if not GOOGLE_API_KEY:
     raise ValueError("Biến môi trường 'GOOGLE_API_KEY' chưa được thiết lập. Vui lòng thêm vào file .env")
@@ -44,19 +62,83 @@ if not GOOGLE_API_KEY:
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gemini-1.5-flash") 
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
 
+# Answer index cho các câu hỏi gợi ý: tự làm mới khi corpus chunk thay đổi
+ANSWER_INDEX_AUTO_REFRESH = os.getenv("ANSWER_INDEX_AUTO_REFRESH", "true").lower() == "true"
+ANSWER_INDEX_CHECK_INTERVAL = int(os.getenv("ANSWER_INDEX_CHECK_INTERVAL", "300")) # giây
+ANSWER_INDEX_CONCURRENCY = int(os.getenv("ANSWER_INDEX_CONCURRENCY", "4"))
+
+# Chạy job làm mới dữ liệu (refresh_pipeline.py) ngay trong backend, mỗi N giây; 0 = tắt
+REFRESH_PIPELINE_INTERVAL = int(os.getenv("REFRESH_PIPELINE_INTERVAL", "0"))
+
+# Batch chat: số lời gọi LLM chạy đồng thời tối đa
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Token cho các endpoint /admin/* (gửi qua header X-Admin-Token); để trống thì tắt các endpoint này
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # --- Khởi tạo Logger ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("apec_chatbot_backend")
 
+# --- Prompt registry: biên dịch sẵn template cho từng ngôn ngữ một lần lúc import ---
+prompt_registry = build_prompt_registry()
+
+# --- Nhận diện ngôn ngữ (langdetect được nạp khi dùng lần đầu) ---
+_langdetect_detect = None
+
+def detect(text: str) -> str:
+    global _langdetect_detect
+    if _langdetect_detect is None:
+        from langdetect import detect as langdetect_detect, DetectorFactory
+        # Thiết lập seed cho langdetect
+        DetectorFactory.seed = 0 
+        _langdetect_detect = langdetect_detect
+    return _langdetect_detect(text)
+
 # --- Khởi tạo LLM, Embeddings và Qdrant (Global) ---
 llm = None
 embeddings = None
 qdrant_vectorstore = None
+local_index = None
+local_index_corpus_hash = None
+local_index_reload_lock = asyncio.Lock()
+# Index phụ của model embedding khác, dùng khi chuyển model (DUAL_INDEX_MODE, xem dual_index.py)
+secondary_embeddings = None
+secondary_vectorstore = None
+secondary_local_index = None
+
+def retriever_ready() -> bool:
+    if RETRIEVER_MODE == "local":
+        return local_index is not None
+    return qdrant_vectorstore is not None
+
+def secondary_ready() -> bool:
+    if DUAL_INDEX_MODE == "off":
+        return False
+    if RETRIEVER_MODE == "local":
+        return secondary_local_index is not None
+    return secondary_vectorstore is not None
+
+def initialize_embeddings():
+    global embeddings
+    if embeddings is not None:
+        # Đã được nạp sẵn (ví dụ: serve.py nạp trong tiến trình master trước khi fork worker)
+        logger.info(f"Dùng lại Embedding Model '{EMBEDDING_MODEL_NAME}' đã được nạp sẵn.")
+        return
+    try:
+        logger.info(f"Đang khởi tạo Embedding Model: {EMBEDDING_MODEL_NAME} (backend: {EMBEDDING_BACKEND})...")
+        embeddings = create_embeddings(EMBEDDING_MODEL_NAME)
+        logger.info(f"Đã khởi tạo Embedding Model '{EMBEDDING_MODEL_NAME}' thành công.")
+    except Exception as e:
+        logger.critical(f"Không thể khởi tạo Embedding Model '{EMBEDDING_MODEL_NAME}'. Lỗi: {e}")
+        logger.critical("Đảm bảo thư viện 'sentence-transformers' (backend torch) hoặc 'onnxruntime' + model ONNX đã xuất (backend onnx) đã sẵn sàng.")
+        raise RuntimeError("Embedding model initialization failed.") from e
 
 def initialize_llm_and_embeddings():
-    global llm, embeddings
+    global llm
     try:
         logger.info(f"Đang khởi tạo LLM: {LLM_MODEL_NAME} (Google Gemini API)...")
+        from langchain_google_genai import ChatGoogleGenerativeAI
         llm = ChatGoogleGenerativeAI(model=LLM_MODEL_NAME, google_api_key=GOOGLE_API_KEY, temperature=0.7)
         llm.invoke("Hello") 
         logger.info(f"Đã khởi tạo LLM '{LLM_MODEL_NAME}' thành công.")
@@ -65,14 +147,46 @@ def initialize_llm_and_embeddings():
         logger.critical("Đảm bảo 'GOOGLE_API_KEY' đã được cung cấp chính xác và có quyền truy cập API Gemini.")
         raise RuntimeError("LLM initialization failed.") from e
 
+    initialize_embeddings()
+
+async def initialize_secondary_index(qdrant_client_instance=None):
+    """
+    Loads the secondary embedding model and its index for DUAL_INDEX_MODE. Failures are logged and
+    the API keeps serving from the primary index only.
+    """
+    global secondary_embeddings, secondary_vectorstore, secondary_local_index
+    if DUAL_INDEX_MODE == "off":
+        return
+    if not SECONDARY_EMBEDDING_MODEL_NAME or (RETRIEVER_MODE == "qdrant" and not SECONDARY_QDRANT_COLLECTION_NAME):
+        logger.error(
+            f"DUAL_INDEX_MODE={DUAL_INDEX_MODE} cần SECONDARY_EMBEDDING_MODEL_NAME (và SECONDARY_QDRANT_COLLECTION_NAME "
+            "khi RETRIEVER_MODE=qdrant). Chỉ dùng index chính."
+        )
+        return
     try:
-        logger.info(f"Đang khởi tạo Embedding Model: {EMBEDDING_MODEL_NAME}...")
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-        logger.info(f"Đã khởi tạo Embedding Model '{EMBEDDING_MODEL_NAME}' thành công.")
+        logger.info(f"Dual index ({DUAL_INDEX_MODE}): đang nạp index phụ với model '{SECONDARY_EMBEDDING_MODEL_NAME}'...")
+        model = await asyncio.to_thread(create_embeddings, SECONDARY_EMBEDDING_MODEL_NAME)
+        if RETRIEVER_MODE == "local":
+            from local_index import LocalVectorIndex
+            secondary_local_index = await asyncio.to_thread(
+                LocalVectorIndex.build, load_chunks(), model, model_name=SECONDARY_EMBEDDING_MODEL_NAME
+            )
+        else:
+            from langchain_qdrant import Qdrant
+            store = Qdrant(
+                client=qdrant_client_instance,
+                embeddings=model,
+                collection_name=SECONDARY_QDRANT_COLLECTION_NAME,
+                content_payload_key="content_text",
+            )
+            collection_info = await asyncio.to_thread(store.client.count, collection_name=SECONDARY_QDRANT_COLLECTION_NAME, exact=True)
+            logger.info(f"Collection phụ '{SECONDARY_QDRANT_COLLECTION_NAME}' có {collection_info.count} points.")
+            secondary_vectorstore = store
+        secondary_embeddings = model
+        logger.info(f"Dual index ({DUAL_INDEX_MODE}): đã nạp index phụ '{SECONDARY_EMBEDDING_MODEL_NAME}'.")
     except Exception as e:
-        logger.critical(f"Không thể khởi tạo Embedding Model '{EMBEDDING_MODEL_NAME}'. Lỗi: {e}")
-        logger.critical("Đảm bảo thư viện 'sentence-transformers' đã được cài đặt.")
-        raise RuntimeError("Embedding model initialization failed.") from e
+        secondary_local_index = secondary_vectorstore = None
+        logger.error(f"Không thể nạp index phụ '{SECONDARY_EMBEDDING_MODEL_NAME}': {e}. Chỉ dùng index chính.")
 
 # --- Khởi tạo FastAPI App ---
 app = FastAPI(
@@ -88,11 +202,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Nén gzip / brotli cho response >= COMPRESSION_MINIMUM_SIZE byte (và cho các response stream NDJSON)
+app.add_middleware(CompressionMiddleware)
+
+# --- Đo thời gian từng bước và lưu các request /chat* chậm (xem profiling.py) ---
+slow_requests = SlowRequestLog()
+app.add_middleware(ProfilingMiddleware, slow_log=slow_requests)
+stack_sampler = StackSampler() if PROFILE_SAMPLER_ENABLED else None
 
 # --- Sự kiện khởi động ứng dụng ---
 @app.on_event("startup")
 async def startup_event():
-    global qdrant_vectorstore, llm, embeddings 
+    global qdrant_vectorstore, llm, embeddings, local_index, local_index_corpus_hash, response_cache
+
+    if stack_sampler is not None:
+        stack_sampler.start()
+
+    response_cache = create_cache()
 
     try:
         initialize_llm_and_embeddings()
@@ -100,7 +226,19 @@ async def startup_event():
         logger.critical("App startup aborted due to LLM/Embedding initialization failure.")
         exit(1)
 
+    if RETRIEVER_MODE == "local":
+        # Không cần Qdrant: dựng index trong bộ nhớ từ file chunk
+        from local_index import LocalVectorIndex
+        logger.info(f"RETRIEVER_MODE=local: đang dựng local index từ '{DATA_CHUNKS_PATH}'...")
+        local_index_corpus_hash = corpus_hash()
+        local_index = await asyncio.to_thread(LocalVectorIndex.build, load_chunks(), embeddings, model_name=EMBEDDING_MODEL_NAME)
+        await initialize_secondary_index()
+        refresh_cache_versions()
+        return
+
     logger.info("Đang kết nối tới Qdrant Vector Store trong sự kiện startup...")
+    from qdrant_client import QdrantClient
+    from langchain_qdrant import Qdrant
 
     retries = 5 
     delay = 5 
@@ -128,7 +266,8 @@ async def startup_event():
                 exact=True 
             )
 
-            logger.info(f"Collection '{QDRANT_COLLECTION_NAME}' có {collection_info.count} points.")
+            update_qdrant_collection_target()
+            logger.info(f"Collection '{QDRANT_COLLECTION_NAME}' ({qdrant_collection_target}) có {collection_info.count} points.")
             logger.info("Đã kết nối và xác nhận Qdrant Vector Store thành công.")
             break 
 
@@ -142,246 +281,881 @@ async def startup_event():
                 logger.critical("Đảm bảo Qdrant Cloud URL và API Key chính xác và Qdrant server đang hoạt động.")
                 raise RuntimeError("Qdrant connection failed, cannot start API.") from e
 
+    await initialize_secondary_index(qdrant_vectorstore.client)
+    if secondary_vectorstore is not None:
+        await asyncio.to_thread(update_qdrant_collection_target)
+    # Phiên bản cache phải có trước request đầu tiên, kể cả khi chỉ chạy startup_event (batch_chat, answer_index)
+    refresh_cache_versions()
 
-class ChatRequest(BaseModel):
-    message: str
 
-class ChatResponse(BaseModel):
-    answer: str
-    lang: str
-    suggestions: list[str] = []
+# --- Answer index cho các câu hỏi gợi ý cố định ---
+answer_index = None
 
-def get_contextual_quick_replies(user_message: str, lang: str) -> list:
-    message = user_message.lower()
-    
-    # Gợi ý chung ban đầu (sẽ được ưu tiên nếu không có gợi ý cụ thể nào khác)
-    general_suggestions_vi = [
-        "Giới thiệu APEC 2025",
-        "Lịch trình các cuộc họp chính",
-        "Thông tin về địa điểm APEC",
-        "Các bài báo mới nhất",
-        "Hỗ trợ nhập cảnh"
-    ]
-    general_suggestions_en = [
-        "Overview of APEC 2025",
-        "Key meetings schedule",
-        "APEC venue information",
-        "Latest press releases",
-        "Entry support"
+# --- Gộp các câu hỏi giống nhau đang được xử lý đồng thời (single-flight) ---
+inflight_requests = SingleFlight()
+
+# --- Giới hạn tốc độ theo client (token bucket) và lập lịch công bằng cho pipeline RAG + LLM ---
+rate_limiter = RateLimiter()
+pipeline_scheduler = FairScheduler()
+
+# --- Thống kê token / chi phí LLM theo cửa sổ thời gian và ngân sách token ---
+token_accountant = TokenAccountant()
+
+# --- Cache embedding câu hỏi / kết quả truy vấn / câu trả lời (L1 bộ nhớ + L2 SQLite dùng chung giữa các worker) ---
+# Chỉ có L1 cho tới khi startup_event mở L2, để import app không tạo file SQLite
+response_cache = TieredCache()
+
+# --- So sánh kết quả index chính / index phụ (DUAL_INDEX_MODE) ---
+index_comparison = IndexComparison()
+# Giữ tham chiếu tới các task truy vấn index phụ chạy nền (shadow) để không bị thu hồi giữa chừng
+shadow_tasks = set()
+
+# Collection thật mà QDRANT_COLLECTION_NAME (và SECONDARY_QDRANT_COLLECTION_NAME) đang trỏ tới (alias blue/green của embedding.py)
+qdrant_collection_target = None
+secondary_collection_target = None
+
+def update_qdrant_collection_target():
+    """
+    Resolves the alias QDRANT_COLLECTION_NAME to its collection (the name itself when it is not an alias),
+    so the retrieval/answer caches are invalidated after an index swap or rollback. Same for the
+    secondary collection when it is loaded.
+    """
+    global qdrant_collection_target, secondary_collection_target
+    try:
+        aliases = {alias.alias_name: alias.collection_name for alias in qdrant_vectorstore.client.get_aliases().aliases}
+    except Exception as e:
+        logger.warning(f"Không thể đọc alias của Qdrant: {e}")
+        return
+    target = aliases.get(QDRANT_COLLECTION_NAME, QDRANT_COLLECTION_NAME)
+    if qdrant_collection_target is not None and target != qdrant_collection_target:
+        logger.info(f"Alias '{QDRANT_COLLECTION_NAME}' đã chuyển: {qdrant_collection_target} -> {target}.")
+    qdrant_collection_target = target
+    if secondary_vectorstore is not None:
+        secondary_collection_target = aliases.get(SECONDARY_QDRANT_COLLECTION_NAME, SECONDARY_QDRANT_COLLECTION_NAME)
+
+def refresh_cache_versions(current_corpus_hash: str | None = None):
+    """
+    Versions each cache namespace by what its values depend on, so a new corpus, collection,
+    embedding model, LLM or prompt invalidates the matching entries.
+    """
+    current_corpus_hash = current_corpus_hash or corpus_hash()
+    if local_index is not None and local_index_corpus_hash:
+        # RETRIEVER_MODE=local: phiên bản theo corpus mà index trong bộ nhớ đang dùng, không theo file trên đĩa
+        # (file có thể đã đổi trong lúc index mới còn đang dựng)
+        current_corpus_hash = local_index_corpus_hash
+    # Tiền tố query/passage (họ E5) đổi vector nên cũng là một phần của phiên bản
+    embedding_version = cache_version(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, *embedding_prefixes(EMBEDDING_MODEL_NAME))
+    retrieval_parts = [
+        embedding_version, RETRIEVER_MODE, (qdrant_collection_target or QDRANT_COLLECTION_NAME) if RETRIEVER_MODE == "qdrant" else "", current_corpus_hash
     ]
+    if DUAL_INDEX_MODE == "merge" and secondary_ready():
+        # Kết quả đã trộn phụ thuộc cả index phụ
+        retrieval_parts += [
+            SECONDARY_EMBEDDING_MODEL_NAME, *embedding_prefixes(SECONDARY_EMBEDDING_MODEL_NAME),
+            (secondary_collection_target or SECONDARY_QDRANT_COLLECTION_NAME) if RETRIEVER_MODE == "qdrant" else ""
+        ]
+    retrieval_version = cache_version(*retrieval_parts)
+    response_cache.set_version("embedding", embedding_version)
+    response_cache.set_version("retrieval", retrieval_version)
+    response_cache.set_version("answer", cache_version(retrieval_version, LLM_MODEL_NAME, prompt_registry.fingerprint))
 
-    suggestions = []
-
-    # Gợi ý dựa trên các chủ đề chính trong dữ liệu bạn có
-    # Tiếng Việt
-    if lang == "vi":
-        if "apec" in message or "tổng quan" in message or "giới thiệu" in message:
-            suggestions.extend([
-                "APEC là gì?",
-                "Tầm nhìn APEC 2040",
-                "Các nền kinh tế thành viên APEC",
-                "Đóng góp của Hàn Quốc cho APEC",
-                "Biểu tượng và chủ đề APEC 2025"
-            ])
-        if "lịch" in message or "sự kiện" in message or "cuộc họp" in message:
-            suggestions.extend([
-                "Lịch trình các cuộc họp chính",
-                "Các sự kiện bên lề APEC",
-                "Họp SOM1 diễn ra khi nào?"
-            ])
-        if "địa điểm" in message or "tổ chức" in message or "nơi" in message:
-            suggestions.extend([
-                "Giới thiệu về Gyeongju",
-                "Thông tin về Jeju",
-                "Khám phá Incheon",
-                "Địa điểm ở Busan",
-                "Địa điểm ở Seoul"
-            ])
-        if "thủ tục" in message or "nhập cảnh" in message or "visa" in message or "di chuyển" in message:
-            suggestions.extend([
-                "Thông tin di chuyển đến Gyeongju",
-                "Di chuyển nội địa ở Jeju",
-                "Thông tin thực tế APEC (khí hậu, tiền tệ)",
-                "Số điện thoại khẩn cấp"
-            ])
-        if "tin tức" in message or "báo chí" in message or "mới nhất" in message:
-            suggestions.extend([
-                "Đọc các thông cáo báo chí mới",
-                "Tin tức về cuộc họp MRT",
-                "Tin tức về SOM2 Jeju"
-            ])
-        if "văn hóa" in message or "ẩm thực" in message or "du lịch" in message:
-            suggestions.extend([
-                "Điểm tham quan ở Gyeongju",
-                "Văn hóa & Thiên nhiên Jeju",
-                "Du lịch chủ đề ở Jeju",
-                "Địa điểm ăn uống ở Incheon",
-                "Địa điểm tham quan ở Incheon"
-            ])
-
-    # Tiếng Anh
-    elif lang == "en":
-        if "apec" in message or "overview" in message or "introduction" in message:
-            suggestions.extend([
-                "What is APEC?",
-                "APEC 2040 Vision",
-                "APEC member economies",
-                "Korea's contribution to APEC",
-                "APEC 2025 Emblem and Theme"
-            ])
-        if "schedule" in message or "event" in message or "meetings" in message:
-            suggestions.extend([
-                "Key meetings schedule",
-                "APEC Side Events",
-                "When is SOM1?"
-            ])
-        if "location" in message or "where" in message or "venue" in message:
-            suggestions.extend([
-                "About Gyeongju",
-                "About Jeju",
-                "Explore Incheon",
-                "About Busan",
-                "About Seoul"
-            ])
-        if "procedure" in message or "entry" in message or "visa" in message or "travel" in message:
-            suggestions.extend([
-                "Transportation to Gyeongju",
-                "Jeju domestic travel",
-                "Practical APEC information (climate, currency)",
-                "Emergency phone numbers"
-            ])
-        if "news" in message or "press" in message or "latest" in message:
-            suggestions.extend([
-                "Read latest press releases",
-                "News about MRT Meeting",
-                "News about SOM2 Jeju"
-            ])
-        if "culture" in message or "cuisine" in message or "tourism" in message or "attractions" in message:
-            suggestions.extend([
-                "Gyeongju attractions",
-                "Jeju Nature & Culture",
-                "Jeju themed travel",
-                "Incheon local eateries",
-                "Incheon attractions"
-            ])
-    
-    unique_suggestions = list(dict.fromkeys(suggestions))
-    
-    if not unique_suggestions:
-        return general_suggestions_vi if lang == "vi" else general_suggestions_en
-        
-    return unique_suggestions[:5]
+async def rebuild_answer_index(full=False):
+    """
+    Generates answers for the canned suggestions through the full RAG pipeline, saves them to disk
+    and swaps the in-memory index. The index is keyed on the prompt registry fingerprint (every template
+    and the A/B routing), like the answer cache. When the current index (on disk or in memory) already
+    matches the corpus and prompts, only the due missing questions are generated unless `full` is set.
+    """
+    global answer_index
+    current_hash = corpus_hash()
+    questions = all_canned_questions()
+    base = None
+    if not full:
+        # Index trên đĩa có thể mới hơn (worker khác vừa ghi)
+        for candidate in (AnswerIndex.load(ANSWER_INDEX_PATH), answer_index):
+            if candidate is not None and candidate.matches(current_hash, prompt_registry.fingerprint):
+                base = candidate
+                questions = candidate.pending_questions(questions)
+                break
+    new_index = await build_answer_index(
+        answer_fn=lambda question, lang: generate_answer(question, lang, strict=True),
+        questions=questions,
+        current_corpus_hash=current_hash,
+        prompt_version=prompt_registry.fingerprint,
+        concurrency=ANSWER_INDEX_CONCURRENCY,
+        base=base,
+    )
+    new_index.save(ANSWER_INDEX_PATH)
+    answer_index = new_index
+    return new_index
 
-# --- API Endpoint ---
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    start_total_time = time.time() # Bắt đầu tính tổng thời gian
-    user_message = req.message
-    if not user_message:
-        logger.warning("Nhận được câu hỏi rỗng từ frontend.")
-        return ChatResponse(answer="Vui lòng cung cấp một câu hỏi.", lang="unknown", suggestions=[])
-    
-    logger.info(f"Nhận được câu hỏi: {user_message}")
+@contextlib.contextmanager
+def answer_index_build_lock():
+    """
+    Non-blocking inter-process lock next to the index file. Yields True if this process holds it.
+    On platforms without fcntl (Windows) every process is allowed to build.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(ANSWER_INDEX_PATH), exist_ok=True)
+    with open(f"{ANSWER_INDEX_PATH}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+async def reload_local_index(current_hash: str):
+    """
+    Rebuilds the in-memory indexes (RETRIEVER_MODE=local, primary and secondary) after the chunk file
+    changed on disk. Both are swapped together, then the retrieval cache version moves to the new corpus.
+    """
+    global local_index, secondary_local_index, local_index_corpus_hash
+    from local_index import LocalVectorIndex
+    async with local_index_reload_lock:
+        if current_hash == local_index_corpus_hash:
+            return
+        logger.info(f"File chunk đã thay đổi (corpus hash: {current_hash}). Đang dựng lại local index...")
+        chunks = await asyncio.to_thread(load_chunks)
+        new_index = await asyncio.to_thread(LocalVectorIndex.build, chunks, embeddings, model_name=EMBEDDING_MODEL_NAME)
+        new_secondary_index = None
+        if secondary_local_index is not None:
+            try:
+                new_secondary_index = await asyncio.to_thread(
+                    LocalVectorIndex.build, chunks, secondary_embeddings, model_name=SECONDARY_EMBEDDING_MODEL_NAME
+                )
+            except Exception as e:
+                # Không giữ index phụ của corpus cũ: trộn / so sánh với chunk cũ sẽ sai
+                logger.error(f"Không thể dựng lại index phụ '{SECONDARY_EMBEDDING_MODEL_NAME}': {e}. Chỉ dùng index chính.")
+        local_index, secondary_local_index = new_index, new_secondary_index
+        local_index_corpus_hash = current_hash
+        refresh_cache_versions(current_hash)
 
-    if llm is None or embeddings is None or qdrant_vectorstore is None:
-        logger.critical("LLM, Embedding Model hoặc Qdrant vectorstore chưa được khởi tạo. API không sẵn sàng.")
-        error_answer_vi = "Hệ thống chưa sẵn sàng. Vui lòng thử lại sau hoặc liên hệ quản trị viên."
-        error_answer_en = "System not ready. Please try again later or contact the administrator."
-        
+async def answer_index_refresh_loop():
+    # Kiểm tra định kỳ: nếu corpus chunk hoặc phiên bản prompt thay đổi thì tạo lại index
+    global answer_index
+    while True:
         try:
-            detected_lang_for_error = detect(user_message)
-        except Exception:
-            detected_lang_for_error = "en" 
-
-        return ChatResponse(
-            answer=error_answer_vi if detected_lang_for_error == "vi" else error_answer_en, 
-            lang=detected_lang_for_error, 
-            suggestions=[]
-        )
+            current_hash = corpus_hash()
+            if local_index is not None and current_hash != local_index_corpus_hash:
+                await reload_local_index(current_hash)
+            if qdrant_vectorstore is not None:
+                await asyncio.to_thread(update_qdrant_collection_target)
+            refresh_cache_versions(current_hash)
+            if answer_index is None or not answer_index.is_fresh(current_hash, prompt_registry.fingerprint):
+                # Có thể worker khác đã tạo xong index mới trên đĩa
+                on_disk_index = AnswerIndex.load(ANSWER_INDEX_PATH)
+                if on_disk_index is not None and on_disk_index.is_fresh(current_hash, prompt_registry.fingerprint):
+                    answer_index = on_disk_index
+                    logger.info(f"Đã nạp answer index mới từ đĩa ({len(answer_index)} câu trả lời).")
+                elif llm is not None and retriever_ready() and token_accountant.level() == BUDGET_NORMAL:
+                    # Khi chạy nhiều worker, chỉ một worker giữ khóa và tạo lại index; các worker khác nạp từ đĩa sau
+                    with answer_index_build_lock() as acquired:
+                        if acquired:
+                            logger.info(f"Answer index đã cũ hoặc chưa có (corpus hash: {current_hash}). Đang tạo lại...")
+                            await rebuild_answer_index()
+        except Exception as e:
+            logger.error(f"Lỗi khi làm mới answer index: {e}\n{traceback.format_exc()}")
+        await asyncio.sleep(ANSWER_INDEX_CHECK_INTERVAL)
+
+async def refresh_pipeline_loop():
+    # Job crawl → chunk → embed → upload chạy nền; khi nhiều worker, khóa trong REFRESH_DIR chỉ cho một worker chạy
+    from refresh_pipeline import run_refresh, format_report
+    while True:
+        await asyncio.sleep(REFRESH_PIPELINE_INTERVAL)
+        try:
+            state = await asyncio.to_thread(run_refresh, embeddings=embeddings, min_interval=REFRESH_PIPELINE_INTERVAL * 0.9)
+            if state is None:
+                continue
+            logger.info(format_report(state))
+            if state["status"] == "done":
+                # Nhận corpus / collection mới ngay, không chờ vòng kiểm tra answer index
+                current_hash = corpus_hash()
+                if local_index is not None and current_hash != local_index_corpus_hash:
+                    await reload_local_index(current_hash)
+                if qdrant_vectorstore is not None:
+                    await asyncio.to_thread(update_qdrant_collection_target)
+                refresh_cache_versions(current_hash)
+        except Exception as e:
+            logger.error(f"Lỗi khi chạy job làm mới dữ liệu: {e}\n{traceback.format_exc()}")
+
+@app.on_event("startup")
+async def load_answer_index(background_tasks: bool = True):
+    global answer_index
+    refresh_cache_versions()
+    answer_index = AnswerIndex.load(ANSWER_INDEX_PATH)
+    if answer_index is not None:
+        logger.info(f"Đã nạp answer index với {len(answer_index)} câu trả lời tạo sẵn.")
+    if not background_tasks:
+        return
+    if ANSWER_INDEX_AUTO_REFRESH:
+        asyncio.create_task(answer_index_refresh_loop())
+    if REFRESH_PIPELINE_INTERVAL > 0:
+        asyncio.create_task(refresh_pipeline_loop())
+
+async def initialize(background_tasks: bool = False):
+    """
+    Runs the same startup sequence as the server (models, retriever, cache versions, answer index) for
+    offline callers such as batch_chat.py; the periodic refresh loops only start with `background_tasks`.
+    """
+    await startup_event()
+    await load_answer_index(background_tasks=background_tasks)
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+class ChatResponse(BaseModel):
+    answer: str
+    lang: str
+    suggestions: list[str] = []
 
+def detect_language(user_message: str) -> str:
     # Log thời gian phát hiện ngôn ngữ
     start_lang_detect_time = time.time()
     try:
-        detected_lang = detect(user_message)
+        with trace_stage("language_detect"):
+            detected_lang = detect(user_message)
         logger.info(f"Ngôn ngữ được nhận diện: {detected_lang} (thời gian: {time.time() - start_lang_detect_time:.4f}s)")
     except Exception as e:
         detected_lang = "en" 
         logger.warning(f"Không thể nhận diện ngôn ngữ, mặc định là tiếng Anh. Lỗi: {e} (thời gian: {time.time() - start_lang_detect_time:.4f}s)")
+    return detected_lang
+
+async def embed_query_cached(user_message: str, secondary: bool = False):
+    import numpy as np
+
+    cache_key = normalize_question(user_message)
+    if secondary:
+        # Cùng namespace với model chính, phân biệt bằng tên model
+        cache_key = f"{SECONDARY_EMBEDDING_MODEL_NAME}:{cache_key}"
+    cached_vector = await response_cache.aget("embedding", cache_key)
+    if cached_vector is not None:
+        return np.frombuffer(cached_vector, dtype=np.float32).tolist()
+    with trace_stage("secondary_embedding" if secondary else "embedding"):
+        query_vector = await asyncio.to_thread((secondary_embeddings if secondary else embeddings).embed_query, user_message)
+    await response_cache.aset("embedding", cache_key, np.asarray(query_vector, dtype=np.float32).tobytes())
+    return query_vector
+
+async def search_index(user_message: str, k: int, secondary: bool = False):
+    # Truy vấn một index (chính hoặc phụ), không qua cache kết quả
+    query_vector = await embed_query_cached(user_message, secondary=secondary)
+    with trace_stage("secondary_vector_search" if secondary else "vector_search"):
+        if RETRIEVER_MODE == "local":
+            index = secondary_local_index if secondary else local_index
+            return index.to_documents(index.search(query_vector, k))
+        vectorstore = secondary_vectorstore if secondary else qdrant_vectorstore
+        return await asyncio.to_thread(vectorstore.similarity_search_by_vector, query_vector, k=k)
+
+async def compare_with_secondary_index(user_message: str, k: int, primary_docs, primary_seconds: float):
+    # Chế độ shadow: chạy nền sau khi đã có kết quả index chính, không ghi vào trace của request
+    with untraced():
+        start = time.perf_counter()
+        try:
+            secondary_docs = await search_index(user_message, k, secondary=True)
+        except Exception as e:
+            index_comparison.record_error(e)
+            return
+        index_comparison.record(user_message, primary_docs, secondary_docs, primary_seconds, time.perf_counter() - start)
+
+async def search_documents(user_message: str, k: int = RETRIEVAL_K):
+    from langchain_core.documents import Document
 
-    language_instruction = ""
-    if detected_lang == 'vi':
-        language_instruction = "Hãy trả lời câu hỏi bằng tiếng Việt."
-    elif detected_lang == 'en':
-        language_instruction = "Please answer the question in English."
+    cache_key = f"{k}:{normalize_question(user_message)}"
+    cached_docs = await response_cache.aget("retrieval", cache_key)
+    if cached_docs is not None:
+        return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in loads(cached_docs)]
+
+    async def timed_search(secondary: bool):
+        start = time.perf_counter()
+        found = await search_index(user_message, k, secondary=secondary)
+        return found, time.perf_counter() - start
+
+    cacheable = True
+    if DUAL_INDEX_MODE == "merge" and secondary_ready():
+        primary_result, secondary_result = await asyncio.gather(timed_search(False), timed_search(True), return_exceptions=True)
+        if isinstance(primary_result, Exception):
+            raise primary_result
+        if isinstance(secondary_result, Exception):
+            # Index phụ lỗi: trả lời bằng index chính nhưng không cache kết quả thiếu
+            index_comparison.record_error(secondary_result)
+            docs, cacheable = primary_result[0], False
+        else:
+            index_comparison.record(user_message, primary_result[0], secondary_result[0], primary_result[1], secondary_result[1])
+            docs = fuse_documents([primary_result[0], secondary_result[0]], k)
     else:
-        language_instruction = "Please answer the question in English if possible."
+        docs, primary_seconds = await timed_search(False)
+        if DUAL_INDEX_MODE == "shadow" and secondary_ready() and index_comparison.should_sample():
+            task = asyncio.create_task(compare_with_secondary_index(user_message, k, docs, primary_seconds))
+            shadow_tasks.add(task)
+            task.add_done_callback(shadow_tasks.discard)
+    if cacheable:
+        await response_cache.aset("retrieval", cache_key, dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]))
+    return docs
+
+async def search_documents_batch(user_messages: list[str], k: int = RETRIEVAL_K):
+    """
+    Embeds all questions in one batched call, then runs all vector searches in one
+    batch request (Qdrant search_batch, or one matrix product on the local index).
+    In DUAL_INDEX_MODE=merge the secondary index is searched the same way and fused.
+    """
+    if DUAL_INDEX_MODE == "merge" and secondary_ready():
+        primary_results, secondary_results = await asyncio.gather(
+            search_index_batch(user_messages, k), search_index_batch(user_messages, k, secondary=True)
+        )
+        return [fuse_documents([primary, secondary], k) for primary, secondary in zip(primary_results, secondary_results)]
+    return await search_index_batch(user_messages, k)
 
-    prompt_template = f"""
-    Bạn là một trợ lý chatbot thân thiện, thông tin, và đa ngôn ngữ cho sự kiện APEC 2025. 
-    Nhiệm vụ của bạn là trả lời các câu hỏi của người dùng một cách chính xác và hữu ích dựa trên thông tin được cung cấp.
+async def search_index_batch(user_messages: list[str], k: int, secondary: bool = False):
+    query_vectors = await asyncio.to_thread(embed_queries, secondary_embeddings if secondary else embeddings, user_messages)
+    if RETRIEVER_MODE == "local":
+        index = secondary_local_index if secondary else local_index
+        return [index.to_documents(results) for results in index.search_batch(query_vectors, k)]
 
-    **Data liên quan:**
-    {{context}}
+    from qdrant_client import models
+    vectorstore = secondary_vectorstore if secondary else qdrant_vectorstore
+    responses = await asyncio.to_thread(
+        vectorstore.client.query_batch_points,
+        collection_name=vectorstore.collection_name,
+        requests=[models.QueryRequest(query=vector, limit=k, with_payload=True) for vector in query_vectors],
+    )
+    return [[document_from_point(vectorstore, point) for point in response.points] for response in responses]
 
-    **Câu hỏi của người dùng:**
-    {{question}}
+def document_from_point(vectorstore, point):
+    # Dựng Document giống đường truy vấn đơn của LangChain Qdrant: metadata lấy từ payload["metadata"]
+    from langchain_core.documents import Document
+    metadata = dict(point.payload.get(vectorstore.metadata_payload_key) or {})
+    metadata["_id"] = point.id
+    metadata["_collection_name"] = vectorstore.collection_name
+    return Document(page_content=point.payload.get(vectorstore.content_payload_key, ""), metadata=metadata)
 
-    ---
-    **Hướng dẫn trả lời:**
-    1.  Sử dụng chỉ các thông tin được cung cấp trong "Ngữ cảnh liên quan" để trả lời câu hỏi.
-    2.  Nếu ngữ cảnh không chứa đủ thông tin để trả lời câu hỏi, hãy nói rằng "Tôi xin lỗi, tôi không tìm thấy thông tin cụ thể cho câu hỏi này trong dữ liệu của mình. Bạn có muốn hỏi về chủ đề khác không?".
-    3.  **{language_instruction}**
-    4.  Tránh đưa ra thông tin không có trong ngữ cảnh.
-    5.  Giữ câu trả lời ngắn gọn, trực tiếp và tập trung vào câu hỏi.
+def format_context(retrieved_docs, max_tokens: int | None = None) -> str:
+    if not retrieved_docs:
+        logger.warning("Không tìm thấy tài liệu nào cho câu hỏi này.")
+        return "Không tìm thấy thông tin liên quan."
+    if max_tokens:
+        retrieved_docs = truncate_context_documents(retrieved_docs, max_tokens, format_document)
+    return "\n\n".join(format_document(doc) for doc in retrieved_docs)
+
+def format_document(doc) -> str:
+    # Gắn URL nguồn (chunk tạo bởi structured_chunker) để câu trả lời có thể trích dẫn
+    source_url = doc.metadata.get("source_url")
+    if source_url and source_url != "N/A":
+        return f"{doc.page_content}\n(Nguồn: {source_url})"
+    return doc.page_content
+
+RETRIEVAL_ERROR_CONTEXT = "Lỗi khi truy vấn thông tin."
+
+async def retrieve_context(user_message: str, strict: bool = False, limits=None) -> str:
+    """
+    Retrieves the top chunks (Qdrant or local index) and joins them into the context string.
+    With `strict=True`, retrieval errors are raised instead of replaced by a placeholder context.
+    `limits` is (k, max_context_tokens); defaults to the token budget's current limits.
     """
-    
-    context_str = ""
     start_retrieval_time = time.time() # Bắt đầu tính thời gian truy vấn
     try:
-        logger.info("Bắt đầu truy vấn Qdrant...")
-        retriever = qdrant_vectorstore.as_retriever(search_kwargs={"k": 10})
-        
-        retrieved_docs = await retriever.ainvoke(user_message) # SỬA THÀNH AINVOKE VÌ HÀM CHAT LÀ ASYNC
-        
-        logger.info(f"Đã truy vấn Qdrant. Tìm thấy {retrieved_docs} tài liệu liên quan (thời gian: {time.time() - start_retrieval_time:.4f}s):")
-        
-        context_str_parts = []
-        if retrieved_docs:
-            for i, doc in enumerate(retrieved_docs):
-                # logger.info(f"  --- Tài liệu {i+1} ---") # Bỏ hoặc comment dòng này để tránh log quá dài
-                # logger.info(f"  Content (đầu): {doc.page_content[:300]}...") # Bỏ hoặc comment dòng này
-                # logger.info(f"  Metadata: {json.dumps(doc.metadata, ensure_ascii=False)}") # Bỏ hoặc comment dòng này
-                context_str_parts.append(doc.page_content)
-            
-            context_str = "\n\n".join(context_str_parts)
-            # logger.info("="*100) # Bỏ hoặc comment dòng này
-            # logger.info(f"CONTEXT ĐƯỢC GỬI ĐẾN LLM:\n{len(context_str)} ký tự") # Sửa lại log
-            # logger.info("="*100) # Bỏ hoặc comment dòng này
-        else:
-            logger.warning("Không tìm thấy tài liệu nào từ Qdrant cho câu hỏi này.")
-            context_str = "Không tìm thấy thông tin liên quan."
-
+        logger.info(f"Bắt đầu truy vấn context ({RETRIEVER_MODE})...")
+        # Khi gần hết ngân sách token: lấy ít chunk hơn và cắt ngắn context
+        k, max_context_tokens = limits or token_accountant.retrieval_limits(RETRIEVAL_K)
+        with trace_stage("retrieval"):
+            retrieved_docs = await search_documents(user_message, k=k)
+        logger.info(f"Đã truy vấn context. Tìm thấy {len(retrieved_docs)} tài liệu liên quan (thời gian: {time.time() - start_retrieval_time:.4f}s)")
+        annotate(retrieval_k=k, doc_ids=[doc.metadata.get("id") for doc in retrieved_docs])
+        return format_context(retrieved_docs, max_tokens=max_context_tokens)
     except Exception as e:
-        logger.error(f"Lỗi khi truy vấn Qdrant để lấy context: {e}\n{traceback.format_exc()} (thời gian: {time.time() - start_retrieval_time:.4f}s)")
-        context_str = "Lỗi khi truy vấn thông tin."
+        logger.error(f"Lỗi khi truy vấn context: {e}\n{traceback.format_exc()} (thời gian: {time.time() - start_retrieval_time:.4f}s)")
+        if strict:
+            raise
+        return RETRIEVAL_ERROR_CONTEXT
 
-    final_prompt = prompt_template.format(context=context_str, question=user_message)
+async def build_final_prompt(user_message: str, detected_lang: str, strict: bool = False, context_str: str | None = None):
+    """
+    Returns the prompt messages and the estimated token breakdown (instruction / context / question).
+    """
+    compiled_prompt = prompt_registry.select(detected_lang, routing_key=user_message)
+    logger.info(f"Sử dụng prompt phiên bản '{compiled_prompt.version}' ({compiled_prompt.lang}).")
+
+    if context_str is None:
+        context_str = await retrieve_context(user_message, strict=strict)
+    usage = prompt_token_breakdown(compiled_prompt, context_str, user_message)
+    messages = compiled_prompt.to_messages(context=context_str, question=user_message)
+    annotate(
+        prompt_version=compiled_prompt.version,
+        prompt_chars=sum(len(content) for _, content in messages),
+        context_chars=len(context_str),
+        estimated_prompt_tokens=usage.input_tokens,
+    )
+    return messages, usage
+
+async def generate_answer(user_message: str, detected_lang: str, strict: bool = False, context_str: str | None = None) -> ChatResponse:
+    """
+    Runs the RAG pipeline (retrieval + LLM) for one question. Raises if the LLM call fails.
+    Pass `context_str` to skip retrieval when the context was already fetched (batch mode).
+    """
+    final_prompt, usage = await build_final_prompt(user_message, detected_lang, strict=strict, context_str=context_str)
     
-    response_text = ""
     start_llm_time = time.time() # Bắt đầu tính thời gian gọi LLM
-    try:
-        logger.info("Bắt đầu gọi LLM...")
+    logger.info("Bắt đầu gọi LLM...")
+    with trace_stage("llm"):
         llm_response = await llm.ainvoke(final_prompt) # SỬA THÀNH AINVOKE
-        response_text = llm_response.content
-        logger.info(f"Trả lời của LLM đã nhận (thời gian: {time.time() - start_llm_time:.4f}s). Tổng thời gian xử lý: {time.time() - start_total_time:.4f}s")
-        
+    response_text = llm_response.content
+    logger.info(f"Trả lời của LLM đã nhận (thời gian: {time.time() - start_llm_time:.4f}s).")
+    token_accountant.record(apply_usage_metadata(usage, getattr(llm_response, "usage_metadata", None), response_text))
+    annotate(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+    
+    suggestions = get_contextual_quick_replies(user_message, detected_lang)
+    return ChatResponse(answer=response_text, lang=detected_lang, suggestions=suggestions)
+
+async def retrieve_context_for_cache(user_message: str):
+    """
+    Returns (context_str, cacheable): answers built on a failed retrieval, or on the reduced context
+    of a nearly spent token budget, must not be cached (they would outlive the budget recovery).
+    """
+    limits = token_accountant.retrieval_limits(RETRIEVAL_K)
+    full_context = limits == normal_retrieval_limits(RETRIEVAL_K)
+    try:
+        return await retrieve_context(user_message, strict=True, limits=limits), full_context
+    except Exception:
+        return RETRIEVAL_ERROR_CONTEXT, False
+
+async def generate_and_cache_answer(user_message: str, detected_lang: str, context_str: str | None = None, cacheable: bool = True) -> ChatResponse:
+    """
+    generate_answer + stores the response in the answer cache (unless retrieval failed or the
+    context was reduced). With a pre-fetched `context_str`, the caller passes `cacheable`.
+    """
+    if context_str is None:
+        context_str, cacheable = await retrieve_context_for_cache(user_message)
+    response = await generate_answer(user_message, detected_lang, context_str=context_str)
+    if cacheable:
+        await store_cached_answer(user_message, detected_lang, response)
+    return response
+
+async def stream_answer(user_message: str, detected_lang: str):
+    """
+    Streaming variant of generate_answer: yields the answer text chunk by chunk.
+    The full answer is stored in the answer cache once the stream completes.
+    """
+    context_str, cacheable = await retrieve_context_for_cache(user_message)
+    final_prompt, usage = await build_final_prompt(user_message, detected_lang, context_str=context_str)
+
+    start_llm_time = time.time()
+    logger.info("Bắt đầu gọi LLM (stream)...")
+    answer_parts = []
+    usage_metadata = None
+    try:
+        async for chunk in llm.astream(final_prompt):
+            # Cộng dồn usage_metadata của các chunk giống AIMessageChunk.__add__ của LangChain
+            if getattr(chunk, "usage_metadata", None):
+                usage_metadata = chunk.usage_metadata if usage_metadata is None else merge_usage_metadata(usage_metadata, chunk.usage_metadata)
+            if chunk.content:
+                if not answer_parts:
+                    annotate(llm_first_token_ms=round((time.time() - start_llm_time) * 1000, 1))
+                answer_parts.append(chunk.content)
+                yield chunk.content
+    finally:
+        # Ghi nhận cả khi client ngắt kết nối giữa chừng: token đã được tính phí
+        token_accountant.record(apply_usage_metadata(usage, usage_metadata, "".join(answer_parts)))
+        record_stage("llm_stream", time.time() - start_llm_time)
+        annotate(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+    logger.info(f"LLM đã stream xong câu trả lời (thời gian: {time.time() - start_llm_time:.4f}s).")
+    if cacheable:
         suggestions = get_contextual_quick_replies(user_message, detected_lang)
-        
-        return ChatResponse(answer=response_text, lang=detected_lang, suggestions=suggestions)
+        await store_cached_answer(user_message, detected_lang, ChatResponse(answer="".join(answer_parts), lang=detected_lang, suggestions=suggestions))
+
+def request_key(user_message: str, detected_lang: str):
+    # Khóa gộp yêu cầu: câu hỏi đã chuẩn hóa + ngôn ngữ
+    return (normalize_question(user_message), detected_lang)
+
+def answer_cache_key(user_message: str, detected_lang: str) -> str:
+    # Phiên bản prompt (A/B) được chọn cố định theo câu hỏi nên là một phần của khóa
+    prompt_version = prompt_registry.select(detected_lang, routing_key=user_message).version
+    return f"{detected_lang}:{prompt_version}:{normalize_question(user_message)}"
+
+async def lookup_cached_answer(user_message: str, detected_lang: str):
+    with trace_stage("answer_cache"):
+        cached_value = await response_cache.aget("answer", answer_cache_key(user_message, detected_lang))
+    if cached_value is None:
+        return None
+    return ChatResponse(**loads(cached_value))
+
+async def store_cached_answer(user_message: str, detected_lang: str, response: ChatResponse):
+    await response_cache.aset("answer", answer_cache_key(user_message, detected_lang), dumps(response.model_dump()))
+
+def lookup_answer_index(user_message: str):
+    if answer_index is None:
+        return None
+    cached_entry = answer_index.lookup(user_message)
+    if cached_entry is None:
+        return None
+    return ChatResponse(
+        answer=cached_entry["answer"],
+        lang=cached_entry["lang"],
+        suggestions=cached_entry["suggestions"],
+    )
+
+def system_not_ready_response(user_message: str) -> ChatResponse:
+    logger.critical("LLM, Embedding Model hoặc retriever (Qdrant/local index) chưa được khởi tạo. API không sẵn sàng.")
+    error_answer_vi = "Hệ thống chưa sẵn sàng. Vui lòng thử lại sau hoặc liên hệ quản trị viên."
+    error_answer_en = "System not ready. Please try again later or contact the administrator."
+    
+    try:
+        detected_lang_for_error = detect(user_message)
+    except Exception:
+        detected_lang_for_error = "en" 
+
+    return ChatResponse(
+        answer=error_answer_vi if detected_lang_for_error == "vi" else error_answer_en, 
+        lang=detected_lang_for_error, 
+        suggestions=[]
+    )
+
+def budget_exhausted_response(user_message: str, detected_lang: str) -> ChatResponse:
+    # Hết ngân sách token: chỉ phục vụ câu trả lời có sẵn (answer index / cache)
+    token_accountant.cached_only_rejections += 1
+    logger.warning("Đã hết ngân sách token: từ chối câu hỏi chưa có trong cache.")
+    answer_vi = "Hệ thống đang quá tải. Vui lòng thử lại sau hoặc chọn một trong các câu hỏi gợi ý."
+    answer_en = "The assistant is busy right now. Please try again later or pick one of the suggested questions."
+    return ChatResponse(
+        answer=answer_vi if detected_lang == "vi" else answer_en,
+        lang=detected_lang,
+        suggestions=get_contextual_quick_replies(user_message, detected_lang),
+    )
+
+def processing_error_answer(detected_lang: str) -> str:
+    error_answer_vi = "Đã xảy ra lỗi trong quá trình xử lý câu hỏi của bạn. Vui lòng thử lại sau."
+    error_answer_en = "An error occurred while processing your request. Please try again later."
+    return error_answer_vi if detected_lang == 'vi' else error_answer_en
+
+def client_key(request: Request) -> str:
+    return client_key_for(request.headers, request.client.host if request.client else None)
+
+def rate_limited_response(error: RateLimitExceeded):
+    retry_after = max(1, math.ceil(error.retry_after))
+    logger.warning(f"Từ chối yêu cầu ({error.reason}), thử lại sau {retry_after}s.")
+    return FastJSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests. Please try again later.", "reason": error.reason, "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def check_rate_limit(request: Request):
+    """
+    Charges one request to the caller's token bucket. Returns a 429 response when over the limit, else None.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    try:
+        rate_limiter.check(client_key(request))
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    return None
+
+async def run_scheduled(client: str, fn):
+    # Chờ tới lượt (FairScheduler) rồi mới chạy retrieval + LLM
+    queued_at = time.perf_counter()
+    async with pipeline_scheduler.slot(client):
+        record_stage("queue_wait", time.perf_counter() - queued_at)
+        return await fn()
+
+async def stream_scheduled(client: str, stream_factory):
+    queued_at = time.perf_counter()
+    async with pipeline_scheduler.slot(client):
+        record_stage("queue_wait", time.perf_counter() - queued_at)
+        async for chunk in stream_factory():
+            yield chunk
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN or not secrets.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+async def run_chat_batch(items, concurrency: int = BATCH_LLM_CONCURRENCY, client: str = "batch"):
+    """
+    Answers many questions at once and yields one result dict per question as soon as it finishes.
+    Answer-index hits are returned first; the rest share one batched embedding call and one
+    batched vector search, then run their LLM calls with bounded concurrency.
+    """
+    start_time = time.time()
+    pending = []
+    for item in items:
+        item_id, user_message = item.get("id"), (item.get("message") or "").strip()
+        if item.get("error") or not user_message:
+            yield {"id": item_id, "message": user_message, "error": item.get("error") or "Câu hỏi rỗng."}
+            continue
+        indexed_response = lookup_answer_index(user_message)
+        if indexed_response is not None:
+            yield {"id": item_id, "message": user_message, **indexed_response.model_dump(), "source": "answer_index"}
+            continue
+        pending.append((item_id, user_message))
+
+    if not pending:
+        return
+    if llm is None or embeddings is None or not retriever_ready():
+        for item_id, user_message in pending:
+            yield {"id": item_id, "message": user_message, **system_not_ready_response(user_message).model_dump()}
+        return
+
+    detected_langs = [detect_language(user_message) for _, user_message in pending]
+
+    start_retrieval_time = time.time()
+    k, max_context_tokens = token_accountant.retrieval_limits(RETRIEVAL_K)
+    # Context rút gọn theo ngân sách token: câu trả lời không được cache
+    full_context = (k, max_context_tokens) == normal_retrieval_limits(RETRIEVAL_K)
+    try:
+        docs_per_question = await search_documents_batch([user_message for _, user_message in pending], k=k)
+        logger.info(f"Batch: đã embed và truy vấn {len(pending)} câu hỏi trong một lô (thời gian: {time.time() - start_retrieval_time:.4f}s)")
     except Exception as e:
-        logger.error(f"Lỗi khi xử lý yêu cầu chat (gọi LLM): {e}\n{traceback.format_exc()} (thời gian: {time.time() - start_llm_time:.4f}s)")
-        error_answer_vi = "Đã xảy ra lỗi trong quá trình xử lý câu hỏi của bạn. Vui lòng thử lại sau."
-        error_answer_en = "An error occurred while processing your request. Please try again later."
-        error_answer = error_answer_vi if detected_lang == 'vi' else error_answer_en
-        
-        return ChatResponse(answer=error_answer, lang=detected_lang, suggestions=[])
\ No newline at end of file
+        # Lỗi truy vấn theo lô: từng câu hỏi sẽ tự truy vấn context riêng
+        logger.error(f"Lỗi khi truy vấn context theo lô: {e}\n{traceback.format_exc()}")
+        docs_per_question = [None] * len(pending)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer_one(index: int):
+        item_id, user_message = pending[index]
+        detected_lang = detected_langs[index]
+        docs = docs_per_question[index]
+        context_str = format_context(docs, max_tokens=max_context_tokens) if docs is not None else None
+        cached_response = await lookup_cached_answer(user_message, detected_lang)
+        if cached_response is not None:
+            return {"id": item_id, "message": user_message, **cached_response.model_dump(), "source": "cache"}
+        if token_accountant.level() == BUDGET_CACHED_ONLY:
+            token_accountant.cached_only_rejections += 1
+            return {"id": item_id, "message": user_message, "lang": detected_lang, "error": "token_budget"}
+        async with semaphore:
+            try:
+                response = await inflight_requests.do(
+                    request_key(user_message, detected_lang),
+                    lambda: run_scheduled(client, lambda: generate_and_cache_answer(user_message, detected_lang, context_str=context_str, cacheable=full_context)),
+                    retry_on=(RateLimitExceeded,),
+                )
+                return {"id": item_id, "message": user_message, **response.model_dump()}
+            except RateLimitExceeded as e:
+                return {"id": item_id, "message": user_message, "lang": detected_lang, "error": e.reason, "retry_after": math.ceil(e.retry_after)}
+            except Exception as e:
+                logger.error(f"Batch: lỗi khi trả lời '{user_message}': {e}")
+                return {"id": item_id, "message": user_message, "lang": detected_lang, "error": processing_error_answer(detected_lang)}
+
+    for next_result in asyncio.as_completed([answer_one(i) for i in range(len(pending))]):
+        yield await next_result
+    logger.info(f"Batch: hoàn tất {len(pending)} câu hỏi cần gọi LLM (tổng thời gian: {time.time() - start_time:.4f}s)")
+
+# --- API Endpoint ---
+def chat_json(response: ChatResponse) -> FastJSONResponse:
+    # Trả về Response trực tiếp để FastAPI bỏ qua bước validate response_model + jsonable_encoder:
+    # chỉ còn model_dump + orjson như đã đo trong serialization.py
+    return FastJSONResponse(response.model_dump())
+
+# ChatResponse chỉ dùng cho tài liệu OpenAPI (responses=), không dùng để validate response
+@app.post("/chat", response_class=FastJSONResponse, responses={200: {"model": ChatResponse}})
+async def chat(req: ChatRequest, request: Request):
+    start_total_time = time.time() # Bắt đầu tính tổng thời gian
+    user_message = req.message
+    if not user_message:
+        logger.warning("Nhận được câu hỏi rỗng từ frontend.")
+        return chat_json(ChatResponse(answer="Vui lòng cung cấp một câu hỏi.", lang="unknown", suggestions=[]))
+    
+    logger.info(f"Nhận được câu hỏi: {user_message}")
+    annotate(question=user_message)
+
+    # Câu hỏi gợi ý cố định: trả về ngay câu trả lời đã tạo sẵn, không cần RAG + LLM
+    indexed_response = lookup_answer_index(user_message)
+    if indexed_response is not None:
+        logger.info(f"Trả lời từ answer index (thời gian: {time.time() - start_total_time:.4f}s)")
+        return chat_json(indexed_response)
+
+    if llm is None or embeddings is None or not retriever_ready():
+        return chat_json(system_not_ready_response(user_message))
+
+    detected_lang = detect_language(user_message)
+
+    cached_response = await lookup_cached_answer(user_message, detected_lang)
+    if cached_response is not None:
+        logger.info(f"Trả lời từ cache (thời gian: {time.time() - start_total_time:.4f}s)")
+        return chat_json(cached_response)
+    if token_accountant.level() == BUDGET_CACHED_ONLY:
+        return chat_json(budget_exhausted_response(user_message, detected_lang))
+    # Chỉ tính lượt cho request thật sự cần chạy RAG + LLM (không tính answer index / cache)
+    rejected = check_rate_limit(request)
+    if rejected is not None:
+        return rejected
+
+    try:
+        # Các yêu cầu trùng câu hỏi đến cùng lúc sẽ dùng chung một lần gọi retrieval + LLM
+        client = client_key(request)
+        response = await inflight_requests.do(
+            request_key(user_message, detected_lang),
+            lambda: run_scheduled(client, lambda: generate_and_cache_answer(user_message, detected_lang)),
+            retry_on=(RateLimitExceeded,),
+        )
+        logger.info(f"Tổng thời gian xử lý: {time.time() - start_total_time:.4f}s")
+        return chat_json(response)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        logger.error(f"Lỗi khi xử lý yêu cầu chat (gọi LLM): {e}\n{traceback.format_exc()} (thời gian: {time.time() - start_total_time:.4f}s)")
+        return chat_json(ChatResponse(answer=processing_error_answer(detected_lang), lang=detected_lang, suggestions=[]))
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """
+    Streams the answer as NDJSON events: {"lang"} first, then {"delta"} chunks,
+    and finally {"done": true, "suggestions": [...]}.
+    """
+    user_message = req.message
+
+    def event(payload: dict) -> bytes:
+        return ndjson_line(payload)
+
+    async def single_response_events(response: ChatResponse):
+        yield event({"lang": response.lang})
+        yield event({"delta": response.answer})
+        yield event({"done": True, "suggestions": response.suggestions})
+
+    if not user_message:
+        logger.warning("Nhận được câu hỏi rỗng từ frontend.")
+        empty_response = ChatResponse(answer="Vui lòng cung cấp một câu hỏi.", lang="unknown", suggestions=[])
+        return StreamingResponse(single_response_events(empty_response), media_type="application/x-ndjson")
+
+    logger.info(f"Nhận được câu hỏi (stream): {user_message}")
+    annotate(question=user_message)
+
+    indexed_response = lookup_answer_index(user_message)
+    if indexed_response is not None:
+        return StreamingResponse(single_response_events(indexed_response), media_type="application/x-ndjson")
+
+    if llm is None or embeddings is None or not retriever_ready():
+        return StreamingResponse(single_response_events(system_not_ready_response(user_message)), media_type="application/x-ndjson")
+
+    detected_lang = detect_language(user_message)
+    cached_response = await lookup_cached_answer(user_message, detected_lang)
+    if cached_response is not None:
+        return StreamingResponse(single_response_events(cached_response), media_type="application/x-ndjson")
+    if token_accountant.level() == BUDGET_CACHED_ONLY:
+        return StreamingResponse(single_response_events(budget_exhausted_response(user_message, detected_lang)), media_type="application/x-ndjson")
+    rejected = check_rate_limit(request)
+    if rejected is not None:
+        return rejected
+    client = client_key(request)
+
+    async def answer_events():
+        yield event({"lang": detected_lang})
+        try:
+            async for delta in inflight_requests.stream(
+                request_key(user_message, detected_lang),
+                lambda: stream_scheduled(client, lambda: stream_answer(user_message, detected_lang)),
+                retry_on=(RateLimitExceeded,),
+            ):
+                yield event({"delta": delta})
+        except RateLimitExceeded as e:
+            # Header 200 đã được gửi: báo lỗi trong luồng NDJSON
+            yield event({"error": processing_error_answer(detected_lang), "reason": e.reason, "retry_after": math.ceil(e.retry_after)})
+            return
+        except Exception as e:
+            logger.error(f"Lỗi khi stream câu trả lời: {e}\n{traceback.format_exc()}")
+            yield event({"error": processing_error_answer(detected_lang)})
+            return
+        yield event({"done": True, "suggestions": get_contextual_quick_replies(user_message, detected_lang)})
+
+    return StreamingResponse(answer_events(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request):
+    """
+    Batch chat: the request body is JSONL (one {"id", "message"} per line); the response streams
+    one JSON result per line as each question finishes.
+    """
+    body = (await request.body()).decode("utf-8")
+    items = parse_jsonl_questions(body.splitlines())
+    logger.info(f"Nhận được batch {len(items)} câu hỏi.")
+    # Mỗi request batch tính một lượt (trừ khi mọi câu hỏi đều có trong answer index); các câu hỏi bên trong
+    # đi qua FairScheduler dưới cùng client key, nên một batch lớn không chiếm hết slot của người dùng tương tác
+    needs_pipeline = any(
+        not item.get("error") and (item.get("message") or "").strip() and lookup_answer_index(item["message"].strip()) is None
+        for item in items
+    )
+    if needs_pipeline:
+        rejected = check_rate_limit(request)
+        if rejected is not None:
+            return rejected
+    client = client_key(request)
+
+    async def result_lines():
+        async for result in run_chat_batch(items, client=client):
+            yield ndjson_line(result)
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@app.get("/chat/suggestions", response_class=FastJSONResponse)
+async def chat_suggestions(lang: str = "vi"):
+    """
+    Suggestions shown before the first question, so the UI does not keep its own copy.
+    """
+    return {"suggestions": get_initial_suggestions(lang)}
+
+@app.get("/admin/rate-limits", dependencies=[Depends(require_admin)], response_class=FastJSONResponse)
+async def admin_rate_limits():
+    """
+    Rate limiter, fair scheduler and request coalescing metrics.
+    """
+    return {
+        "rate_limit_enabled": RATE_LIMIT_ENABLED,
+        "rate_limiter": rate_limiter.stats(),
+        "scheduler": pipeline_scheduler.stats(),
+        "coalescing": inflight_requests.stats(),
+    }
+
+@app.get("/admin/tokens", dependencies=[Depends(require_admin)], response_class=FastJSONResponse)
+async def admin_tokens():
+    """
+    LLM token usage (instruction / context / question / output) and estimated cost per time window,
+    plus the current budget level.
+    """
+    return token_accountant.stats()
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)], response_class=FastJSONResponse)
+async def admin_slow_requests(limit: int = 50):
+    """
+    Captured slow (or X-Profile) requests: stage timings, prompt size and retrieved doc ids.
+    """
+    return slow_requests.dump(limit)
+
+@app.get("/admin/slow-requests/folded", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def admin_slow_requests_folded():
+    """
+    Captured requests as folded stacks (self time in microseconds), e.g. for flamegraph.pl or speedscope.
+    """
+    return slow_requests.folded()
+
+@app.get("/admin/profile/stacks", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def admin_profile_stacks(reset: bool = False):
+    """
+    Folded Python stacks collected by the sampling thread (PROFILE_SAMPLER_ENABLED).
+    """
+    if stack_sampler is None:
+        raise HTTPException(status_code=404, detail="Sampling profiler is disabled (PROFILE_SAMPLER_ENABLED).")
+    return stack_sampler.folded(reset=reset)
+
+@app.get("/admin/dual-index", dependencies=[Depends(require_admin)], response_class=FastJSONResponse)
+async def admin_dual_index():
+    """
+    Primary vs secondary index agreement (top-k overlap, top-1 agreement, latency) during an embedding model migration.
+    """
+    return {
+        "mode": DUAL_INDEX_MODE,
+        "secondary_ready": secondary_ready(),
+        "primary": {"model": EMBEDDING_MODEL_NAME, "collection": qdrant_collection_target if RETRIEVER_MODE == "qdrant" else None},
+        "secondary": {"model": SECONDARY_EMBEDDING_MODEL_NAME or None, "collection": secondary_collection_target if RETRIEVER_MODE == "qdrant" else None},
+        "comparison": index_comparison.stats(),
+    }
+
+@app.get("/admin/cache", dependencies=[Depends(require_admin)], response_class=FastJSONResponse)
+async def admin_cache():
+    """
+    Hit/miss counters and on-disk size per namespace of the embedding / retrieval / answer cache.
+    """
+    return await asyncio.to_thread(response_cache.stats)
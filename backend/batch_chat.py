@@ -0,0 +1,90 @@
+# --- Batch chat: nhiều câu hỏi một lần (JSONL vào, JSONL ra) ---
+# Mỗi dòng đầu vào là một object JSON {"id": ..., "message": "..."} (id tùy chọn) hoặc một chuỗi JSON.
+# Kết quả được ghi ra ngay khi từng câu hỏi xong (không theo thứ tự đầu vào), mỗi dòng một object JSON.
+#
+# Cách dùng:
+#     python backend/batch_chat.py questions.jsonl -o answers.jsonl                    # chạy trực tiếp trong tiến trình
+#     python backend/batch_chat.py questions.jsonl --url http://localhost:8000         # gửi tới POST /chat/batch
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+
+def parse_jsonl_questions(lines):
+    """
+    Parses JSONL lines into question items {"id", "message"}. Blank lines are skipped;
+    lines that cannot be parsed become items with an "error" field.
+    """
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            items.append({"id": line_number, "message": "", "error": f"Dòng {line_number} không phải JSON hợp lệ: {e}"})
+            continue
+        if isinstance(value, str):
+            items.append({"id": line_number, "message": value})
+        elif isinstance(value, dict):
+            items.append({"id": value.get("id", line_number), "message": value.get("message") or value.get("question") or ""})
+        else:
+            items.append({"id": line_number, "message": "", "error": f"Dòng {line_number} phải là object hoặc chuỗi JSON."})
+    return items
+
+
+async def run_in_process(items, output):
+    # Chạy trực tiếp pipeline của backend, không cần server HTTP (cùng trình tự khởi động với server)
+    import app as backend_app
+    await backend_app.initialize()
+    async for result in backend_app.run_chat_batch(items):
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+
+def run_over_http(raw_body, url, output):
+    import requests
+    with requests.post(
+        f"{url.rstrip('/')}/chat/batch",
+        data=raw_body.encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+        stream=True,
+        timeout=None,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                output.write(line + "\n")
+                output.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trả lời hàng loạt câu hỏi (JSONL vào, JSONL ra)")
+    parser.add_argument("input", help="File JSONL câu hỏi ('-' để đọc từ stdin)")
+    parser.add_argument("-o", "--output", default="-", help="File JSONL kết quả (mặc định: stdout)")
+    parser.add_argument("--url", default=None, help="URL backend đang chạy; bỏ trống để chạy trong tiến trình")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.input == "-":
+        raw_input = sys.stdin.read()
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            raw_input = f.read()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start_time = time.time()
+    try:
+        if args.url:
+            run_over_http(raw_input, args.url, output)
+        else:
+            asyncio.run(run_in_process(parse_jsonl_questions(raw_input.splitlines()), output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Hoàn tất batch trong {time.time() - start_time:.2f}s.", file=sys.stderr)
@@ -0,0 +1,129 @@
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# brotli là tùy chọn: nếu chưa cài thì chỉ dùng gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Các loại nội dung đã nén sẵn hoặc SSE: không nén lại
+EXCLUDED_CONTENT_TYPES = ("image/", "audio/", "video/", "font/woff", "application/zip", "application/gzip", "text/event-stream")
+
+
+def parse_accept_encoding(header_value):
+    """
+    Returns the set of encodings the client accepts (q > 0).
+    """
+    accepted = set()
+    for part in header_value.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(header_value):
+    accepted = parse_accept_encoding(header_value)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, final):
+        # Với response stream, flush sau mỗi chunk để client nhận ngay từng dòng NDJSON thay vì đợi bộ đệm đầy
+        if self.encoding == "br":
+            output = self._compressor.process(data)
+            return output + (self._compressor.finish() if final else self._compressor.flush())
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with Brotli (when the `brotli` package is installed and the
+    client accepts it) or gzip. Bodies smaller than `minimum_size` are sent as-is; streaming bodies
+    (NDJSON) are compressed chunk by chunk with a flush after each chunk so deltas are not delayed.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    # Giữ lại header cho tới khi biết kích thước body đầu tiên
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    passthrough = True
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                body = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+            else:
+                body = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
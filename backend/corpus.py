@@ -0,0 +1,30 @@
+import os
+import json
+import hashlib
+
+# Đường dẫn tuyệt đối tới dữ liệu, tính từ vị trí file này để không phụ thuộc thư mục đang chạy
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+DATA_CHUNKS_PATH = os.path.join(DATA_DIR, "json_chunks", "apec_all_chunks.json")
+
+
+def corpus_hash(chunks_path=DATA_CHUNKS_PATH):
+    """
+    Returns a short SHA-256 fingerprint of the chunk corpus file, or None if the file is missing.
+    Any derived artifact (answer index, caches, ...) built from an older corpus has a different hash.
+    """
+    if not os.path.exists(chunks_path):
+        return None
+    digest = hashlib.sha256()
+    with open(chunks_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def load_chunks(chunks_path=DATA_CHUNKS_PATH):
+    """
+    Loads the chunk list (dicts with id, topic, sub_topic, content, source_file, ...) from the corpus JSON.
+    """
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        return json.load(f)
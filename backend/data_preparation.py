@@ -6,10 +6,53 @@ import json
 import uuid
 import glob
 
-# Thư viện LangChain cho preprocessing
-from langchain_community.document_loaders import UnstructuredHTMLLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
+from structured_chunker import chunk_html_file, chunk_id, DEFAULT_MAX_CHUNK_CHARS
+from dedup import deduplicate_chunks, print_report, DEFAULT_THRESHOLD
+from corpus import DATA_DIR, DATA_CHUNKS_PATH
+
+# Thư mục HTML đã crawl (đường dẫn tuyệt đối, không phụ thuộc thư mục đang chạy)
+CRAWLED_HTML_DIR = os.path.join(DATA_DIR, "crawled_raw_html")
+
+# Thư viện LangChain cho preprocessing (chiến lược "recursive") được import khi cần trong build_chunks
+
+# --- Các trang cần crawl: tên file HTML -> URL gốc (dùng để gắn source_url cho từng chunk) ---
+SOURCE_URLS = {
+    "Information_of_Apec": "https://apec2025.kr/?menuno=89",
+    "Introduction_About_Apec_Korea_2025": "https://apec2025.kr/?menuno=91",
+    "Emblem_and_Theme": "https://apec2025.kr/?menuno=92",
+    "Meetings": "https://apec2025.kr/?menuno=93",
+    "Side_Events": "https://apec2025.kr/?menuno=94",
+    "Documents_HRDDM": "https://apec2025.kr/?menuno=148",
+    "Documents_AEMM": "http://apec2025.kr/?menuno=149", 
+    "Documents_MRT": "https://apec2025.kr/?menuno=150",
+    "Notices": "https://apec2025.kr/?menuno=15",
+    "Press_Release": "https://apec2025.kr/?menuno=16", 
+    "Korea_in_Brief": "https://apec2025.kr/?menuno=18",
+    "Practical_Information": "https://apec2025.kr/?menuno=22",
+    "About_Gyeongju": "https://apec2025.kr/?menuno=102",
+    "Transportation_of_Gyeongju": "https://apec2025.kr/?menuno=137",
+    "Heritage_Gyeongju": "https://apec2025.kr/?menuno=108",
+    "Attraction_of_Gyeongju": "https://apec2025.kr/?menuno=138",
+    "About_Jeju": "https://apec2025.kr/?menuno=103",
+    "Transportation_Jeju": "https://apec2025.kr/?menuno=141",
+    "Nature_Culture_Jeju": "https://apec2025.kr/?menuno=114",
+    "Themed_Travel_Jeju": "https://apec2025.kr/?menuno=115",
+    "About_Incheon": "https://apec2025.kr/?menuno=104",
+    "Attractions_Incheon": "https://apec2025.kr/?menuno=117",
+    "Local_Eateries_Incheon": "https://apec2025.kr/?menuno=118",
+    "About_Busan": "https://apec2025.kr/?menuno=106",
+    "About_Seoul": "https://apec2025.kr/?menuno=24",
+}
+
+CHUNK_STRATEGIES = ("structured", "recursive")
+
+
+def source_url_for_file(file_name):
+    """
+    Maps a crawled file name (e.g. 'Meetings.html', 'Press_Release_combined.html') back to its page URL.
+    """
+    name = file_name.replace(".html", "").replace("_combined", "")
+    return SOURCE_URLS.get(name)
 
 # --- Hàm hỗ trợ crawl: Lấy số trang tối đa ---
 def get_max_page_number(soup):
@@ -70,158 +113,213 @@ def extract_main_content_html(html_file_path):
         return html_content # Trả về toàn bộ HTML nếu không tìm thấy khu vực chính
 
 # --- Chức năng chính: Crawl và lưu HTML ---
-def crawl_and_save_html(urls_to_crawl, output_dir="data/crawled_raw_html"):
+def crawled_file_name(name):
+    # Press Release (nhiều trang) được gộp vào một file
+    return f"{name}_combined.html" if name == "Press_Release" else f"{name}.html"
+
+def crawl_page(name, base_url, output_dir=CRAWLED_HTML_DIR, overwrite=False):
     """
-    Crawls HTML content from a list of URLs and saves each to a separate .html file.
-    Includes special handling for paginated pages like 'Press Release' to combine them.
+    Crawls one source page (all pages of 'Press Release', combined into one file) into `output_dir`.
+    Returns the saved file path, or None if nothing could be downloaded.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    print(f"Thư mục '{output_dir}' đã sẵn sàng để lưu trữ HTML.")
-
-    for name, base_url in urls_to_crawl.items():
-        print(f"\n--- Đang xử lý: {name} từ {base_url} ---")
-        
-        file_path_to_save = os.path.join(output_dir, f"{name}.html")
-        if name == "Press_Release":
-            file_path_to_save = os.path.join(output_dir, f"{name}_combined.html")
-
-        if os.path.exists(file_path_to_save):
-            print(f"  File '{file_path_to_save}' đã tồn tại. Bỏ qua crawl cho {name}.")
-            continue
-
-        if name == "Press_Release":
-            with open(file_path_to_save, "w", encoding="utf-8") as combined_file:
-                combined_file.write("<!DOCTYPE html>\n<html><head><meta charset='utf-8'></head><body>\n")
-                combined_file.write("<main>\n") 
-                
-                current_page = 1
-                max_page_found = 1 
-
-                while current_page <= max_page_found:
-                    url = f"{base_url}&pageNum={current_page}" if current_page > 1 else base_url
-                    print(f"  > Đang tải trang {current_page} của {name} từ {url}...")
-                    try:
-                        response = requests.get(url, timeout=20)
-                        response.raise_for_status()
-                        html_content = response.text
-                        soup = BeautifulSoup(html_content, 'html.parser')
-
-                        new_max_page = get_max_page_number(soup)
-                        if new_max_page > max_page_found:
-                            max_page_found = new_max_page
-                            print(f"  > Cập nhật tổng số trang cho {name} thành: {max_page_found}")
-
-                        article_list_items = soup.select('.board_list1 .event > li')
-                        
-                        if article_list_items:
-                            for item in article_list_items:
-                                combined_file.write(f"<article data-source-url='{url}' data-article-id='{str(uuid.uuid4())}'>\n")
-                                combined_file.write(str(item) + "\n")
-                                combined_file.write("</article>\n")
-                            print(f"  + Đã thêm {len(article_list_items)} bài viết từ trang {current_page} (đã bọc <article>) vào file tổng.")
-                        else:
-                            print(f"  ! Không tìm thấy bài viết nào trên trang {current_page}. Dừng crawl {name}.")
-                            break
-
-                        current_page += 1
-
-                        if current_page > max_page_found:
-                            break
-
-                    except requests.exceptions.RequestException as e:
-                        print(f"  ! Lỗi khi tải trang {url}: {e}. Dừng crawl {name}.")
+    print(f"\n--- Đang xử lý: {name} từ {base_url} ---")
+    file_path_to_save = os.path.join(output_dir, crawled_file_name(name))
+
+    if os.path.exists(file_path_to_save) and not overwrite:
+        print(f"  File '{file_path_to_save}' đã tồn tại. Bỏ qua crawl cho {name}.")
+        return file_path_to_save
+
+    if name == "Press_Release":
+        articles_saved, failed = 0, False
+        with open(file_path_to_save, "w", encoding="utf-8") as combined_file:
+            combined_file.write("<!DOCTYPE html>\n<html><head><meta charset='utf-8'></head><body>\n")
+            combined_file.write("<main>\n") 
+            
+            current_page = 1
+            max_page_found = 1 
+
+            while current_page <= max_page_found:
+                url = f"{base_url}&pageNum={current_page}" if current_page > 1 else base_url
+                print(f"  > Đang tải trang {current_page} của {name} từ {url}...")
+                try:
+                    response = requests.get(url, timeout=20)
+                    response.raise_for_status()
+                    html_content = response.text
+                    soup = BeautifulSoup(html_content, 'html.parser')
+
+                    new_max_page = get_max_page_number(soup)
+                    if new_max_page > max_page_found:
+                        max_page_found = new_max_page
+                        print(f"  > Cập nhật tổng số trang cho {name} thành: {max_page_found}")
+
+                    article_list_items = soup.select('.board_list1 .event > li')
+                    
+                    if article_list_items:
+                        for item in article_list_items:
+                            # Id cố định theo nội dung bài viết: crawl lại khi trang không đổi cho ra cùng một file
+                            article_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{base_url}#{item}")
+                            combined_file.write(f"<article data-source-url='{url}' data-article-id='{article_id}'>\n")
+                            combined_file.write(str(item) + "\n")
+                            combined_file.write("</article>\n")
+                        articles_saved += len(article_list_items)
+                        print(f"  + Đã thêm {len(article_list_items)} bài viết từ trang {current_page} (đã bọc <article>) vào file tổng.")
+                    else:
+                        print(f"  ! Không tìm thấy bài viết nào trên trang {current_page}. Dừng crawl {name}.")
                         break
-                    except Exception as e:
-                        print(f"  ! Lỗi xử lý trang {url}: {e}. Dừng crawl {name}.")
+
+                    current_page += 1
+
+                    if current_page > max_page_found:
                         break
 
-                combined_file.write("</main>\n")
-                combined_file.write("</body></html>\n")
-                print(f"✅ Đã lưu tất cả nội dung Press Release vào: {file_path_to_save}")
+                except requests.exceptions.RequestException as e:
+                    print(f"  ! Lỗi khi tải trang {url}: {e}. Dừng crawl {name}.")
+                    failed = True
+                    break
+                except Exception as e:
+                    print(f"  ! Lỗi xử lý trang {url}: {e}. Dừng crawl {name}.")
+                    failed = True
+                    break
+
+            combined_file.write("</main>\n")
+            combined_file.write("</body></html>\n")
+            print(f"✅ Đã lưu tất cả nội dung Press Release vào: {file_path_to_save}")
+        # File thiếu một phần (lỗi giữa chừng) không được coi là bản crawl hợp lệ
+        return file_path_to_save if articles_saved and not failed else None
+
+    else: # Xử lý các trang không phân trang (HTML đơn)
+        try:
+            response = requests.get(base_url, timeout=20)
+            response.raise_for_status()
+            html_content = response.text
 
-        else: # Xử lý các trang không phân trang (HTML đơn)
-            try:
-                response = requests.get(base_url, timeout=20)
-                response.raise_for_status()
-                html_content = response.text
+            with open(file_path_to_save, "w", encoding="utf-8") as f:
+                f.write(html_content)
+            print(f"  Đã lưu: {file_path_to_save}")
+            return file_path_to_save
 
-                with open(file_path_to_save, "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                print(f"  Đã lưu: {file_path_to_save}")
+        except requests.exceptions.RequestException as e:
+            print(f"  ! Lỗi khi tải trang {base_url}: {e}")
+        except Exception as e:
+            print(f"  ! Lỗi xử lý trang {base_url}: {e}")
+        return None
+
+
+def crawl_and_save_html(urls_to_crawl, output_dir=CRAWLED_HTML_DIR):
+    """
+    Crawls HTML content from a list of URLs and saves each to a separate .html file.
+    Includes special handling for paginated pages like 'Press Release' to combine them.
+    Pages already saved in `output_dir` are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Thư mục '{output_dir}' đã sẵn sàng để lưu trữ HTML.")
 
-            except requests.exceptions.RequestException as e:
-                print(f"  ! Lỗi khi tải trang {base_url}: {e}")
-            except Exception as e:
-                print(f"  ! Lỗi xử lý trang {base_url}: {e}")
+    for name, base_url in urls_to_crawl.items():
+        crawl_page(name, base_url, output_dir)
 
     print("\n--- ✅ Hoàn tất quá trình crawl và lưu HTML ---\n")
 
 # --- Chức năng chính: Tiền xử lý HTML thành chunks JSON (GIỮ NGUYÊN TỪ CRAWLER.IPYNB) ---
-def process_html_files_to_chunks_smartly(html_dir="data/crawled_raw_html", output_json_path="data/json_chunks/apec_all_chunks.json"):
-    all_chunks_data = []
-    
-    output_data_dir = os.path.dirname(output_json_path)
-    os.makedirs(output_data_dir, exist_ok=True)
+def chunk_html_page(html_file, chunk_size=DEFAULT_MAX_CHUNK_CHARS, chunk_overlap=200, strategy="structured"):
+    """
+    Splits one crawled HTML file into chunk dicts (see `build_chunks` for the strategies).
+    """
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Chiến lược chunk không hợp lệ: '{strategy}'. Các giá trị hợp lệ: {', '.join(CHUNK_STRATEGIES)}")
+    file_name = os.path.basename(html_file)
+    if strategy == "structured":
+        return chunk_html_file(html_file, source_url=source_url_for_file(file_name), max_chunk_chars=chunk_size)
+
+    from langchain_community.document_loaders import UnstructuredHTMLLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
 
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
         add_start_index=True
     )
 
+    # Bước mới: Chỉ lấy phần HTML của khu vực nội dung chính
+    main_content_html = extract_main_content_html(html_file)
+    if not main_content_html:
+        # Dòng này sẽ chỉ xuất hiện nếu extract_main_content_html trả về None
+        # Trong phiên bản của crawler.ipynb, extract_main_content_html KHÔNG bao giờ trả về None
+        # nếu file tồn tại, nên dòng này hiếm khi xuất hiện
+        print(f"Không tìm thấy nội dung chính để xử lý từ file: {file_name}. Bỏ qua file này.")
+        return []
+
+    # Tạo một file tạm thời chỉ chứa nội dung chính để UnstructuredHTMLLoader đọc
+    temp_html_path = f"{html_file}.temp.html"
+    with open(temp_html_path, "w", encoding="utf-8") as temp_f:
+        temp_f.write(main_content_html)
+
+    loader = UnstructuredHTMLLoader(temp_html_path)
+    documents = loader.load() 
+    
+    # Xóa file tạm sau khi đã load
+    os.remove(temp_html_path)
+
+    chunks_data = []
+    for ordinal, chunk in enumerate(text_splitter.split_documents(documents)):
+        topic_from_filename = file_name.replace(".html", "").replace("_page_", " Page ").replace("_", " ")
+        
+        # Cố gắng lấy topic/sub_topic từ metadata của UnstructuredHTMLLoader nếu có
+        cleaned_content = ' '.join(chunk.page_content.split()) 
+        
+        chunks_data.append({
+            "id": chunk_id(file_name, source_url_for_file(file_name), "recursive", ordinal),
+            "topic": chunk.metadata.get("category", topic_from_filename), 
+            "sub_topic": chunk.metadata.get("title", chunk.metadata.get("header", "N/A")), 
+            "content": cleaned_content, 
+            "source_file": file_name,
+            "source_url": source_url_for_file(file_name) or "N/A",
+        })
+    return chunks_data
+
+def build_chunks(html_dir=CRAWLED_HTML_DIR, chunk_size=DEFAULT_MAX_CHUNK_CHARS, chunk_overlap=200, strategy="structured"):
+    """
+    Splits every crawled HTML file in `html_dir` into chunk dicts and returns them
+    (None if there is no HTML file). Nothing is written to disk.
+    strategy="structured" splits along headings / press-release articles / tables (see structured_chunker,
+    `chunk_size` is the maximum chunk length); strategy="recursive" flattens each page and applies the
+    character splitter with `chunk_size` / `chunk_overlap`.
+    """
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Chiến lược chunk không hợp lệ: '{strategy}'. Các giá trị hợp lệ: {', '.join(CHUNK_STRATEGIES)}")
+
+    all_chunks_data = []
+
     html_files = glob.glob(os.path.join(html_dir, "*.html"))
     if not html_files:
         print(f"Không tìm thấy file HTML nào trong thư mục '{html_dir}'. Vui lòng crawl dữ liệu trước.")
-        return
+        return None
 
-    print(f"Tìm thấy {len(html_files)} file HTML để xử lý.")
+    print(f"Tìm thấy {len(html_files)} file HTML để xử lý (chiến lược: {strategy}).")
 
-    for html_file in html_files:
+    for html_file in sorted(html_files):
         file_name = os.path.basename(html_file)
-        print(f"Đang xử lý file: {file_name}")
-
         try:
-            # Bước mới: Chỉ lấy phần HTML của khu vực nội dung chính
-            main_content_html = extract_main_content_html(html_file)
-            
-            if main_content_html:
-                # Tạo một file tạm thời chỉ chứa nội dung chính để UnstructuredHTMLLoader đọc
-                temp_html_path = f"{html_file}.temp.html"
-                with open(temp_html_path, "w", encoding="utf-8") as temp_f:
-                    temp_f.write(main_content_html)
-
-                loader = UnstructuredHTMLLoader(temp_html_path)
-                documents = loader.load() 
-                
-                # Xóa file tạm sau khi đã load
-                os.remove(temp_html_path)
-
-                chunks = text_splitter.split_documents(documents)
-
-                for chunk in chunks:
-                    topic_from_filename = file_name.replace(".html", "").replace("_page_", " Page ").replace("_", " ")
-                    
-                    # Cố gắng lấy topic/sub_topic từ metadata của UnstructuredHTMLLoader nếu có
-                    cleaned_content = ' '.join(chunk.page_content.split()) 
-                    
-                    chunk_data = {
-                        "id": str(uuid.uuid4()),
-                        "topic": chunk.metadata.get("category", topic_from_filename), 
-                        "sub_topic": chunk.metadata.get("title", chunk.metadata.get("header", "N/A")), 
-                        "content": cleaned_content, 
-                        "source_file": file_name,
-                        # "source_url": "URL_GOC_CUA_TRANG_NAY" # Bạn cần một cách để ánh xạ filename về URL gốc
-                    }
-                    all_chunks_data.append(chunk_data)
-            else:
-                # Dòng này sẽ chỉ xuất hiện nếu extract_main_content_html trả về None
-                # Trong phiên bản của crawler.ipynb, extract_main_content_html KHÔNG bao giờ trả về None
-                # nếu file tồn tại, nên dòng này hiếm khi xuất hiện
-                print(f"Không tìm thấy nội dung chính để xử lý từ file: {file_name}. Bỏ qua file này.")
-
+            chunks = chunk_html_page(html_file, chunk_size=chunk_size, chunk_overlap=chunk_overlap, strategy=strategy)
+            print(f"Đang xử lý file: {file_name} -> {len(chunks)} chunks")
+            all_chunks_data.extend(chunks)
         except Exception as e:
             print(f"Lỗi khi xử lý file '{html_file}': {e}")
+    return all_chunks_data
+
+def process_html_files_to_chunks_smartly(html_dir=CRAWLED_HTML_DIR, output_json_path=DATA_CHUNKS_PATH, chunk_size=DEFAULT_MAX_CHUNK_CHARS, chunk_overlap=200, strategy="structured", dedup_threshold=DEFAULT_THRESHOLD):
+    output_data_dir = os.path.dirname(output_json_path)
+    os.makedirs(output_data_dir, exist_ok=True)
+
+    all_chunks_data = build_chunks(html_dir, chunk_size=chunk_size, chunk_overlap=chunk_overlap, strategy=strategy)
+    if all_chunks_data is None:
+        return
+
+    # Gộp các chunk gần trùng lặp (MinHash/LSH) trước khi lưu, để không embed / lưu nhiều bản của cùng một đoạn
+    if dedup_threshold:
+        all_chunks_data, dedup_report = deduplicate_chunks(all_chunks_data, threshold=dedup_threshold)
+        print_report(dedup_report)
+    html_files = glob.glob(os.path.join(html_dir, "*.html"))
             
     with open(output_json_path, 'w', encoding='utf-8') as f:
         json.dump(all_chunks_data, f, ensure_ascii=False, indent=4)
@@ -236,47 +334,25 @@ def process_html_files_to_chunks_smartly(html_dir="data/crawled_raw_html", outpu
 
 # --- Khối main để chạy các chức năng ---
 if __name__ == "__main__":
-    # 1. Định nghĩa các URL để crawl
-    urls_and_names = {
-        "Information_of_Apec": "https://apec2025.kr/?menuno=89",
-        "Introduction_About_Apec_Korea_2025": "https://apec2025.kr/?menuno=91",
-        "Emblem_and_Theme": "https://apec2025.kr/?menuno=92",
-        "Meetings": "https://apec2025.kr/?menuno=93",
-        "Side_Events": "https://apec2025.kr/?menuno=94",
-        "Documents_HRDDM": "https://apec2025.kr/?menuno=148",
-        "Documents_AEMM": "http://apec2025.kr/?menuno=149", 
-        "Documents_MRT": "https://apec2025.kr/?menuno=150",
-        "Notices": "https://apec2025.kr/?menuno=15",
-        "Press_Release": "https://apec2025.kr/?menuno=16", 
-        "Korea_in_Brief": "https://apec2025.kr/?menuno=18",
-        "Practical_Information": "https://apec2025.kr/?menuno=22",
-        "About_Gyeongju": "https://apec2025.kr/?menuno=102",
-        "Transportation_of_Gyeongju": "https://apec2025.kr/?menuno=137",
-        "Heritage_Gyeongju": "https://apec2025.kr/?menuno=108",
-        "Attraction_of_Gyeongju": "https://apec2025.kr/?menuno=138",
-        "About_Jeju": "https://apec2025.kr/?menuno=103",
-        "Transportation_Jeju": "https://apec2025.kr/?menuno=141",
-        "Nature_Culture_Jeju": "https://apec2025.kr/?menuno=114",
-        "Themed_Travel_Jeju": "https://apec2025.kr/?menuno=115",
-        "About_Incheon": "https://apec2025.kr/?menuno=104",
-        "Attractions_Incheon": "https://apec2025.kr/?menuno=117",
-        "Local_Eateries_Incheon": "https://apec2025.kr/?menuno=118",
-        "About_Busan": "https://apec2025.kr/?menuno=106",
-        "About_Seoul": "https://apec2025.kr/?menuno=24",
-    }
+    # 1. Các URL để crawl: SOURCE_URLS (đầu file)
     
-    # 2. Định nghĩa các đường dẫn input/output
-    # Lưu ý: crawler.ipynb mặc định lưu vào "data/crawled_raw_html"
-    # và "data/json_chunks/apec_all_chunks.json"
-    html_raw_output_dir = "backend/data/crawled_raw_html" 
-    json_chunks_output_path = "backend/data/json_chunks/apec_all_chunks.json"
+    # 2. Định nghĩa các đường dẫn input/output (backend/data/..., tính từ vị trí file nên chạy được từ thư mục bất kỳ)
+    # Để crawl lại định kỳ và chỉ xử lý phần thay đổi, dùng refresh_pipeline.py
+    html_raw_output_dir = CRAWLED_HTML_DIR
+    json_chunks_output_path = DATA_CHUNKS_PATH
 
     # 3. Chạy quá trình crawl
     print("--- BẮT ĐẦU QUÁ TRÌNH CRAWL HTML ---")
-    crawl_and_save_html(urls_and_names, output_dir=html_raw_output_dir)
+    crawl_and_save_html(SOURCE_URLS, output_dir=html_raw_output_dir)
     print("--- HOÀN TẤT QUÁ TRÌNH CRAWL HTML ---\n")
 
     # 4. Chạy quá trình tiền xử lý HTML thành chunks JSON
     print("--- BẮT ĐẦU QUÁ TRÌNH TIỀN XỬ LÝ HTML THÀNH CHUNKS JSON ---")
-    process_html_files_to_chunks_smartly(html_dir=html_raw_output_dir, output_json_path=json_chunks_output_path)
+    # CHUNK_STRATEGY="recursive" để quay lại cách cắt theo số ký tự cũ
+    process_html_files_to_chunks_smartly(
+        html_dir=html_raw_output_dir,
+        output_json_path=json_chunks_output_path,
+        strategy=os.getenv("CHUNK_STRATEGY", "structured"),
+        dedup_threshold=float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD)),  # DEDUP_THRESHOLD=0 để tắt
+    )
     print("--- HOÀN TẤT QUÁ TRÌNH TIỀN XỬ LÝ HTML THÀNH CHUNKS JSON ---")
\ No newline at end of file
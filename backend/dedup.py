@@ -0,0 +1,209 @@
+# --- Phát hiện và gộp chunk gần trùng lặp (MinHash + LSH) ---
+# Các trang crawl lặp lại nhiều đoạn văn (giới thiệu thành phố, thông cáo báo chí chồng lấn...). Mỗi chunk
+# được biểu diễn bằng chữ ký MinHash trên tập shingle (n-gram từ); LSH chia chữ ký thành các band để chỉ
+# so sánh các cặp có khả năng trùng. Các cặp có độ tương đồng Jaccard ước tính >= ngưỡng được gom cụm
+# (union-find); mỗi cụm giữ một chunk chuẩn (dài nhất) và ghi lại nguồn của các chunk bị gộp (merged_sources).
+# Cụm nối theo chuỗi (A≈B, B≈C) có thể chứa chunk khác xa chunk chuẩn: chunk đó được giữ lại, không bị gộp.
+#
+# Cách dùng (chạy trên file chunk JSON đã tạo):
+#     python backend/dedup.py                                    # in báo cáo, không ghi file
+#     python backend/dedup.py --threshold 0.8 --write            # ghi đè file chunk đã khử trùng lặp
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE_SIZE = 5
+
+# Số nguyên tố Mersenne 2^61 - 1 cho họ hàm băm (a * x + b) mod p
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _shingles(text, size):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles, vectorized with numpy (one permutation per row).
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+        generator = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = generator.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        shingles = _shingles(text, self.shingle_size)
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+        # (a * h + b) mod p, rút gọn về 32 bit; phép nhân uint64 tràn số có chủ đích như bản MinHash chuẩn
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & np.uint64(_MAX_HASH)
+        return permuted.min(axis=0)
+
+
+def estimated_jaccard(signature_a, signature_b):
+    return float(np.mean(signature_a == signature_b))
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def minhash_signatures(chunks, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE):
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+    return [hasher.signature(chunk.get("content", "")) for chunk in chunks]
+
+
+def find_duplicate_clusters(chunks, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS, shingle_size=DEFAULT_SHINGLE_SIZE, signatures=None):
+    """
+    Returns the clusters (lists of chunk indices, size >= 2) of near-duplicate chunks. Clusters are
+    single-linkage: members are connected through pairs above `threshold`, not necessarily to each other.
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) phải chia hết cho số band ({bands}).")
+    rows = num_perm // bands
+    if signatures is None:
+        signatures = minhash_signatures(chunks, num_perm=num_perm, shingle_size=shingle_size)
+
+    # LSH: hai chunk là ứng viên nếu trùng toàn bộ một band của chữ ký
+    candidates = set()
+    for band in range(bands):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for position, i in enumerate(members):
+                for j in members[position + 1:]:
+                    candidates.add((i, j))
+
+    union_find = _UnionFind(len(chunks))
+    for i, j in candidates:
+        if estimated_jaccard(signatures[i], signatures[j]) >= threshold:
+            union_find.union(i, j)
+
+    clusters = {}
+    for i in range(len(chunks)):
+        clusters.setdefault(union_find.find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def _source_entry(chunk):
+    return {
+        "id": chunk.get("id"),
+        "source_file": chunk.get("source_file"),
+        "source_url": chunk.get("source_url", "N/A"),
+        "sub_topic": chunk.get("sub_topic"),
+    }
+
+
+def deduplicate_chunks(chunks, threshold=DEFAULT_THRESHOLD, **lsh_options):
+    """
+    Removes near-duplicate chunks. Each cluster keeps its longest chunk (first one on ties), which gets a
+    `merged_sources` list describing the dropped copies; members below `threshold` against that chunk
+    are kept. The input dicts are not modified. Returns (kept_chunks, report).
+    """
+    signatures = minhash_signatures(
+        chunks, num_perm=lsh_options.get("num_perm", DEFAULT_NUM_PERM), shingle_size=lsh_options.get("shingle_size", DEFAULT_SHINGLE_SIZE)
+    )
+    clusters = find_duplicate_clusters(chunks, threshold=threshold, signatures=signatures, **lsh_options)
+    dropped = set()
+    merged = {}
+    cluster_reports = []
+    for members in clusters:
+        canonical_index = max(members, key=lambda i: (len(chunks[i].get("content", "")), -i))
+        duplicates = [
+            i for i in members
+            if i != canonical_index and estimated_jaccard(signatures[i], signatures[canonical_index]) >= threshold
+        ]
+        if not duplicates:
+            continue
+        canonical = dict(chunks[canonical_index])
+        canonical["merged_sources"] = canonical.get("merged_sources", []) + [_source_entry(chunks[i]) for i in duplicates]
+        merged[canonical_index] = canonical
+        dropped.update(duplicates)
+        cluster_reports.append({
+            "canonical": _source_entry(canonical),
+            "duplicates": [_source_entry(chunks[i]) for i in duplicates],
+            "preview": canonical.get("content", "")[:120],
+        })
+
+    kept = [merged.get(i, chunk) for i, chunk in enumerate(chunks) if i not in dropped]
+    chars_before = sum(len(chunk.get("content", "")) for chunk in chunks)
+    chars_after = sum(len(chunk.get("content", "")) for chunk in kept)
+    report = {
+        "threshold": threshold,
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept),
+        "removed": len(dropped),
+        "clusters": len(cluster_reports),
+        "chars_before": chars_before,
+        "chars_after": chars_after,
+        "cluster_details": cluster_reports,
+    }
+    return kept, report
+
+
+def print_report(report, max_clusters=10):
+    removed_pct = 100 * report["removed"] / max(1, report["chunks_before"])
+    chars_pct = 100 * (report["chars_before"] - report["chars_after"]) / max(1, report["chars_before"])
+    print(f"--- Khử trùng lặp (MinHash, ngưỡng Jaccard {report['threshold']}) ---")
+    print(f"  Chunk: {report['chunks_before']} -> {report['chunks_after']} (bỏ {report['removed']}, {removed_pct:.1f}%) trong {report['clusters']} cụm")
+    print(f"  Ký tự: {report['chars_before']} -> {report['chars_after']} (giảm {chars_pct:.1f}%)")
+    for cluster in report["cluster_details"][:max_clusters]:
+        sources = ", ".join(d["source_file"] or "?" for d in cluster["duplicates"])
+        print(f"  * giữ [{cluster['canonical']['source_file']}] gộp {len(cluster['duplicates'])} bản từ [{sources}]: {cluster['preview']!r}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from corpus import DATA_CHUNKS_PATH
+
+    parser = argparse.ArgumentParser(description="Khử trùng lặp chunk gần giống nhau bằng MinHash/LSH")
+    parser.add_argument("--input", default=DATA_CHUNKS_PATH, help="File chunk JSON đầu vào")
+    parser.add_argument("--output", default=None, help="File JSON đầu ra (mặc định: ghi đè --input khi dùng --write)")
+    parser.add_argument("--write", action="store_true", help="Ghi kết quả ra file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Ngưỡng Jaccard để coi là trùng")
+    parser.add_argument("--report", default=None, help="Ghi báo cáo chi tiết (JSON)")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        input_chunks = json.load(f)
+    kept_chunks, dedup_report = deduplicate_chunks(input_chunks, threshold=args.threshold)
+    print_report(dedup_report)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(dedup_report, f, ensure_ascii=False, indent=4)
+    if args.write or args.output:
+        output_path = args.output or args.input
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(kept_chunks, f, ensure_ascii=False, indent=4)
+        print(f"Đã lưu {len(kept_chunks)} chunks vào '{output_path}'.")
@@ -0,0 +1,351 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Cache nhiều tầng: L1 trong bộ nhớ (LRU, riêng từng worker) + L2 SQLite (WAL) trên đĩa ---
+# L2 được chia sẻ giữa các worker trên cùng máy và giữ lại qua các lần khởi động lại / deploy.
+DISK_CACHE_ENABLED = os.getenv("DISK_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+DISK_CACHE_PATH = os.getenv("DISK_CACHE_PATH", os.path.join(BACKEND_DIR, "data", "cache", "rag_cache.sqlite3"))
+DISK_CACHE_MAX_BYTES = int(os.getenv("DISK_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("DISK_CACHE_MAX_ENTRIES", "200000"))
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "2048"))
+
+# TTL (giây) cho từng loại dữ liệu
+CACHE_TTLS = {
+    "embedding": int(os.getenv("CACHE_TTL_EMBEDDING", str(30 * 24 * 3600))),
+    "retrieval": int(os.getenv("CACHE_TTL_RETRIEVAL", str(24 * 3600))),
+    "answer": int(os.getenv("CACHE_TTL_ANSWER", str(6 * 3600))),
+}
+
+# Chỉ ghi lại last_access khi lần truy cập trước đã cũ hơn khoảng này (tránh ghi đĩa ở mỗi lần đọc)
+_ACCESS_UPDATE_INTERVAL = 60
+# Kiểm tra dung lượng sau mỗi N lần ghi; khi vượt giới hạn thì xóa về còn 90%
+_EVICTION_CHECK_EVERY = 200
+_EVICTION_TARGET_RATIO = 0.9
+
+
+def cache_version(*parts) -> str:
+    """
+    Short fingerprint of everything a cached value depends on (model, collection, corpus hash, prompt...).
+    """
+    return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class MemoryLRU:
+    """
+    Small in-process LRU with per-entry expiry (the L1 tier).
+    """
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store (WAL mode, safe for several processes) with TTLs,
+    size/entry caps evicted by least-recent access, and a version column per entry. The
+    `cache_versions` table records when each namespace version was first seen, so stale
+    versions can be told apart from newer ones written by other workers.
+    """
+
+    def __init__(self, path=DISK_CACHE_PATH, max_bytes=DISK_CACHE_MAX_BYTES, max_entries=DISK_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.evicted = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                version TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                namespace TEXT NOT NULL,
+                version TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (namespace, version)
+            )
+            """
+        )
+        connection.commit()
+
+    def _connection(self):
+        # Mỗi luồng một kết nối (các lời gọi chạy qua asyncio.to_thread)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace, key, version):
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, version, expires_at, last_access FROM cache WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+        value, entry_version, expires_at, last_access = row
+        if expires_at < now:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+            return None
+        if entry_version != version:
+            # Có thể là phiên bản mới hơn do worker khác ghi: chỉ coi là miss, không xóa
+            return None
+        if now - last_access > _ACCESS_UPDATE_INTERVAL:
+            self._connection().execute(
+                "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+        return value
+
+    def set(self, namespace, key, version, value: bytes, ttl):
+        """
+        Stores an entry. An existing entry is only replaced by the same or a newer version (by
+        cache_versions.created_at), so a worker still on an old version cannot overwrite it.
+        """
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO cache (namespace, key, version, value, size, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET version = excluded.version, value = excluded.value, "
+            "size = excluded.size, expires_at = excluded.expires_at, last_access = excluded.last_access "
+            "WHERE excluded.version = cache.version "
+            "OR COALESCE((SELECT created_at FROM cache_versions WHERE namespace = excluded.namespace AND version = excluded.version), 0) "
+            ">= COALESCE((SELECT created_at FROM cache_versions WHERE namespace = cache.namespace AND version = cache.version), 0)",
+            (namespace, key, version, value, len(value), now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % _EVICTION_CHECK_EVERY == 0:
+            self.evict()
+
+    def register_version(self, namespace, version):
+        """
+        Records `version` of `namespace` (first time seen, by any worker) and returns its created_at.
+        """
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR IGNORE INTO cache_versions (namespace, version, created_at) VALUES (?, ?, ?)",
+            (namespace, version, time.time()),
+        )
+        return connection.execute(
+            "SELECT created_at FROM cache_versions WHERE namespace = ? AND version = ?", (namespace, version)
+        ).fetchone()[0]
+
+    def purge_stale_versions(self, namespace, current_version):
+        """
+        Deletes the entries of `namespace` written for versions older than `current_version` (or never
+        registered). Entries of newer versions, written by workers that already moved on, are kept.
+        """
+        created_at = self.register_version(namespace, current_version)
+        deleted = self._connection().execute(
+            "DELETE FROM cache WHERE namespace = ? AND version != ? AND version NOT IN "
+            "(SELECT version FROM cache_versions WHERE namespace = ? AND created_at >= ?)",
+            (namespace, current_version, namespace, created_at),
+        ).rowcount
+        if deleted:
+            logger.info(f"Disk cache: đã xóa {deleted} mục '{namespace}' của phiên bản cũ.")
+        return deleted
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones until under 90% of the caps.
+        """
+        connection = self._connection()
+        removed = connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+        total_bytes, total_entries = connection.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache").fetchone()
+        if total_bytes > self.max_bytes or total_entries > self.max_entries:
+            target_bytes = self.max_bytes * _EVICTION_TARGET_RATIO
+            target_entries = int(self.max_entries * _EVICTION_TARGET_RATIO)
+            over_entries = max(0, total_entries - target_entries)
+            # Ước lượng số mục cần xóa theo kích thước trung bình, lấy số lớn hơn trong hai giới hạn
+            average_size = total_bytes / max(1, total_entries)
+            over_bytes = max(0, int((total_bytes - target_bytes) / max(1, average_size)) + 1) if total_bytes > target_bytes else 0
+            count = max(over_entries, over_bytes)
+            removed += connection.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY last_access LIMIT ?)", (count,)
+            ).rowcount
+        if removed:
+            self.evicted += removed
+            logger.info(f"Disk cache: đã xóa {removed} mục (hết hạn hoặc vượt giới hạn dung lượng).")
+        return removed
+
+    def stats(self):
+        rows = self._connection().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM cache GROUP BY namespace"
+        ).fetchall()
+        return {
+            "path": self.path,
+            "namespaces": {namespace: {"entries": entries, "bytes": size} for namespace, entries, size in rows},
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "evicted": self.evicted,
+        }
+
+
+class TieredCache:
+    """
+    L1 MemoryLRU in front of an optional L2 DiskCache. Values are bytes; each namespace has its own
+    TTL and current version, and entries of other versions are treated as misses. Namespaces whose
+    version was never set are not cached at all (nothing would invalidate their entries).
+    """
+
+    def __init__(self, disk_cache=None, memory_cache=None, ttls=None):
+        self.disk = disk_cache
+        self.memory = memory_cache or MemoryLRU()
+        self.ttls = dict(ttls or CACHE_TTLS)
+        self.versions = {}
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def set_version(self, namespace, version):
+        """
+        Sets the current version of a namespace; when it changes, the namespace's in-memory entries are
+        dropped and its on-disk entries of older versions are purged.
+        """
+        if self.versions.get(namespace) == version:
+            return
+        previous = self.versions.get(namespace)
+        self.versions[namespace] = version
+        if previous is not None:
+            self.memory.discard_where(lambda memory_key: memory_key[0] == namespace)
+            logger.info(f"Cache '{namespace}': phiên bản {previous} -> {version}.")
+        if self.disk is not None:
+            try:
+                self.disk.purge_stale_versions(namespace, version)
+            except sqlite3.Error as e:
+                logger.warning(f"Không thể dọn disk cache '{namespace}': {e}")
+
+    def get(self, namespace, key):
+        version = self.versions.get(namespace)
+        if version is None:
+            self.misses += 1
+            return None
+        memory_key = (namespace, version, key)
+        value = self.memory.get(memory_key)
+        if value is not None:
+            self.hits["memory"] += 1
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(namespace, key, version)
+            except sqlite3.Error as e:
+                logger.warning(f"Lỗi đọc disk cache: {e}")
+                value = None
+            if value is not None:
+                self.hits["disk"] += 1
+                self.memory.set(memory_key, value, self.ttls.get(namespace, 3600))
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, namespace, key, value: bytes):
+        version = self.versions.get(namespace)
+        if version is None:
+            return
+        ttl = self.ttls.get(namespace, 3600)
+        self.memory.set((namespace, version, key), value, ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(namespace, key, version, value, ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Lỗi ghi disk cache: {e}")
+
+    async def aget(self, namespace, key):
+        # L1 đọc trực tiếp; chỉ chuyển sang thread khi cần đọc SQLite
+        version = self.versions.get(namespace)
+        if version is None:
+            self.misses += 1
+            return None
+        value = self.memory.get((namespace, version, key))
+        if value is not None:
+            self.hits["memory"] += 1
+            return value
+        if self.disk is None:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, namespace, key)
+
+    async def aset(self, namespace, key, value: bytes):
+        if self.disk is None or namespace not in self.versions:
+            self.set(namespace, key, value)
+            return
+        await asyncio.to_thread(self.set, namespace, key, value)
+
+    def stats(self):
+        return {
+            "versions": self.versions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def create_cache():
+    disk_cache = None
+    if DISK_CACHE_ENABLED:
+        try:
+            disk_cache = DiskCache()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Không thể mở disk cache tại '{DISK_CACHE_PATH}': {e}. Chỉ dùng cache trong bộ nhớ.")
+    return TieredCache(disk_cache=disk_cache)
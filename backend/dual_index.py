@@ -0,0 +1,104 @@
+# --- Phục vụ song song hai index trong lúc đổi model embedding ---
+# Index của model mới (ví dụ model đa ngôn ngữ intfloat/multilingual-e5-small) được dựng dưới một alias riêng:
+#     python backend/embedding.py --model intfloat/multilingual-e5-small --alias apec_chatbot_data_e5
+# trong khi index cũ vẫn phục vụ. app.py nạp thêm index phụ (SECONDARY_EMBEDDING_MODEL_NAME, và
+# SECONDARY_QDRANT_COLLECTION_NAME khi RETRIEVER_MODE=qdrant) và dùng theo DUAL_INDEX_MODE:
+#     off     chỉ dùng index chính (mặc định)
+#     shadow  trả lời bằng index chính; index phụ được truy vấn nền và so sánh (độ trùng top-k, top-1, độ trễ)
+#     merge   trộn kết quả hai index bằng Reciprocal Rank Fusion
+# Số liệu xem ở GET /admin/dual-index. Khi index mới đã ổn: đổi EMBEDDING_MODEL_NAME / QDRANT_COLLECTION_NAME
+# sang index mới và tắt DUAL_INDEX_MODE.
+import os
+import random
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+DUAL_INDEX_MODES = ("off", "shadow", "merge")
+DUAL_INDEX_MODE = os.getenv("DUAL_INDEX_MODE", "off").lower()
+SECONDARY_EMBEDDING_MODEL_NAME = os.getenv("SECONDARY_EMBEDDING_MODEL_NAME", "")
+SECONDARY_QDRANT_COLLECTION_NAME = os.getenv("SECONDARY_QDRANT_COLLECTION_NAME", "")
+DUAL_INDEX_RRF_K = int(os.getenv("DUAL_INDEX_RRF_K", "60"))
+# Tỉ lệ request (cache miss) được truy vấn thêm trên index phụ để so sánh ở chế độ shadow
+DUAL_INDEX_SHADOW_SAMPLE_RATE = float(os.getenv("DUAL_INDEX_SHADOW_SAMPLE_RATE", "1.0"))
+
+if DUAL_INDEX_MODE not in DUAL_INDEX_MODES:
+    raise ValueError(f"DUAL_INDEX_MODE không hợp lệ: '{DUAL_INDEX_MODE}'. Các giá trị hợp lệ: {', '.join(DUAL_INDEX_MODES)}.")
+
+_MAX_RECENT_DISAGREEMENTS = 20
+
+
+def document_key(doc):
+    return doc.metadata.get("id") or doc.page_content
+
+
+def fuse_documents(result_lists, k, rrf_k=DUAL_INDEX_RRF_K):
+    """
+    Merges ranked Document lists with Reciprocal Rank Fusion, keyed by chunk id.
+    """
+    fused, by_key = {}, {}
+    for documents in result_lists:
+        for rank, doc in enumerate(documents):
+            key = document_key(doc)
+            by_key.setdefault(key, doc)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return [by_key[key] for key in sorted(fused, key=fused.get, reverse=True)[:k]]
+
+
+class IndexComparison:
+    """
+    Running comparison of the primary and secondary index results on live questions (shadow or merge mode).
+    """
+
+    def __init__(self, sample_rate=DUAL_INDEX_SHADOW_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.comparisons = 0
+        self.errors = 0
+        self._overlap_sum = 0.0
+        self._top1_agreements = 0
+        self._primary_seconds = 0.0
+        self._secondary_seconds = 0.0
+        self._recent_disagreements = deque(maxlen=_MAX_RECENT_DISAGREEMENTS)
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, question, primary_docs, secondary_docs, primary_seconds, secondary_seconds):
+        primary_keys = [document_key(doc) for doc in primary_docs]
+        secondary_keys = [document_key(doc) for doc in secondary_docs]
+        overlap = len(set(primary_keys) & set(secondary_keys)) / max(1, len(primary_keys), len(secondary_keys))
+        top1_agrees = primary_keys[:1] == secondary_keys[:1]
+        with self._lock:
+            self.comparisons += 1
+            self._overlap_sum += overlap
+            self._top1_agreements += int(top1_agrees)
+            self._primary_seconds += primary_seconds
+            self._secondary_seconds += secondary_seconds
+            if not top1_agrees:
+                self._recent_disagreements.append({
+                    "question": question[:200],
+                    "primary_top": primary_keys[:3],
+                    "secondary_top": secondary_keys[:3],
+                    "overlap": round(overlap, 3),
+                })
+
+    def record_error(self, error):
+        self.errors += 1
+        logger.warning(f"Dual index: lỗi khi truy vấn index phụ: {error}")
+
+    def stats(self):
+        with self._lock:
+            count = self.comparisons
+            return {
+                "comparisons": count,
+                "errors": self.errors,
+                "sample_rate": self.sample_rate,
+                "mean_overlap": round(self._overlap_sum / count, 4) if count else None,
+                "top1_agreement": round(self._top1_agreements / count, 4) if count else None,
+                "mean_primary_ms": round(self._primary_seconds / count * 1000, 2) if count else None,
+                "mean_secondary_ms": round(self._secondary_seconds / count * 1000, 2) if count else None,
+                "recent_disagreements": list(reversed(self._recent_disagreements)),
+            }
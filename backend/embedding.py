@@ -1,7 +1,12 @@
 import os
+import sys
 import json
+import time
+import argparse
 from qdrant_client import QdrantClient, models
-from langchain_huggingface import HuggingFaceEmbeddings
+from embedding_backends import create_embeddings, EMBEDDING_BACKEND
+from embedding_artifact import load_or_embed
+from corpus import DATA_CHUNKS_PATH
 # from langchain_openai import OpenAIEmbeddings # Nếu bạn muốn dùng OpenAI embeddings
 from langchain_core.documents import Document
 import uuid
@@ -20,6 +25,17 @@ load_dotenv() # Load environment variables from .env
 QDRANT_URL = os.getenv("QDRANT_CLOUD_URL") # Đảm bảo biến này được set trong .env là QDRANT_CLOUD_URL
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") 
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "apec_chatbot_data")
+# "bluegreen": tạo collection mới có phiên bản (<tên>__<thời gian>), kiểm tra rồi chuyển alias QDRANT_COLLECTION_NAME
+# sang collection đó trong một thao tác nguyên tử (app.py không bị gián đoạn).
+# "recreate": cách cũ, xóa và tạo lại collection QDRANT_COLLECTION_NAME (có khoảng thời gian không trả lời được).
+QDRANT_INDEX_MODE = os.getenv("QDRANT_INDEX_MODE", "bluegreen").lower()
+# Số phiên bản cũ được giữ lại để rollback
+QDRANT_KEEP_VERSIONS = int(os.getenv("QDRANT_KEEP_VERSIONS", "2"))
+# Thời gian tối đa chờ Qdrant dựng xong index HNSW của collection mới trước khi chuyển alias
+QDRANT_INDEX_WAIT_TIMEOUT = int(os.getenv("QDRANT_INDEX_WAIT_TIMEOUT", "600"))
+# Số document (rải đều trong corpus) được truy vấn thử trước khi chuyển alias
+QDRANT_VALIDATION_PROBES = int(os.getenv("QDRANT_VALIDATION_PROBES", "5"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
 
 # Kiểm tra nếu các biến môi trường quan trọng chưa được thiết lập
 if not QDRANT_URL:
@@ -27,32 +43,22 @@ if not QDRANT_URL:
 if not QDRANT_API_KEY:
     raise ValueError("Biến môi trường 'QDRANT_API_KEY' chưa được thiết lập. Vui lòng thêm vào file .env")
 
-# Kích thước embedding vector cho 'all-MiniLM-L6-v2' là 384
-EMBEDDING_DIMENSION = 384 
+# Đường dẫn tới file JSON chứa tất cả các chunk dữ liệu: DATA_CHUNKS_PATH (corpus.py), tính từ vị trí
+# file nên không cần chạy script từ thư mục gốc của dự án.
 
-# Đường dẫn tới file JSON chứa tất cả các chunk dữ liệu
-# Giả định file này nằm ở thư mục gốc của dự án trong data/json_chunks/
-# Thay đổi đường dẫn cứng này bằng đường dẫn tương đối nếu file Python này nằm ở thư mục gốc
-# Hoặc đảm bảo rằng bạn chạy script từ thư mục gốc của dự án.
-DATA_CHUNKS_PATH = os.path.join("backend", "data", "json_chunks", "apec_all_chunks.json")
-# Nếu bạn muốn giữ nguyên đường dẫn tuyệt đối, hãy chắc chắn nó đúng trên hệ thống chạy.
-# DATA_CHUNKS_PATH = r"D:\Desktop\tap tanh hoc code\.vscode\Summer_2025\SEG301\Hakate_assignment\apec_chatbot\backend\data\json_chunks\apec_all_chunks.json"
 
-
-def initialize_embeddings_model():
+def initialize_embeddings_model(model_name=EMBEDDING_MODEL_NAME):
     """
     Initializes and returns the embedding model.
-    Chooses between HuggingFaceEmbeddings (local) or OpenAIEmbeddings.
+    Uses the backend selected by EMBEDDING_BACKEND ("torch" or "onnx").
     """
     print("Đang khởi tạo mô hình embedding...")
     try:
-        # Sử dụng mô hình Sentence Transformers cục bộ
-        # Đảm bảo bạn đã pip install sentence-transformers
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        print("Đã khởi tạo HuggingFaceEmbeddings (all-MiniLM-L6-v2) thành công.")
+        embeddings = create_embeddings(model_name)
+        print(f"Đã khởi tạo embedding {model_name} (backend: {EMBEDDING_BACKEND}) thành công.")
     except Exception as e:
-        print(f"Lỗi khi khởi tạo HuggingFaceEmbeddings: {e}")
-        print("Hãy đảm bảo bạn đã cài đặt 'sentence-transformers' (`pip install sentence-transformers`).")
+        print(f"Lỗi khi khởi tạo embedding (backend: {EMBEDDING_BACKEND}): {e}")
+        print("Hãy đảm bảo bạn đã cài đặt 'sentence-transformers' (`pip install sentence-transformers`), hoặc 'onnxruntime' và đã xuất model ONNX nếu dùng backend onnx.")
         # Fallback hoặc raise error
         raise
     return embeddings
@@ -77,38 +83,47 @@ def get_qdrant_client():
         print("Vui lòng kiểm tra lại 'QDRANT_URL' và 'QDRANT_API_KEY' trong file .env của bạn.")
         raise
 
-def load_data_chunks():
+def documents_from_chunks(chunks):
+    """
+    Converts chunk dicts to LangChain Document objects (content also kept in the 'content_text' payload key).
+    """
+    documents = []
+    for chunk in chunks:
+        # print(chunk.get("content")) # Giữ lại dòng này để kiểm tra nếu muốn
+        # Tạo Document object từ mỗi chunk
+        # Sử dụng `id` từ chunk làm id cho Document nếu có, nếu không thì tạo mới
+        doc_id = chunk.get('id', str(uuid.uuid4())) 
+        documents.append(Document(
+            page_content=chunk.get('content', ''), # Đây là nội dung chính của LangChain Document
+            metadata={
+                "id": doc_id, 
+                "topic": chunk.get('topic', 'N/A'),
+                "sub_topic": chunk.get('sub_topic', 'N/A'),
+                "source_file": chunk.get('source_file', 'N/A'),
+                "source_url": chunk.get("source_url", "N/A"),
+                "merged_sources": chunk.get("merged_sources", []), # Nguồn của các chunk trùng lặp đã gộp (dedup.py)
+                "content_text": chunk.get('content', '') # Thêm nội dung vào metadata với key mới để lưu vào payload
+            }
+        ))
+    return documents
+
+def load_data_chunks(chunks_path=DATA_CHUNKS_PATH):
     """
     Loads all processed data chunks from JSON files and converts them to LangChain Document objects.
     """
     all_documents = []
 
     # Load chunks từ apec_all_chunks.json
-    if os.path.exists(DATA_CHUNKS_PATH):
+    if os.path.exists(chunks_path):
         try:
-            with open(DATA_CHUNKS_PATH, 'r', encoding='utf-8') as f:
+            with open(chunks_path, 'r', encoding='utf-8') as f:
                 chunks = json.load(f)
-                for chunk in chunks:
-                    # print(chunk.get("content")) # Giữ lại dòng này để kiểm tra nếu muốn
-                    # Tạo Document object từ mỗi chunk
-                    # Sử dụng `id` từ chunk làm id cho Document nếu có, nếu không thì tạo mới
-                    doc_id = chunk.get('id', str(uuid.uuid4())) 
-                    all_documents.append(Document(
-                        page_content=chunk.get('content', ''), # Đây là nội dung chính của LangChain Document
-                        metadata={
-                            "id": doc_id, 
-                            "topic": chunk.get('topic', 'N/A'),
-                            "sub_topic": chunk.get('sub_topic', 'N/A'),
-                            "source_file": chunk.get('source_file', 'N/A'),
-                            "source_url": chunk.get("source_url", "N/A"),
-                            "content_text": chunk.get('content', '') # Thêm nội dung vào metadata với key mới để lưu vào payload
-                        }
-                    ))
-            print(f"Đã tải {len(chunks)} chunks từ '{DATA_CHUNKS_PATH}'.")
+            all_documents = documents_from_chunks(chunks)
+            print(f"Đã tải {len(chunks)} chunks từ '{chunks_path}'.")
         except Exception as e:
-            print(f"Lỗi khi tải dữ liệu từ '{DATA_CHUNKS_PATH}': {e}")
+            print(f"Lỗi khi tải dữ liệu từ '{chunks_path}': {e}")
     else:
-        print(f"Cảnh báo: File '{DATA_CHUNKS_PATH}' không tồn tại. Vui lòng chạy script tiền xử lý trước.")
+        print(f"Cảnh báo: File '{chunks_path}' không tồn tại. Vui lòng chạy script tiền xử lý trước.")
 
     if not all_documents:
         print("Không có tài liệu nào được tải để tạo embeddings. Vui lòng kiểm tra các file dữ liệu.")
@@ -118,38 +133,46 @@ def load_data_chunks():
     return all_documents
 
 
-def upload_documents_to_qdrant(documents, embeddings, client):
+def upload_documents_to_qdrant(documents, embeddings, client, collection_name=QDRANT_COLLECTION_NAME, model_name=EMBEDDING_MODEL_NAME):
     """
     Creates Qdrant collection and uploads documents with their embeddings.
+    Vectors come from the precomputed embedding artifact (embedding_artifact.py) when it matches the
+    model; only documents missing from it are embedded here. The collection's vector size is taken
+    from the model's vectors. Returns the uploaded vectors.
     """
-    print(f"Đang tải dữ liệu lên Qdrant collection: {QDRANT_COLLECTION_NAME}...")
+    print(f"Đang tải dữ liệu lên Qdrant collection: {collection_name}...")
+
+    # Lấy vector từ artifact dựng sẵn, chỉ embed (theo lô) các document chưa có trong đó.
+    # Tính trước khi tạo collection để biết số chiều của model (384 với all-MiniLM-L6-v2, 768 với multilingual-e5-base...)
+    vectors = load_or_embed([doc.page_content for doc in documents], embeddings, model_name)
+    dimension = int(vectors.shape[1])
     
     # Kiểm tra xem collection đã tồn tại chưa
     # Nếu tồn tại, có thể xóa và tạo lại để đảm bảo dữ liệu mới nhất
-    if client.collection_exists(collection_name=QDRANT_COLLECTION_NAME):
-        print(f"Collection '{QDRANT_COLLECTION_NAME}' đã tồn tại. Đang xóa và tạo lại...")
-        client.delete_collection(collection_name=QDRANT_COLLECTION_NAME)
+    if client.collection_exists(collection_name=collection_name):
+        print(f"Collection '{collection_name}' đã tồn tại. Đang xóa và tạo lại...")
+        client.delete_collection(collection_name=collection_name)
     
     # Tạo collection mới
     client.recreate_collection(
-        collection_name=QDRANT_COLLECTION_NAME,
-        vectors_config=models.VectorParams(size=EMBEDDING_DIMENSION, distance=models.Distance.COSINE),
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE),
     )
-    print(f"Đã tạo collection '{QDRANT_COLLECTION_NAME}' mới.")
+    print(f"Đã tạo collection '{collection_name}' mới ({dimension} chiều, model '{model_name}').")
 
     # Chuyển đổi Documents thành Points cho Qdrant
     points = []
-    for doc in documents:
-        # Tạo embedding cho nội dung của Document
-        vector = embeddings.embed_query(doc.page_content)
+    for doc, vector in zip(documents, vectors):
         
         # Payload sẽ là metadata của Document
         # Đảm bảo rằng 'content_text' đã được thêm vào metadata trong load_data_chunks
         payload = doc.metadata.copy() 
+        # LangChain Qdrant (app.py) đọc metadata của Document từ khóa "metadata" trong payload
+        payload["metadata"] = {key: value for key, value in doc.metadata.items() if key != "content_text"}
 
         points.append(models.PointStruct(
             id=payload.get("id", str(uuid.uuid4())), 
-            vector=vector,
+            vector=vector.tolist(),
             payload=payload 
         ))
     
@@ -158,17 +181,181 @@ def upload_documents_to_qdrant(documents, embeddings, client):
     for i in range(0, len(points), batch_size):
         batch = points[i:i + batch_size]
         client.upsert(
-            collection_name=QDRANT_COLLECTION_NAME,
+            collection_name=collection_name,
             points=batch,
             wait=True 
         )
         print(f"    > Đã tải {min(i + batch_size, len(points))}/{len(points)} points lên Qdrant.")
 
     # Lấy tổng số điểm sau khi tải lên
-    total_points = client.count(collection_name=QDRANT_COLLECTION_NAME, exact=True).count
+    total_points = client.count(collection_name=collection_name, exact=True).count
     print(f"Đã tải tất cả tài liệu lên Qdrant thành công! Tổng số điểm: {total_points}")
+    return vectors
+
+
+# --- Blue/green: collection có phiên bản + alias ---
+def versioned_collection_name(alias=QDRANT_COLLECTION_NAME):
+    return f"{alias}__{time.strftime('%Y%m%dT%H%M%S')}"
+
+def list_collection_versions(client, alias=QDRANT_COLLECTION_NAME):
+    """
+    Returns the versioned collections built for `alias`, oldest first.
+    """
+    prefix = f"{alias}__"
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+
+def get_alias_target(client, alias=QDRANT_COLLECTION_NAME):
+    for alias_description in client.get_aliases().aliases:
+        if alias_description.alias_name == alias:
+            return alias_description.collection_name
+    return None
+
+def wait_until_indexed(client, collection_name, timeout=QDRANT_INDEX_WAIT_TIMEOUT):
+    """
+    Waits until Qdrant has finished optimizing/indexing the collection (status green), so the
+    first queries after the switch do not hit a half-built HNSW index.
+    """
+    deadline = time.time() + timeout
+    while True:
+        status = client.get_collection(collection_name=collection_name).status
+        if status == models.CollectionStatus.GREEN:
+            return True
+        if time.time() > deadline:
+            print(f"Collection '{collection_name}' vẫn ở trạng thái '{status}' sau {timeout} giây.")
+            return False
+        time.sleep(2)
+
+def validate_collection(client, collection_name, documents, vectors, probes=QDRANT_VALIDATION_PROBES, top_k=5):
+    """
+    Checks the new collection before it goes live: exact point count, indexing finished and, for a
+    few documents spread over the corpus, a probe query returning the document among its top-k hits.
+    """
+    expected = len(documents)
+    total_points = client.count(collection_name=collection_name, exact=True).count
+    if total_points != expected:
+        print(f"Kiểm tra thất bại: '{collection_name}' có {total_points} points, cần {expected}.")
+        return False
+    if not wait_until_indexed(client, collection_name):
+        return False
+    # Khớp theo id hoặc theo nội dung: các chunk cùng nội dung có cùng vector nên thứ tự giữa chúng không cố định
+    step = max(1, expected // max(1, probes))
+    for position in range(0, expected, step)[:probes]:
+        document = documents[position]
+        expected_id = str(document.metadata.get("id"))
+        probe_hits = client.query_points(
+            collection_name=collection_name, query=vectors[position].tolist(), limit=top_k, with_payload=True
+        ).points
+        if not any(str(hit.id) == expected_id or (hit.payload or {}).get("content_text") == document.page_content for hit in probe_hits):
+            print(f"Kiểm tra thất bại: truy vấn thử trên '{collection_name}' không trả về document '{expected_id}' trong top {top_k}.")
+            return False
+    print(f"Collection '{collection_name}' hợp lệ ({total_points} points, đã index xong).")
+    return True
+
+def switch_alias(client, collection_name, alias=QDRANT_COLLECTION_NAME):
+    """
+    Points `alias` at `collection_name` in a single atomic alias update.
+    """
+    previous = get_alias_target(client, alias)
+    if previous is None and alias in {c.name for c in client.get_collections().collections}:
+        _replace_legacy_collection(client, collection_name, alias)
+        return None
+    operations = []
+    if previous is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"Alias '{alias}': {previous or '(chưa có)'} -> {collection_name}")
+    return previous
+
+def _replace_legacy_collection(client, collection_name, alias):
+    """
+    First switch to blue/green: an alias cannot share its name with a real collection, so the alias is
+    created first under a temporary name, and only then is the old collection dropped and the alias
+    renamed. If the alias cannot be created, the old collection is left serving.
+    """
+    pending_alias = f"{alias}__pending"
+    client.update_collection_aliases(change_aliases_operations=[
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=pending_alias))
+    ])
+    print(f"Collection cũ '{alias}' (không có phiên bản) đang chiếm tên alias. Đã tạo alias tạm '{pending_alias}' -> {collection_name}; "
+          f"đang xóa collection cũ để đổi tên alias (chỉ xảy ra một lần)...")
+    client.delete_collection(collection_name=alias)
+    client.update_collection_aliases(change_aliases_operations=[
+        models.RenameAliasOperation(rename_alias=models.RenameAlias(old_alias_name=pending_alias, new_alias_name=alias))
+    ])
+    print(f"Alias '{alias}': (collection cũ) -> {collection_name}")
+
+def prune_old_versions(client, alias=QDRANT_COLLECTION_NAME, keep=QDRANT_KEEP_VERSIONS):
+    """
+    Deletes old versioned collections, keeping the live one and the `keep` most recent others.
+    """
+    live = get_alias_target(client, alias)
+    others = [name for name in list_collection_versions(client, alias) if name != live]
+    stale = others[:-keep] if keep > 0 else others
+    for name in stale:
+        client.delete_collection(collection_name=name)
+        print(f"Đã xóa phiên bản cũ '{name}'.")
+    return stale
+
+def reindex_blue_green(documents, embeddings, client, alias=QDRANT_COLLECTION_NAME, keep=QDRANT_KEEP_VERSIONS, model_name=EMBEDDING_MODEL_NAME):
+    """
+    Builds a new versioned collection, validates it and switches `alias` to it. The live collection
+    keeps serving until the switch; if validation fails the alias is left untouched.
+    """
+    collection_name = versioned_collection_name(alias)
+    vectors = upload_documents_to_qdrant(documents, embeddings, client, collection_name=collection_name, model_name=model_name)
+    if not validate_collection(client, collection_name, documents, vectors):
+        print(f"Giữ nguyên alias '{alias}'. Collection '{collection_name}' được giữ lại để kiểm tra; "
+              f"chuyển thủ công bằng: python backend/embedding.py --switch {collection_name}")
+        return None
+    switch_alias(client, collection_name, alias)
+    prune_old_versions(client, alias, keep)
+    return collection_name
+
+def rollback(client, target=None, alias=QDRANT_COLLECTION_NAME):
+    """
+    Switches `alias` back to `target`, or to the newest version older than the live one.
+    """
+    live = get_alias_target(client, alias)
+    versions = list_collection_versions(client, alias)
+    if target is None:
+        older = [name for name in versions if live is None or name < live]
+        if not older:
+            print(f"Không có phiên bản cũ hơn '{live}' để rollback.")
+            return None
+        target = older[-1]
+    elif target not in versions:
+        print(f"Không tìm thấy collection '{target}'. Các phiên bản hiện có: {versions}")
+        return None
+    switch_alias(client, target, alias)
+    return target
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo embedding và tải dữ liệu lên Qdrant")
+    parser.add_argument("--mode", choices=["bluegreen", "recreate"], default=QDRANT_INDEX_MODE, help="bluegreen: collection mới + chuyển alias; recreate: xóa và tạo lại collection")
+    parser.add_argument("--keep", type=int, default=QDRANT_KEEP_VERSIONS, help="Số phiên bản cũ giữ lại để rollback")
+    parser.add_argument("--list", action="store_true", help="Liệt kê các phiên bản và collection alias đang trỏ tới")
+    parser.add_argument("--switch", metavar="COLLECTION", help="Chuyển alias sang một collection đã có")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="COLLECTION", help="Quay lại phiên bản trước (hoặc COLLECTION)")
+    # Khi đổi model embedding: dựng index của model mới dưới một alias riêng trong khi index cũ vẫn phục vụ
+    # (app.py truy vấn cả hai qua DUAL_INDEX_MODE, xem dual_index.py)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Model embedding (mặc định: EMBEDDING_MODEL_NAME)")
+    parser.add_argument("--alias", default=QDRANT_COLLECTION_NAME, help="Alias / collection đích (mặc định: QDRANT_COLLECTION_NAME)")
+    args = parser.parse_args()
+
+    if args.list or args.switch or args.rollback is not None:
+        qdrant_client = get_qdrant_client()
+        if args.switch:
+            switch_alias(qdrant_client, args.switch, args.alias)
+        elif args.rollback is not None:
+            if rollback(qdrant_client, args.rollback or None, args.alias) is None:
+                sys.exit(1)
+        live_collection = get_alias_target(qdrant_client, args.alias)
+        print(f"Alias '{args.alias}' -> {live_collection or '(chưa có)'}")
+        for version in list_collection_versions(qdrant_client, args.alias):
+            print(f"  {'*' if version == live_collection else ' '} {version}")
+        sys.exit(0)
+
     print("--- BẮT ĐẦU QUÁ TRÌNH TẢI DỮ LIỆU LÊN QDRANT CLOUD ---")
     print("Vui lòng đảm bảo các biến môi trường sau đã được thiết lập trong file .env:")
     print("  - QDRANT_URL (URL đầy đủ cho Qdrant Cloud)")
@@ -180,7 +367,7 @@ if __name__ == "__main__":
     print("QDRANT_COLLECTION_NAME=\"my_apec_data\"\n")
 
     # 1. Khởi tạo Embedding Model
-    embeddings_model = initialize_embeddings_model()
+    embeddings_model = initialize_embeddings_model(args.model)
 
     # 2. Kết nối tới Qdrant
     qdrant_client = get_qdrant_client()
@@ -190,7 +377,14 @@ if __name__ == "__main__":
 
     if langchain_documents:
         # 4. Tạo embeddings và tải lên Qdrant
-        upload_documents_to_qdrant(langchain_documents, embeddings_model, qdrant_client)
+        if args.mode == "bluegreen":
+            if reindex_blue_green(langchain_documents, embeddings_model, qdrant_client, alias=args.alias, keep=args.keep, model_name=args.model) is None:
+                sys.exit(1)
+        else:
+            if get_alias_target(qdrant_client, args.alias) is not None:
+                print(f"'{args.alias}' đang là alias của blue/green; chế độ recreate sẽ ghi vào collection đang phục vụ. Dùng --mode bluegreen.")
+                sys.exit(1)
+            upload_documents_to_qdrant(langchain_documents, embeddings_model, qdrant_client, collection_name=args.alias, model_name=args.model)
     else:
         print("Không có tài liệu nào để tải lên Qdrant. Quá trình dừng lại.")
     
@@ -0,0 +1,263 @@
+# --- Artifact embedding dựng sẵn cho corpus chunk ---
+# Lưu vector của tất cả chunk ra đĩa để Qdrant upload (embedding.py), local index (RETRIEVER_MODE=local)
+# và retrieval_eval.py nạp thẳng thay vì chạy lại model embedding trên toàn bộ corpus ở mỗi môi trường.
+#
+# Mỗi model một thư mục backend/data/embeddings/<model>/ gồm:
+#     vectors.npy    ma trận float32 (đã chuẩn hóa L2), nạp bằng memory-map
+#     index.json     id chunk + hash nội dung theo đúng thứ tự hàng
+#     manifest.json  tên model, tiền tố query/passage, backend, số chiều, hash corpus, vector "probe" để nhận ra model đã đổi,
+#                    sha256 của vectors.npy / index.json (kiểm tra khi nạp: bắt được trường hợp đọc lẫn file cũ / mới)
+#
+# Vector được tra theo hash nội dung nên khi corpus thay đổi chỉ các chunk mới/sửa cần embed lại.
+#
+# Cách dùng:
+#     python backend/embedding_artifact.py export            # tạo / cập nhật artifact cho corpus hiện tại
+#     python backend/embedding_artifact.py info              # xem manifest và kiểm tra độ khớp với corpus
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_ARTIFACTS_DIR = os.getenv("EMBEDDING_ARTIFACTS_DIR", os.path.join(BACKEND_DIR, "data", "embeddings"))
+
+ARTIFACT_FORMAT_VERSION = 2
+VECTORS_FILE_NAME = "vectors.npy"
+INDEX_FILE_NAME = "index.json"
+MANIFEST_FILE_NAME = "manifest.json"
+
+# Câu cố định được embed lúc export; khi nạp, model hiện tại phải cho vector gần giống (cùng ngưỡng với parity ONNX int8)
+PROBE_TEXT = "APEC 2025 Korea: Building a Sustainable Tomorrow - Connect, Innovate, Prosper (Gyeongju)"
+PROBE_MIN_SIMILARITY = float(os.getenv("EMBEDDING_ARTIFACT_MIN_SIMILARITY", "0.98"))
+
+
+def default_artifact_dir(model_name):
+    return os.path.join(EMBEDDING_ARTIFACTS_DIR, model_name.replace("/", "__"))
+
+
+def _prefixes(model_name):
+    # Import muộn: chỉ cần langchain khi thật sự so khớp / xuất artifact
+    from embedding_backends import embedding_prefixes
+    return embedding_prefixes(model_name)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+class EmbeddingArtifact:
+    """
+    A loaded artifact: memory-mapped vectors plus the row index and manifest.
+    """
+
+    def __init__(self, path, manifest, index, vectors):
+        if len(index) != len(vectors) or manifest.get("count") != len(vectors):
+            raise ValueError(f"Artifact '{path}' không nhất quán: manifest {manifest.get('count')}, index {len(index)}, vectors {len(vectors)}.")
+        self.path = path
+        self.manifest = manifest
+        self.index = index
+        self.vectors = vectors
+        self.row_by_hash = {}
+        for row, entry in enumerate(index):
+            self.row_by_hash.setdefault(entry["content_hash"], row)
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads the artifact stored in `path`, or returns None if there is none. Raises ValueError when
+        the vectors or the index do not match the manifest checksums (e.g. read while being exported).
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Artifact '{path}' có format_version {manifest.get('format_version')}, cần {ARTIFACT_FORMAT_VERSION}.")
+        with open(os.path.join(path, INDEX_FILE_NAME), "rb") as f:
+            index_bytes = f.read()
+        vectors = np.load(os.path.join(path, VECTORS_FILE_NAME), mmap_mode="r" if mmap else None)
+        # Hash đúng dữ liệu đã nạp (memory-map giữ file đã mở kể cả khi export thay file mới)
+        if _sha256(index_bytes) != manifest.get("index_sha256") or _sha256(np.ascontiguousarray(vectors).data) != manifest.get("vectors_sha256"):
+            raise ValueError(f"Artifact '{path}' không khớp checksum trong manifest (có thể đang được export lại).")
+        return cls(path, manifest, json.loads(index_bytes.decode("utf-8")), vectors)
+
+    def incompatibility(self, model_name, embeddings=None):
+        """
+        Returns why the artifact cannot be used with this model (None when it can). With `embeddings`,
+        the probe text is re-embedded to catch a changed model behind the same name.
+        """
+        if self.manifest.get("model_name") != model_name:
+            return f"artifact được tạo bằng model '{self.manifest.get('model_name')}', không phải '{model_name}'"
+        query_prefix, document_prefix = _prefixes(model_name)
+        artifact_prefixes = (self.manifest.get("query_prefix", ""), self.manifest.get("document_prefix", ""))
+        if artifact_prefixes != (query_prefix, document_prefix):
+            return f"tiền tố khác nhau (artifact {artifact_prefixes!r}, model {(query_prefix, document_prefix)!r})"
+        if embeddings is not None:
+            probe = _normalize([embeddings.embed_query(PROBE_TEXT)])[0]
+            expected = np.asarray(self.manifest.get("probe_vector", []), dtype=np.float32)
+            if expected.shape != probe.shape:
+                return f"số chiều khác nhau (artifact {expected.shape[0]}, model {probe.shape[0]})"
+            similarity = float(probe @ expected)
+            if similarity < PROBE_MIN_SIMILARITY:
+                return f"vector probe lệch (cosine {similarity:.4f} < {PROBE_MIN_SIMILARITY})"
+        return None
+
+
+def load_compatible_artifact(model_name, embeddings=None, artifact_dir=None):
+    """
+    Loads the artifact of `model_name` if it exists and matches the model, otherwise returns None.
+    """
+    artifact_dir = artifact_dir or default_artifact_dir(model_name)
+    try:
+        artifact = EmbeddingArtifact.load(artifact_dir)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Không thể nạp artifact embedding '{artifact_dir}': {e}")
+        return None
+    if artifact is None:
+        return None
+    reason = artifact.incompatibility(model_name, embeddings)
+    if reason:
+        logger.warning(f"Bỏ qua artifact embedding '{artifact_dir}': {reason}.")
+        return None
+    return artifact
+
+
+def load_or_embed(texts, embeddings, model_name, artifact_dir=None, batch_size=64):
+    """
+    Returns the L2-normalized float32 matrix of `texts`, taking rows from the model's artifact (matched
+    by content hash) and embedding only the texts it does not contain. When the artifact covers the
+    texts in the same order, its memory-mapped matrix is returned as is (no copy).
+    """
+    start_time = time.time()
+    artifact = load_compatible_artifact(model_name, embeddings, artifact_dir)
+    hashes = [content_hash(text) for text in texts]
+    if artifact is not None and hashes == [entry["content_hash"] for entry in artifact.index]:
+        logger.info(f"Dùng {len(texts)} vector từ artifact '{artifact.path}' (thời gian: {time.time() - start_time:.2f}s).")
+        return artifact.vectors
+
+    rows = [artifact.row_by_hash.get(h) if artifact is not None else None for h in hashes]
+    missing = [position for position, row in enumerate(rows) if row is None]
+
+    new_vectors = []
+    missing_texts = [texts[position] for position in missing]
+    for i in range(0, len(missing_texts), batch_size):
+        new_vectors.extend(embeddings.embed_documents(missing_texts[i:i + batch_size]))
+    if artifact is not None:
+        dimension = artifact.vectors.shape[1]
+    elif new_vectors:
+        dimension = len(new_vectors[0])
+    else:
+        dimension = 0
+    matrix = np.empty((len(texts), dimension), dtype=np.float32)
+    found = [position for position, row in enumerate(rows) if row is not None]
+    if found:
+        matrix[found] = artifact.vectors[[rows[position] for position in found]]
+    if missing:
+        matrix[missing] = _normalize(new_vectors)
+    logger.info(
+        f"Vector cho {len(texts)} văn bản: {len(found)} lấy từ artifact, {len(missing)} embed mới "
+        f"(thời gian: {time.time() - start_time:.2f}s)."
+    )
+    return matrix
+
+
+def _write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def export_artifact(chunks, embeddings, model_name, backend=None, corpus_hash=None, output_dir=None, batch_size=64):
+    """
+    Writes the artifact for `chunks` (reusing the rows of an existing artifact whose content did not
+    change). The three files are replaced one by one; the manifest, written last, records checksums of
+    the vectors and the index, so a reader that mixes old and new files gets no artifact (and embeds
+    the texts itself) instead of misaligned rows.
+    """
+    output_dir = output_dir or default_artifact_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    texts = [chunk.get("content", "") for chunk in chunks]
+    # Sao chép ra bộ nhớ: không ghi đè file đang được memory-map
+    vectors = np.array(load_or_embed(texts, embeddings, model_name, artifact_dir=output_dir, batch_size=batch_size), dtype=np.float32)
+
+    index = [{"id": chunk.get("id"), "content_hash": content_hash(text)} for chunk, text in zip(chunks, texts)]
+    index_bytes = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    query_prefix, document_prefix = _prefixes(model_name)
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_name": model_name,
+        "query_prefix": query_prefix,
+        "document_prefix": document_prefix,
+        "backend": backend,
+        "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+        "count": len(vectors),
+        "dtype": "float32",
+        "normalized": True,
+        "corpus_hash": corpus_hash,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "probe_text": PROBE_TEXT,
+        "probe_vector": [round(float(x), 6) for x in _normalize([embeddings.embed_query(PROBE_TEXT)])[0]],
+        "vectors_sha256": _sha256(vectors.data),
+        "index_sha256": _sha256(index_bytes),
+    }
+    _write_atomic(os.path.join(output_dir, VECTORS_FILE_NAME), lambda f: np.save(f, vectors))
+    _write_atomic(os.path.join(output_dir, INDEX_FILE_NAME), lambda f: f.write(index_bytes))
+    _write_atomic(os.path.join(output_dir, MANIFEST_FILE_NAME), lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=4).encode("utf-8")))
+    print(f"Đã lưu artifact {len(vectors)} x {manifest['dimension']} vào '{output_dir}' ({vectors.nbytes / 1e6:.1f} MB).")
+    return manifest
+
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.path.insert(0, BACKEND_DIR)
+    from corpus import DATA_CHUNKS_PATH, corpus_hash, load_chunks
+
+    parser = argparse.ArgumentParser(description="Tạo / kiểm tra artifact embedding của corpus chunk")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--chunks", default=DATA_CHUNKS_PATH, help="File chunk JSON")
+    parser.add_argument("--output", default=None, help="Thư mục artifact (mặc định: backend/data/embeddings/<model>/)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    corpus_chunks = load_chunks(args.chunks)
+    if args.command == "export":
+        from embedding_backends import create_embeddings, EMBEDDING_BACKEND
+        export_artifact(
+            corpus_chunks,
+            create_embeddings(args.model),
+            args.model,
+            backend=EMBEDDING_BACKEND,
+            corpus_hash=corpus_hash(args.chunks),
+            output_dir=args.output,
+        )
+    else:
+        artifact = EmbeddingArtifact.load(args.output or default_artifact_dir(args.model))
+        if artifact is None:
+            print(f"Chưa có artifact cho model '{args.model}'. Chạy: python backend/embedding_artifact.py export")
+            sys.exit(1)
+        manifest = {key: value for key, value in artifact.manifest.items() if key != "probe_vector"}
+        print(json.dumps(manifest, ensure_ascii=False, indent=4))
+        covered = sum(content_hash(chunk.get("content", "")) in artifact.row_by_hash for chunk in corpus_chunks)
+        print(f"Artifact chứa vector cho {covered}/{len(corpus_chunks)} chunk của corpus hiện tại.")
@@ -0,0 +1,88 @@
+import os
+
+from langchain_core.embeddings import Embeddings
+
+# Backend chạy model embedding: "torch" (HuggingFaceEmbeddings / sentence-transformers) hoặc "onnx" (onnxruntime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Thư mục ONNX tùy chỉnh, chỉ áp dụng cho model chính (EMBEDDING_MODEL_NAME); model khác dùng thư mục riêng theo tên
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR")
+PRIMARY_EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true"
+
+# Tiền tố cho câu hỏi / đoạn văn mà một số model được huấn luyện kèm (họ E5: "query: " / "passage: ").
+# Đặt EMBEDDING_QUERY_PREFIX / EMBEDDING_DOCUMENT_PREFIX để ghi đè (kể cả chuỗi rỗng).
+EMBEDDING_QUERY_PREFIX = os.getenv("EMBEDDING_QUERY_PREFIX")
+EMBEDDING_DOCUMENT_PREFIX = os.getenv("EMBEDDING_DOCUMENT_PREFIX")
+_E5_PREFIXES = ("query: ", "passage: ")
+
+
+def embedding_prefixes(model_name):
+    """
+    Returns the (query_prefix, document_prefix) expected by `model_name`.
+    """
+    if EMBEDDING_QUERY_PREFIX is not None or EMBEDDING_DOCUMENT_PREFIX is not None:
+        return EMBEDDING_QUERY_PREFIX or "", EMBEDDING_DOCUMENT_PREFIX or ""
+    base_name = model_name.rsplit("/", 1)[-1].lower()
+    if base_name.startswith(("e5-", "multilingual-e5-")):
+        return _E5_PREFIXES
+    return "", ""
+
+
+class PrefixedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object and prepends the model's query / passage prefixes.
+    """
+
+    def __init__(self, base, query_prefix="", document_prefix=""):
+        self.base = base
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+
+    def embed_query(self, text):
+        return self.base.embed_query(self.query_prefix + text)
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents([self.document_prefix + text for text in texts])
+
+    def embed_queries(self, texts):
+        # Nhiều câu hỏi trong một lần gọi (embed_documents của model gốc, với tiền tố câu hỏi)
+        return self.base.embed_documents([self.query_prefix + text for text in texts])
+
+
+def embed_queries(embeddings, texts):
+    """
+    Embeds several questions in one batched call, with the query prefix when the model uses one.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+
+def onnx_model_dir(model_name):
+    """
+    Returns the directory of the exported ONNX model for `model_name`.
+    """
+    from onnx_embeddings import default_onnx_dir
+    if ONNX_MODEL_DIR and model_name == PRIMARY_EMBEDDING_MODEL_NAME:
+        return ONNX_MODEL_DIR
+    return default_onnx_dir(model_name)
+
+
+def create_embeddings(model_name, backend=None):
+    """
+    Creates the LangChain embeddings object for the configured backend.
+    Heavy libraries are imported only for the backend that is actually used.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        embeddings = OnnxEmbeddings(onnx_model_dir(model_name), quantized=ONNX_QUANTIZED)
+    elif backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    else:
+        raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: '{backend}'. Các giá trị hợp lệ: 'torch', 'onnx'.")
+    query_prefix, document_prefix = embedding_prefixes(model_name)
+    if query_prefix or document_prefix:
+        return PrefixedEmbeddings(embeddings, query_prefix, document_prefix)
+    return embeddings
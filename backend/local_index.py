@@ -0,0 +1,78 @@
+import time
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+
+class LocalVectorIndex:
+    """
+    In-memory exact cosine-similarity index over the chunk corpus (a normalized float32 matrix).
+    Used when RETRIEVER_MODE="local" and for offline batch runs / evaluation without Qdrant.
+    """
+
+    def __init__(self, chunks, vectors, normalized=False):
+        if len(chunks) != len(vectors):
+            raise ValueError(f"Số chunk ({len(chunks)}) và số vector ({len(vectors)}) không khớp.")
+        self.chunks = chunks
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # Vector đã chuẩn hóa (artifact memory-map) được giữ nguyên, không sao chép
+        self.vectors = vectors if normalized else self._normalize(vectors)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.clip(norms, 1e-12, None)
+
+    @classmethod
+    def build(cls, chunks, embeddings, batch_size=64, model_name=None):
+        """
+        Embeds every chunk's content (in batches) and returns the index. With `model_name`, vectors
+        are taken from the precomputed embedding artifact and only new chunks are embedded.
+        """
+        start_time = time.time()
+        texts = [chunk.get("content", "") for chunk in chunks]
+        if model_name:
+            from embedding_artifact import load_or_embed
+            vectors = load_or_embed(texts, embeddings, model_name, batch_size=batch_size)
+            logger.info(f"Đã tạo local index với {len(chunks)} chunks (thời gian: {time.time() - start_time:.2f}s).")
+            return cls(chunks, vectors, normalized=True)
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+        logger.info(f"Đã tạo local index với {len(chunks)} chunks (thời gian: {time.time() - start_time:.2f}s).")
+        return cls(chunks, vectors)
+
+    def search_batch(self, query_vectors, k):
+        """
+        Returns, for each query vector, the top-k (chunk, score) pairs. All queries are scored in one matrix product.
+        """
+        if len(self.chunks) == 0:
+            return [[] for _ in query_vectors]
+        queries = self._normalize(np.asarray(query_vectors, dtype=np.float32))
+        scores = queries @ self.vectors.T
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([(self.chunks[i], float(scores[row, i])) for i in ordered])
+        return results
+
+    def search(self, query_vector, k):
+        return self.search_batch([query_vector], k)[0]
+
+    @staticmethod
+    def to_documents(results):
+        return [
+            Document(
+                page_content=chunk.get("content", ""),
+                metadata={**{key: value for key, value in chunk.items() if key != "content"}, "score": score},
+            )
+            for chunk, score in results
+        ]
@@ -0,0 +1,234 @@
+# --- Backend embedding ONNX (CPU) cho model Sentence Transformers ---
+# Xuất model (mặc định 'all-MiniLM-L6-v2') sang ONNX, tùy chọn lượng tử hóa int8 động, và chạy bằng
+# onnxruntime phía sau cùng interface `Embeddings` của LangChain. Khi phục vụ chỉ cần onnxruntime +
+# tokenizers (không cần import torch / transformers).
+#
+# Cách dùng:
+#     python backend/onnx_embeddings.py export              # xuất fp32 + int8 vào backend/models/onnx/<model>/
+#     python backend/onnx_embeddings.py parity              # so sánh vector với bản PyTorch
+#     python backend/onnx_embeddings.py bench               # đo thời gian khởi động và độ trễ mỗi query
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_MODELS_DIR = os.path.join(BACKEND_DIR, "models", "onnx")
+
+FP32_FILE_NAME = "model.onnx"
+INT8_FILE_NAME = "model.int8.onnx"
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def default_onnx_dir(model_name):
+    return os.path.join(ONNX_MODELS_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name, output_dir=None, quantize=True):
+    """
+    Exports the transformer of a Sentence Transformers model to ONNX (plus an int8 dynamically
+    quantized copy), together with its tokenizer and a manifest describing pooling/normalization.
+    Needs torch and sentence-transformers; only used offline.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = output_dir or default_onnx_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    normalize = any(type(module).__name__ == "Normalize" for module in st_model)
+
+    dummy = tokenizer(["APEC 2025 Gyeongju"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, FP32_FILE_NAME)
+    print(f"Đang xuất '{model_name}' sang ONNX: {fp32_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(output_dir, INT8_FILE_NAME)
+        print(f"Đang lượng tử hóa int8 (dynamic): {int8_path}")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    manifest = {
+        "model_name": model_name,
+        "input_names": input_names,
+        "max_seq_length": st_model.max_seq_length,
+        "pooling": "mean",
+        "normalize": normalize,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    print(f"Đã xuất xong model ONNX vào '{output_dir}'.")
+    return output_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain embeddings backed by an exported ONNX model and onnxruntime (CPU).
+    Reproduces Sentence Transformers mean pooling and L2 normalization.
+    """
+
+    def __init__(self, model_dir, quantized=True, batch_size=32, num_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, MANIFEST_FILE_NAME), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        model_file = INT8_FILE_NAME if quantized else FP32_FILE_NAME
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"Không tìm thấy '{model_path}'. Hãy chạy `python backend/onnx_embeddings.py export` trước."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = self.manifest["input_names"]
+        self.normalize = self.manifest.get("normalize", True)
+        self.batch_size = batch_size
+        self.model_path = model_path
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.manifest["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        last_hidden_state = self.session.run(["last_hidden_state"], feeds)[0]
+
+        # Mean pooling theo attention mask (giống module Pooling của sentence-transformers)
+        mask = attention_mask[..., None].astype(np.float32)
+        vectors = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts):
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[i:i + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+
+def _sample_texts(limit):
+    # Lấy mẫu từ corpus chunk thật + vài câu hỏi ngắn để kiểm tra/đo đạc
+    sys.path.insert(0, BACKEND_DIR)
+    from corpus import DATA_CHUNKS_PATH
+    from quick_replies import all_canned_questions
+
+    texts = [question for question, _ in all_canned_questions()]
+    if os.path.exists(DATA_CHUNKS_PATH):
+        with open(DATA_CHUNKS_PATH, "r", encoding="utf-8") as f:
+            texts.extend(chunk["content"] for chunk in json.load(f) if chunk.get("content"))
+    return texts[:limit]
+
+
+def check_parity(model_name, model_dir, quantized, limit=200):
+    """
+    Compares ONNX vectors against the PyTorch (HuggingFaceEmbeddings) vectors on sample texts.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    texts = _sample_texts(limit)
+    torch_vectors = np.array(HuggingFaceEmbeddings(model_name=model_name).embed_documents(texts))
+    onnx_vectors = np.array(OnnxEmbeddings(model_dir, quantized=quantized).embed_documents(texts))
+
+    cosine = (torch_vectors * onnx_vectors).sum(axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1)
+    )
+    max_abs_diff = float(np.abs(torch_vectors - onnx_vectors).max())
+    threshold = 0.98 if quantized else 0.9999
+    print(f"Parity ({'int8' if quantized else 'fp32'}) trên {len(texts)} câu:")
+    print(f"  cosine nhỏ nhất: {cosine.min():.6f} | trung bình: {cosine.mean():.6f} | sai lệch tuyệt đối lớn nhất: {max_abs_diff:.6f}")
+    passed = bool(cosine.min() >= threshold)
+    print(f"  {'ĐẠT' if passed else 'KHÔNG ĐẠT'} (ngưỡng cosine >= {threshold})")
+    return passed
+
+
+def benchmark(model_name, model_dir, limit=200):
+    """
+    Measures construction (startup) time and per-query latency for the PyTorch, ONNX fp32 and ONNX int8 backends.
+    """
+    texts = _sample_texts(limit)
+
+    def run(label, factory):
+        start = time.perf_counter()
+        backend = factory()
+        startup = time.perf_counter() - start
+        backend.embed_query(texts[0])  # warm-up
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            backend.embed_query(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"  {label:<10} khởi động: {startup:7.2f}s | p50: {p50:7.2f}ms | p95: {p95:7.2f}ms")
+
+    print(f"Benchmark embed_query trên {len(texts)} câu (model: {model_name}):")
+
+    def torch_factory():
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+
+    run("pytorch", torch_factory)
+    run("onnx-fp32", lambda: OnnxEmbeddings(model_dir, quantized=False))
+    if os.path.exists(os.path.join(model_dir, INT8_FILE_NAME)):
+        run("onnx-int8", lambda: OnnxEmbeddings(model_dir, quantized=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xuất / kiểm tra / đo đạc backend embedding ONNX")
+    parser.add_argument("command", choices=["export", "parity", "bench"])
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--model-dir", default=None, help="Thư mục model ONNX (mặc định: backend/models/onnx/<model>)")
+    parser.add_argument("--no-quantize", action="store_true", help="Chỉ xuất/kiểm tra bản fp32")
+    parser.add_argument("--limit", type=int, default=200, help="Số câu mẫu cho parity/bench")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir or default_onnx_dir(args.model)
+    if args.command == "export":
+        export_onnx_model(args.model, model_dir, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        ok = check_parity(args.model, model_dir, quantized=False, limit=args.limit)
+        if not args.no_quantize:
+            ok = check_parity(args.model, model_dir, quantized=True, limit=args.limit) and ok
+        sys.exit(0 if ok else 1)
+    else:
+        benchmark(args.model, model_dir, limit=args.limit)
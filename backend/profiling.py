@@ -0,0 +1,290 @@
+# --- Đo thời gian từng bước của request và lưu lại các request chậm ---
+# Mỗi request /chat* có một trace nhẹ (vài lần gọi perf_counter cho mỗi bước) nên có thể bật thường xuyên
+# trên production. Request chậm hơn PROFILE_SLOW_REQUEST_MS, hoặc gửi kèm header `X-Profile: 1`, được lưu
+# vào ring buffer gồm: thời gian từng bước, kích thước prompt, id các chunk đã truy vấn. Với `X-Profile`,
+# response có thêm header Server-Timing.
+#
+# GET /admin/slow-requests         danh sách các request đã lưu (JSON)
+# GET /admin/slow-requests/folded  dạng "folded stacks" (flamegraph.pl, speedscope, inferno...)
+#
+# Tùy chọn PROFILE_SAMPLER_ENABLED bật thêm một luồng lấy mẫu stack Python (sys._current_frames) theo
+# chu kỳ PROFILE_SAMPLER_INTERVAL giây; kết quả xem ở GET /admin/profile/stacks (cũng ở dạng folded).
+import os
+import sys
+import time
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import Counter, deque
+
+from starlette.datastructures import Headers, MutableHeaders
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "true").lower() not in ("0", "false", "no")
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "3000"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "200"))
+PROFILE_PATH_PREFIXES = tuple(os.getenv("PROFILE_PATH_PREFIXES", "/chat").split(","))
+PROFILE_SAMPLER_ENABLED = os.getenv("PROFILE_SAMPLER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLER_INTERVAL = float(os.getenv("PROFILE_SAMPLER_INTERVAL", "0.01"))
+
+_MAX_ANNOTATION_CHARS = 200
+_MAX_SAMPLED_STACKS = 5000
+_MAX_STACK_DEPTH = 64
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+# Đường dẫn bước hiện tại (tuple) riêng cho từng task asyncio, để các bước lồng nhau đúng cả khi chạy song song
+_current_stage_path = contextvars.ContextVar("current_stage_path", default=())
+
+
+class RequestTrace:
+    """
+    Stage timings and annotations of one request. Stages are recorded as (path, start, duration)
+    where `path` is the tuple of enclosing stage names.
+    """
+
+    def __init__(self, method, path, profiled):
+        self.method = method
+        self.path = path
+        self.profiled = profiled
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.annotations = {}
+        self.status = None
+        self.duration = None
+
+    @property
+    def root(self):
+        return f"{self.method} {self.path}"
+
+    def add_stage(self, path, start, duration):
+        self.stages.append((path, start - self.start, duration))
+
+    def server_timing(self):
+        # Chỉ các bước cấp cao nhất, cộng dồn theo tên
+        totals = {}
+        for path, _, duration in self.stages:
+            if len(path) == 1:
+                totals[path[0]] = totals.get(path[0], 0.0) + duration
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+    def to_dict(self):
+        return {
+            "request": self.root,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duration_ms": round(self.duration * 1000, 2),
+            "status": self.status,
+            "profiled": self.profiled,
+            "stages": [
+                {"stage": "/".join(path), "start_ms": round(start * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for path, start, duration in self.stages
+            ],
+            "annotations": self.annotations,
+        }
+
+    def folded_stacks(self):
+        """
+        Self time (microseconds) per stage path, with the request as the root frame.
+        """
+        durations = Counter()
+        for path, _, duration in self.stages:
+            durations[path] += duration
+        child_time = Counter()
+        for path, duration in durations.items():
+            child_time[path[:-1]] += duration
+        folded = Counter()
+        folded[(self.root,)] = max(0.0, self.duration - child_time[()])
+        for path, duration in durations.items():
+            folded[(self.root, *path)] += max(0.0, duration - child_time[path])
+        return {";".join(frames): int(seconds * 1e6) for frames, seconds in folded.items()}
+
+
+@contextlib.contextmanager
+def trace_stage(name):
+    """
+    Times a pipeline stage of the current request (no-op outside a traced request).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    path = _current_stage_path.get() + (name,)
+    token = _current_stage_path.set(path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(path, start, time.perf_counter() - start)
+        _current_stage_path.reset(token)
+
+
+@contextlib.contextmanager
+def untraced():
+    """
+    Stops recording into the current request's trace (e.g. in a background task spawned by the request).
+    """
+    token = _current_trace.set(None)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(name, seconds):
+    # Ghi một bước đã đo sẵn (ví dụ thời gian chờ trong hàng đợi), kết thúc tại thời điểm gọi
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(_current_stage_path.get() + (name,), time.perf_counter() - seconds, seconds)
+
+
+def annotate(**values):
+    """
+    Attaches values (prompt size, retrieved doc ids, tokens...) to the current request's trace.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    for key, value in values.items():
+        if isinstance(value, str) and len(value) > _MAX_ANNOTATION_CHARS:
+            value = value[:_MAX_ANNOTATION_CHARS] + "…"
+        trace.annotations[key] = value
+
+
+class SlowRequestLog:
+    """
+    Bounded ring buffer of captured request traces.
+    """
+
+    def __init__(self, threshold_ms=PROFILE_SLOW_REQUEST_MS, size=PROFILE_RING_SIZE):
+        self.threshold = threshold_ms / 1000
+        self._traces = deque(maxlen=size)
+        self.observed = 0
+        self.captured = 0
+
+    def observe(self, trace):
+        self.observed += 1
+        if trace.profiled or trace.duration >= self.threshold:
+            self.captured += 1
+            self._traces.append(trace)
+            if not trace.profiled:
+                logger.warning(f"Request chậm {trace.root}: {trace.duration * 1000:.0f}ms ({trace.server_timing()})")
+
+    def dump(self, limit=None):
+        traces = list(self._traces)[-limit:] if limit else list(self._traces)
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "observed": self.observed,
+            "captured": self.captured,
+            "traces": [trace.to_dict() for trace in reversed(traces)],
+        }
+
+    def folded(self):
+        totals = Counter()
+        for trace in list(self._traces):
+            totals.update(trace.folded_stacks())
+        return "\n".join(f"{stack} {micros}" for stack, micros in sorted(totals.items()) if micros > 0) + "\n"
+
+    def clear(self):
+        self._traces.clear()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware opening a RequestTrace for requests under PROFILE_PATH_PREFIXES. The trace ends when
+    the last body chunk is sent (so streamed answers are timed in full) and is handed to `slow_log`.
+    """
+
+    def __init__(self, app, slow_log, path_prefixes=PROFILE_PATH_PREFIXES, enabled=PROFILE_ENABLED):
+        self.app = app
+        self.slow_log = slow_log
+        self.path_prefixes = path_prefixes
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+        profiled = Headers(scope=scope).get("x-profile", "").lower() in ("1", "true", "yes")
+        trace = RequestTrace(scope["method"], scope["path"], profiled)
+        token = _current_trace.set(trace)
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                if profiled:
+                    MutableHeaders(raw=message["headers"])["Server-Timing"] = trace.server_timing() or "total;dur=0"
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and trace.duration is None:
+                trace.duration = time.perf_counter() - trace.start
+                self.slow_log.observe(trace)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            if trace.duration is None:
+                # Lỗi hoặc client ngắt kết nối trước khi gửi xong body
+                trace.duration = time.perf_counter() - trace.start
+                self.slow_log.observe(trace)
+            _current_trace.reset(token)
+
+
+class StackSampler:
+    """
+    Background thread sampling the Python stacks of all other threads every `interval` seconds
+    and counting them as folded stacks (bounded number of distinct stacks).
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLER_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.total_samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        logger.info(f"Đã bật luồng lấy mẫu stack (chu kỳ {self.interval * 1000:.0f}ms).")
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _fold(frame):
+        frames = []
+        while frame is not None and len(frames) < _MAX_STACK_DEPTH:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(thread_names) != len(frames):
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = f"{thread_names.get(thread_id, thread_id)};{self._fold(frame)}"
+                    if stack in self.samples or len(self.samples) < _MAX_SAMPLED_STACKS:
+                        self.samples[stack] += 1
+                    else:
+                        self.samples["[other]"] += 1
+                self.total_samples += 1
+
+    def folded(self, reset=False):
+        with self._lock:
+            lines = "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+            if reset:
+                self.samples.clear()
+                self.total_samples = 0
+        return lines
@@ -0,0 +1,197 @@
+import os
+import hashlib
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+# --- Tiền tố hệ thống cố định ---
+# Phần hướng dẫn này giống hệt nhau cho mọi request và mọi ngôn ngữ, nên được đặt ở đầu
+# prompt (system message) để provider có thể cache context cho phần tiền tố ổn định.
+SYSTEM_PROMPT_PREFIX = """Bạn là một trợ lý chatbot thân thiện, thông tin, và đa ngôn ngữ cho sự kiện APEC 2025.
+Nhiệm vụ của bạn là trả lời các câu hỏi của người dùng một cách chính xác và hữu ích dựa trên thông tin được cung cấp.
+
+**Hướng dẫn trả lời:**
+1.  Sử dụng chỉ các thông tin được cung cấp trong "Data liên quan" để trả lời câu hỏi.
+2.  Nếu ngữ cảnh không chứa đủ thông tin để trả lời câu hỏi, hãy nói rằng "Tôi xin lỗi, tôi không tìm thấy thông tin cụ thể cho câu hỏi này trong dữ liệu của mình. Bạn có muốn hỏi về chủ đề khác không?".
+3.  Tránh đưa ra thông tin không có trong ngữ cảnh.
+4.  Giữ câu trả lời ngắn gọn, trực tiếp và tập trung vào câu hỏi."""
+
+LANGUAGE_INSTRUCTIONS = {
+    "vi": "Hãy trả lời câu hỏi bằng tiếng Việt.",
+    "en": "Please answer the question in English.",
+    "default": "Please answer the question in English if possible.",
+}
+
+HUMAN_TEMPLATE = """**Data liên quan:**
+{context}
+
+**Câu hỏi của người dùng:**
+{question}"""
+
+# Prompt gốc (một message duy nhất, hướng dẫn nằm sau context) - giữ lại làm nhánh đối chứng cho A/B
+LEGACY_PROMPT_TEMPLATE = """
+    Bạn là một trợ lý chatbot thân thiện, thông tin, và đa ngôn ngữ cho sự kiện APEC 2025.
+    Nhiệm vụ của bạn là trả lời các câu hỏi của người dùng một cách chính xác và hữu ích dựa trên thông tin được cung cấp.
+
+    **Data liên quan:**
+    {{context}}
+
+    **Câu hỏi của người dùng:**
+    {{question}}
+
+    ---
+    **Hướng dẫn trả lời:**
+    1.  Sử dụng chỉ các thông tin được cung cấp trong "Ngữ cảnh liên quan" để trả lời câu hỏi.
+    2.  Nếu ngữ cảnh không chứa đủ thông tin để trả lời câu hỏi, hãy nói rằng "Tôi xin lỗi, tôi không tìm thấy thông tin cụ thể cho câu hỏi này trong dữ liệu của mình. Bạn có muốn hỏi về chủ đề khác không?".
+    3.  **{language_instruction}**
+    4.  Tránh đưa ra thông tin không có trong ngữ cảnh.
+    5.  Giữ câu trả lời ngắn gọn, trực tiếp và tập trung vào câu hỏi.
+    """
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token) used for sizing prompts and contexts offline.
+    """
+    return (len(text) + 3) // 4
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    A prompt template compiled for one (version, language) pair.
+    Only `context` and `question` remain to be filled in per request.
+    """
+    version: str
+    lang: str
+    system_prompt: str | None
+    human_template: str
+
+    def to_messages(self, context: str, question: str) -> list[tuple[str, str]]:
+        """
+        Returns the (role, content) message list accepted by LangChain chat models.
+        """
+        human = self.human_template.format(context=context, question=question)
+        if self.system_prompt is None:
+            return [("human", human)]
+        return [("system", self.system_prompt), ("human", human)]
+
+
+def _compile_v1(lang: str) -> CompiledPrompt:
+    # Điền sẵn language_instruction một lần, chỉ còn lại {context} và {question}
+    template = LEGACY_PROMPT_TEMPLATE.replace("{language_instruction}", LANGUAGE_INSTRUCTIONS[lang])
+    template = template.replace("{{context}}", "{context}").replace("{{question}}", "{question}")
+    return CompiledPrompt(version="v1", lang=lang, system_prompt=None, human_template=template)
+
+
+def _compile_v2(lang: str) -> CompiledPrompt:
+    # Chỉ dẫn ngôn ngữ được nối vào CUỐI system prompt để phần tiền tố giữ nguyên giữa các ngôn ngữ
+    system_prompt = f"{SYSTEM_PROMPT_PREFIX}\n5.  **{LANGUAGE_INSTRUCTIONS[lang]}**"
+    return CompiledPrompt(version="v2", lang=lang, system_prompt=system_prompt, human_template=HUMAN_TEMPLATE)
+
+
+PROMPT_COMPILERS = {
+    "v1": _compile_v1,
+    "v2": _compile_v2,
+}
+
+
+def parse_ab_weights(raw: str | None) -> dict[str, int]:
+    """
+    Parses an A/B split such as "v1:10,v2:90" into {"v1": 10, "v2": 90}.
+    """
+    weights = {}
+    if not raw:
+        return weights
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        version, _, weight = part.partition(":")
+        version = version.strip()
+        if version not in PROMPT_COMPILERS:
+            raise ValueError(f"PROMPT_AB_WEIGHTS chứa phiên bản prompt không tồn tại: '{version}'")
+        weights[version] = int(weight or 0)
+    if weights and sum(weights.values()) <= 0:
+        raise ValueError("PROMPT_AB_WEIGHTS phải có tổng trọng số lớn hơn 0.")
+    return weights
+
+
+class PromptRegistry:
+    """
+    Holds every prompt version precompiled for every supported language,
+    and picks the version to use for a request (fixed default or A/B split).
+    """
+
+    def __init__(self, default_version: str = "v2", ab_weights: dict[str, int] | None = None):
+        if default_version not in PROMPT_COMPILERS:
+            raise ValueError(f"PROMPT_VERSION không hợp lệ: '{default_version}'. Các giá trị hợp lệ: {list(PROMPT_COMPILERS)}")
+        self.default_version = default_version
+        self.ab_weights = {v: w for v, w in (ab_weights or {}).items() if w > 0}
+        self._compiled = {
+            (version, lang): compile_fn(lang)
+            for version, compile_fn in PROMPT_COMPILERS.items()
+            for lang in LANGUAGE_INSTRUCTIONS
+        }
+
+    @property
+    def static_prefix(self) -> str:
+        """
+        The byte-identical system prompt prefix shared by all requests (for provider-side context caching).
+        """
+        return SYSTEM_PROMPT_PREFIX
+
+    @property
+    def static_prefix_fingerprint(self) -> str:
+        return hashlib.sha256(SYSTEM_PROMPT_PREFIX.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash of every compiled template plus the version routing (default version and A/B split):
+        changes whenever the prompt a cached answer was generated with may have changed.
+        """
+        digest = hashlib.sha256()
+        for (version, lang), compiled in sorted(self._compiled.items()):
+            for part in (version, lang, compiled.system_prompt or "", compiled.human_template):
+                digest.update(part.encode("utf-8") + b"\0")
+        digest.update(self.default_version.encode("utf-8") + b"\0")
+        digest.update(repr(sorted(self.ab_weights.items())).encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    def get(self, lang: str, version: str | None = None) -> CompiledPrompt:
+        lang_key = lang if lang in LANGUAGE_INSTRUCTIONS else "default"
+        return self._compiled[(version or self.default_version, lang_key)]
+
+    def select(self, lang: str, routing_key: str) -> CompiledPrompt:
+        """
+        Selects the prompt for a request. With an A/B split configured, the version is
+        chosen deterministically from `routing_key`, so the same question always lands
+        in the same bucket.
+        """
+        if not self.ab_weights:
+            return self.get(lang)
+        total = sum(self.ab_weights.values())
+        bucket = int(hashlib.sha1(routing_key.encode("utf-8")).hexdigest(), 16) % total
+        for version, weight in self.ab_weights.items():
+            if bucket < weight:
+                return self.get(lang, version)
+            bucket -= weight
+        return self.get(lang)
+
+
+def build_prompt_registry() -> PromptRegistry:
+    """
+    Builds the registry from PROMPT_VERSION and PROMPT_AB_WEIGHTS environment variables.
+    """
+    registry = PromptRegistry(
+        default_version=os.getenv("PROMPT_VERSION", "v2"),
+        ab_weights=parse_ab_weights(os.getenv("PROMPT_AB_WEIGHTS")),
+    )
+    logger.info(
+        f"Đã biên dịch {len(registry._compiled)} prompt template "
+        f"(mặc định: {registry.default_version}, A/B: {registry.ab_weights or 'tắt'}, "
+        f"prefix fingerprint: {registry.static_prefix_fingerprint}, fingerprint: {registry.fingerprint})."
+    )
+    return registry
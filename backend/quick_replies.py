@@ -0,0 +1,151 @@
+# --- Dữ liệu gợi ý nhanh (quick replies) ---
+# Tách khỏi app.py để job tạo sẵn câu trả lời (answer_index.py) có thể liệt kê toàn bộ câu hỏi cố định.
+
+# Gợi ý chung ban đầu (sẽ được ưu tiên nếu không có gợi ý cụ thể nào khác)
+GENERAL_SUGGESTIONS = {
+    "vi": [
+        "Giới thiệu APEC 2025",
+        "Lịch trình các cuộc họp chính",
+        "Thông tin về địa điểm APEC",
+        "Các bài báo mới nhất",
+        "Hỗ trợ nhập cảnh"
+    ],
+    "en": [
+        "Overview of APEC 2025",
+        "Key meetings schedule",
+        "APEC venue information",
+        "Latest press releases",
+        "Entry support"
+    ],
+}
+
+# Gợi ý dựa trên các chủ đề chính trong dữ liệu: (từ khóa kích hoạt, danh sách gợi ý)
+TOPIC_SUGGESTIONS = {
+    "vi": [
+        (["apec", "tổng quan", "giới thiệu"], [
+            "APEC là gì?",
+            "Tầm nhìn APEC 2040",
+            "Các nền kinh tế thành viên APEC",
+            "Đóng góp của Hàn Quốc cho APEC",
+            "Biểu tượng và chủ đề APEC 2025"
+        ]),
+        (["lịch", "sự kiện", "cuộc họp"], [
+            "Lịch trình các cuộc họp chính",
+            "Các sự kiện bên lề APEC",
+            "Họp SOM1 diễn ra khi nào?"
+        ]),
+        (["địa điểm", "tổ chức", "nơi"], [
+            "Giới thiệu về Gyeongju",
+            "Thông tin về Jeju",
+            "Khám phá Incheon",
+            "Địa điểm ở Busan",
+            "Địa điểm ở Seoul"
+        ]),
+        (["thủ tục", "nhập cảnh", "visa", "di chuyển"], [
+            "Thông tin di chuyển đến Gyeongju",
+            "Di chuyển nội địa ở Jeju",
+            "Thông tin thực tế APEC (khí hậu, tiền tệ)",
+            "Số điện thoại khẩn cấp"
+        ]),
+        (["tin tức", "báo chí", "mới nhất"], [
+            "Đọc các thông cáo báo chí mới",
+            "Tin tức về cuộc họp MRT",
+            "Tin tức về SOM2 Jeju"
+        ]),
+        (["văn hóa", "ẩm thực", "du lịch"], [
+            "Điểm tham quan ở Gyeongju",
+            "Văn hóa & Thiên nhiên Jeju",
+            "Du lịch chủ đề ở Jeju",
+            "Địa điểm ăn uống ở Incheon",
+            "Địa điểm tham quan ở Incheon"
+        ]),
+    ],
+    "en": [
+        (["apec", "overview", "introduction"], [
+            "What is APEC?",
+            "APEC 2040 Vision",
+            "APEC member economies",
+            "Korea's contribution to APEC",
+            "APEC 2025 Emblem and Theme"
+        ]),
+        (["schedule", "event", "meetings"], [
+            "Key meetings schedule",
+            "APEC Side Events",
+            "When is SOM1?"
+        ]),
+        (["location", "where", "venue"], [
+            "About Gyeongju",
+            "About Jeju",
+            "Explore Incheon",
+            "About Busan",
+            "About Seoul"
+        ]),
+        (["procedure", "entry", "visa", "travel"], [
+            "Transportation to Gyeongju",
+            "Jeju domestic travel",
+            "Practical APEC information (climate, currency)",
+            "Emergency phone numbers"
+        ]),
+        (["news", "press", "latest"], [
+            "Read latest press releases",
+            "News about MRT Meeting",
+            "News about SOM2 Jeju"
+        ]),
+        (["culture", "cuisine", "tourism", "attractions"], [
+            "Gyeongju attractions",
+            "Jeju Nature & Culture",
+            "Jeju themed travel",
+            "Incheon local eateries",
+            "Incheon attractions"
+        ]),
+    ],
+}
+
+# Các gợi ý ban đầu hiển thị trên giao diện demo: demo/app_streamlit.py lấy danh sách này qua GET /chat/suggestions
+DEMO_INITIAL_SUGGESTIONS = {
+    "vi": [
+        "APEC 2025 tổ chức ở đâu?",
+        "Lịch trình chính của hội nghị?",
+        "Các chủ đề thảo luận chính là gì?",
+        "Giới thiệu về văn hóa Việt Nam ở Phú Quốc?",
+        "Thông tin về các thành viên APEC?"
+    ],
+}
+
+
+def get_initial_suggestions(lang: str) -> list:
+    """
+    Returns the suggestions shown before the first question (Vietnamese when `lang` has none).
+    """
+    return DEMO_INITIAL_SUGGESTIONS.get(lang) or DEMO_INITIAL_SUGGESTIONS["vi"]
+
+
+def get_contextual_quick_replies(user_message: str, lang: str) -> list:
+    message = user_message.lower()
+
+    suggestions = []
+    for keywords, topic_suggestions in TOPIC_SUGGESTIONS.get(lang, []):
+        if any(keyword in message for keyword in keywords):
+            suggestions.extend(topic_suggestions)
+
+    unique_suggestions = list(dict.fromkeys(suggestions))
+
+    if not unique_suggestions:
+        return GENERAL_SUGGESTIONS["vi"] if lang == "vi" else GENERAL_SUGGESTIONS["en"]
+
+    return unique_suggestions[:5]
+
+
+def all_canned_questions() -> list[tuple[str, str]]:
+    """
+    Returns every fixed suggestion the UI can show, as (question, lang) pairs without duplicates.
+    """
+    pairs = []
+    for lang, questions in GENERAL_SUGGESTIONS.items():
+        pairs.extend((q, lang) for q in questions)
+    for lang, rules in TOPIC_SUGGESTIONS.items():
+        for _, questions in rules:
+            pairs.extend((q, lang) for q in questions)
+    for lang, questions in DEMO_INITIAL_SUGGESTIONS.items():
+        pairs.extend((q, lang) for q in questions)
+    return list(dict.fromkeys(pairs))
@@ -0,0 +1,217 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import contextlib
+from collections import OrderedDict, deque
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+# --- Cấu hình giới hạn tốc độ và lập lịch công bằng (in-memory, riêng cho từng worker) ---
+# Tắt mặc định: demo Streamlit gọi backend từ một IP duy nhất nên mọi người dùng sẽ chung một bucket.
+# Chỉ bật khi client gửi X-API-Key riêng hoặc backend chạy sau reverse proxy (TRUST_PROXY_HEADERS).
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Chỉ tin header X-Forwarded-For khi backend chạy sau reverse proxy
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() in ("1", "true", "yes")
+
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "8"))
+SCHEDULER_MAX_QUEUE_PER_CLIENT = int(os.getenv("SCHEDULER_MAX_QUEUE_PER_CLIENT", "20"))
+SCHEDULER_QUEUE_TIMEOUT = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "30"))
+
+
+def client_key_for(headers, client_host):
+    """
+    Identifies the caller: the API key (hashed, never stored in clear) when `X-API-Key` is sent,
+    otherwise the client IP.
+    """
+    api_key = headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    if TRUST_PROXY_HEADERS and headers.get("x-forwarded-for"):
+        return "ip:" + headers["x-forwarded-for"].split(",")[0].strip()
+    return "ip:" + (client_host or "unknown")
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a client is over its token bucket or its scheduler queue is full.
+    """
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity, now):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = now
+
+    def try_acquire(self, cost, now):
+        """
+        Takes `cost` tokens if available. Returns 0 on success, otherwise the seconds until enough tokens refill.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Per-client token buckets (refill `per_minute` tokens per minute, up to `burst`), kept in an LRU
+    of at most `max_clients` entries.
+    """
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_by_client = {}
+
+    def check(self, client_key, cost=1):
+        """
+        Charges `cost` requests to the client; raises RateLimitExceeded when the bucket is empty.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(client_key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, max(self.burst, cost), now)
+            self._buckets[client_key] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_key)
+        retry_after = bucket.try_acquire(cost, now)
+        if retry_after:
+            self.rejected += 1
+            self.rejected_by_client[client_key] = self.rejected_by_client.get(client_key, 0) + 1
+            raise RateLimitExceeded(retry_after, "rate_limit")
+        self.allowed += 1
+
+    def stats(self, top=10):
+        top_rejected = sorted(self.rejected_by_client.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "per_minute": self.rate * 60,
+            "burst": self.burst,
+            "tracked_clients": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "top_rejected_clients": dict(top_rejected),
+        }
+
+
+class FairScheduler:
+    """
+    Limits concurrent pipeline runs (retrieval + LLM) to `max_concurrent` and hands free slots to waiting
+    clients fairly: the waiting client with the fewest running requests goes first, ties in round-robin
+    order. A client sending a burst therefore queues behind clients with a single interactive request.
+    """
+
+    def __init__(self, max_concurrent=PIPELINE_CONCURRENCY, max_queue_per_client=SCHEDULER_MAX_QUEUE_PER_CLIENT, queue_timeout=SCHEDULER_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._active = {}
+        self._waiting = OrderedDict()  # client_key -> deque[Future]
+        self.granted = 0
+        self.rejected_queue_full = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _queued(self, client_key):
+        return len(self._waiting.get(client_key, ()))
+
+    def _dispatch(self):
+        # Cấp slot trống cho client đang chờ có ít request đang chạy nhất (hòa thì theo vòng)
+        while self._running < self.max_concurrent and self._waiting:
+            client_key = min(self._waiting, key=lambda key: self._active.get(key, 0))
+            waiters = self._waiting[client_key]
+            future = waiters.popleft()
+            if not waiters:
+                del self._waiting[client_key]
+            else:
+                self._waiting.move_to_end(client_key)
+            if future.done():
+                continue
+            self._running += 1
+            self._active[client_key] = self._active.get(client_key, 0) + 1
+            future.set_result(None)
+
+    def _forget_waiter(self, client_key, future):
+        waiters = self._waiting.get(client_key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiting[client_key]
+
+    def _release(self, client_key):
+        self._running -= 1
+        self._active[client_key] -= 1
+        if not self._active[client_key]:
+            del self._active[client_key]
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, client_key):
+        """
+        Waits for a pipeline slot for `client_key`. Raises RateLimitExceeded if the client's queue is full
+        or the wait exceeds `queue_timeout`.
+        """
+        if self._queued(client_key) >= self.max_queue_per_client:
+            self.rejected_queue_full += 1
+            raise RateLimitExceeded(1.0, "queue_full")
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client_key, deque()).append(future)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot đã được cấp đúng lúc hết giờ / bị hủy: trả lại slot
+                self._release(client_key)
+            else:
+                future.cancel()
+                self._forget_waiter(client_key, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise RateLimitExceeded(self.queue_timeout, "queue_timeout") from None
+            raise
+        waited = time.monotonic() - start
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > 1:
+            logger.info(f"Client {client_key} chờ {waited:.2f}s để được xử lý (đang chạy: {self._running}/{self.max_concurrent}).")
+        try:
+            yield
+        finally:
+            self._release(client_key)
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "queued": sum(len(waiters) for waiters in self._waiting.values()),
+            "queued_by_client": {key: len(waiters) for key, waiters in self._waiting.items()},
+            "granted": self.granted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "timed_out": self.timed_out,
+            "mean_wait_s": self.total_wait / self.granted if self.granted else 0.0,
+            "max_wait_s": self.max_wait,
+        }
@@ -0,0 +1,546 @@
+# --- Job làm mới dữ liệu: crawl → chunk → dedup → embed → upload → publish ---
+# Gộp data_preparation.py (crawl, chunk, khử trùng lặp) và embedding.py (embed, tải lên Qdrant) thành một job
+# chạy lại được nhiều lần trong ngày mà không cần thao tác tay:
+#   * crawl và chunk chạy dạng luồng: mỗi trang được chunk ngay khi tải xong, trong lúc các trang khác còn đang tải
+#   * trang có nội dung chính không đổi so với lần chạy trước dùng lại chunk cũ (giữ nguyên id); nếu không có trang
+#     nào thay đổi, job dừng ngay sau bước crawl
+#   * trang tải lỗi dùng lại bản HTML đang phục vụ, nên lỗi mạng tạm thời không làm mất dữ liệu
+#   * embed qua artifact (embedding_artifact.py): chỉ các chunk mới / đã sửa được embed lại
+#   * tải lên Qdrant theo blue/green (embedding.reindex_blue_green); file chunk và HTML đang phục vụ chỉ được thay
+#     sau khi mọi bước trước đã thành công
+# Mỗi lần chạy có thư mục riêng <REFRESH_DIR>/<run_id>/ (html/, chunks/<trang>.json, apec_all_chunks.json) và
+# state.json ghi trạng thái, thời gian, số liệu từng bước và từng trang. Lần chạy lỗi hoặc bị ngắt được tiếp tục
+# bằng --resume (bỏ qua các bước / trang đã xong).
+#
+# Cách dùng:
+#     python backend/refresh_pipeline.py                  # chạy một lần
+#     python backend/refresh_pipeline.py --resume         # tiếp tục lần chạy dở gần nhất
+#     python backend/refresh_pipeline.py --every 3600     # chạy định kỳ (giây)
+#     python backend/refresh_pipeline.py --report         # báo cáo thời gian của lần chạy gần nhất
+# Hoặc đặt REFRESH_PIPELINE_INTERVAL để backend (app.py) tự chạy job trong tiến trình của nó.
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import traceback
+import contextlib
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from corpus import DATA_DIR, DATA_CHUNKS_PATH, corpus_hash
+from dedup import deduplicate_chunks, print_report, DEFAULT_THRESHOLD
+from structured_chunker import DEFAULT_MAX_CHUNK_CHARS
+from data_preparation import SOURCE_URLS, CHUNK_STRATEGIES, crawl_page, crawled_file_name, chunk_html_page, extract_main_content_html
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+REFRESH_DIR = os.getenv("REFRESH_DIR", os.path.join(DATA_DIR, "refresh"))
+REFRESH_HTML_DIR = os.getenv("REFRESH_HTML_DIR", os.path.join(DATA_DIR, "crawled_raw_html"))
+REFRESH_CHUNKS_PATH = os.getenv("REFRESH_CHUNKS_PATH", DATA_CHUNKS_PATH)
+# File JSON {tên trang: URL}; để trống thì dùng SOURCE_URLS trong data_preparation.py
+REFRESH_SOURCES_PATH = os.getenv("REFRESH_SOURCES_PATH", "")
+REFRESH_CRAWL_WORKERS = int(os.getenv("REFRESH_CRAWL_WORKERS", "4"))
+# Số thư mục lần chạy giữ lại (lần chạy đã phục vụ gần nhất luôn được giữ để dùng lại chunk)
+REFRESH_KEEP_RUNS = int(os.getenv("REFRESH_KEEP_RUNS", "5"))
+# "auto": tải lên Qdrant khi có QDRANT_CLOUD_URL; "true" / "false" để bật / tắt hẳn
+REFRESH_UPLOAD = os.getenv("REFRESH_UPLOAD", "auto").lower()
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "structured")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", str(DEFAULT_MAX_CHUNK_CHARS)))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD))  # 0 để tắt
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+STAGES = ("crawl", "chunk", "dedup", "embed", "upload", "publish")
+STATE_FILE_NAME = "state.json"
+RUN_CHUNKS_FILE_NAME = "apec_all_chunks.json"
+
+# Đổi một trong các thiết lập này thì chunk / vector cũ không còn dùng lại được
+_CORPUS_SETTINGS = ("sources_path", "chunk_strategy", "chunk_size", "chunk_overlap", "dedup_threshold", "model_name")
+
+
+@dataclass
+class RefreshConfig:
+    """
+    Paths and settings of a refresh run (defaults from the environment). Stored in the run's state.json
+    so that a resumed run keeps its original settings.
+    """
+    refresh_dir: str = REFRESH_DIR
+    html_dir: str = REFRESH_HTML_DIR
+    chunks_path: str = REFRESH_CHUNKS_PATH
+    sources_path: str = REFRESH_SOURCES_PATH
+    crawl_workers: int = REFRESH_CRAWL_WORKERS
+    keep_runs: int = REFRESH_KEEP_RUNS
+    upload: str = REFRESH_UPLOAD
+    chunk_strategy: str = CHUNK_STRATEGY
+    chunk_size: int = CHUNK_SIZE
+    chunk_overlap: int = CHUNK_OVERLAP
+    dedup_threshold: float = DEDUP_THRESHOLD
+    model_name: str = EMBEDDING_MODEL_NAME
+
+    def __post_init__(self):
+        if self.chunk_strategy not in CHUNK_STRATEGIES:
+            raise ValueError(f"Chiến lược chunk không hợp lệ: '{self.chunk_strategy}'. Các giá trị hợp lệ: {', '.join(CHUNK_STRATEGIES)}")
+
+    def sources(self):
+        if not self.sources_path:
+            return dict(SOURCE_URLS)
+        with open(self.sources_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def upload_enabled(self):
+        if self.upload == "auto":
+            return bool(os.getenv("QDRANT_CLOUD_URL"))
+        return self.upload in ("1", "true", "yes")
+
+
+def _write_json_atomic(path, payload):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _copy_atomic(source, destination):
+    # Ghi ra file tạm rồi đổi tên: backend không bao giờ đọc phải file đang ghi dở
+    tmp_path = destination + ".tmp"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def page_content_hash(html_file):
+    # Hash phần nội dung chính (div#contents), bỏ qua thay đổi ở menu, script, token... của trang
+    main_html = extract_main_content_html(html_file) or ""
+    return hashlib.sha256(main_html.encode("utf-8")).hexdigest()[:16]
+
+
+class RefreshRun:
+    """
+    One pipeline run: its directory (html/, chunks/, merged chunk file) and the state.json checkpoint.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+        self.html_dir = os.path.join(path, "html")
+        self.chunks_dir = os.path.join(path, "chunks")
+        self.chunks_path = os.path.join(path, RUN_CHUNKS_FILE_NAME)
+
+    @property
+    def run_id(self):
+        return self.state["run_id"]
+
+    @classmethod
+    def create(cls, config):
+        run_id = time.strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(config.refresh_dir, run_id)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(config.refresh_dir, f"{run_id}-{suffix}")
+            suffix += 1
+        state = {
+            "run_id": os.path.basename(path),
+            "status": "running",
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "finished_at": None,
+            "seconds": 0.0,
+            "config": asdict(config),
+            "stages": {},
+            "pages": {},
+        }
+        run = cls(path, state)
+        os.makedirs(run.html_dir, exist_ok=True)
+        os.makedirs(run.chunks_dir, exist_ok=True)
+        run.save()
+        return run
+
+    @classmethod
+    def load(cls, path):
+        state_path = os.path.join(path, STATE_FILE_NAME)
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        _write_json_atomic(os.path.join(self.path, STATE_FILE_NAME), self.state)
+
+    def page_chunks_path(self, name):
+        return os.path.join(self.chunks_dir, f"{name}.json")
+
+    def stage_done(self, name):
+        return self.state["stages"].get(name, {}).get("status") in ("done", "skipped")
+
+    def begin_stage(self, name):
+        self.state["stages"][name] = {"status": "running", "seconds": 0.0, "details": {}}
+        self.save()
+        return self.state["stages"][name]
+
+    def end_stage(self, name, start, status="done", error=None):
+        info = self.state["stages"][name]
+        info["status"] = status
+        info["seconds"] = round(time.perf_counter() - start, 3)
+        if error is not None:
+            info["error"] = error
+        self.save()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Runs a stage: records its status, wall time and details (the yielded dict) in state.json.
+        """
+        info = self.begin_stage(name)
+        start = time.perf_counter()
+        try:
+            yield info["details"]
+        except BaseException as e:
+            self.end_stage(name, start, status="failed", error=str(e) or type(e).__name__)
+            raise
+        self.end_stage(name, start, status=info["status"] if info["status"] == "skipped" else "done")
+
+
+def list_runs(refresh_dir=REFRESH_DIR):
+    if not os.path.isdir(refresh_dir):
+        return []
+    runs = [RefreshRun.load(os.path.join(refresh_dir, name)) for name in sorted(os.listdir(refresh_dir))]
+    return [run for run in runs if run is not None]
+
+
+def latest_run(refresh_dir=REFRESH_DIR, statuses=None):
+    for run in reversed(list_runs(refresh_dir)):
+        if statuses is None or run.state["status"] in statuses:
+            return run
+    return None
+
+
+@contextlib.contextmanager
+def refresh_lock(refresh_dir=REFRESH_DIR):
+    """
+    Non-blocking inter-process lock in `refresh_dir`. Yields True if this process holds it.
+    On platforms without fcntl (Windows) every process is allowed to run.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(refresh_dir, exist_ok=True)
+    with open(os.path.join(refresh_dir, ".lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# --- Các bước ---
+
+def crawl_and_chunk(run, config, sources, previous):
+    """
+    Crawls the sources in parallel and chunks each page as soon as it is downloaded. Pages whose main
+    content is unchanged since `previous` reuse its chunk file; pages that fail to download fall back
+    to the published HTML. Pages already done (resumed run) are skipped.
+    """
+    pages = run.state["pages"]
+    previous_pages = previous.state["pages"] if previous is not None else {}
+    crawl_info, chunk_info = run.begin_stage("crawl"), run.begin_stage("chunk")
+    crawl_details, chunk_details = crawl_info["details"], chunk_info["details"]
+    crawl_details.update(pages=0, failed=0, fallback=0, busy_seconds=0.0)
+    chunk_details.update(chunked=0, reused=0, chunks=0, busy_seconds=0.0)
+    start = time.perf_counter()
+
+    def fetch(name, url):
+        fetch_start = time.perf_counter()
+        path = crawl_page(name, url, run.html_dir, overwrite=True)
+        return name, path, time.perf_counter() - fetch_start
+
+    todo = {name: url for name, url in sources.items() if not pages.get(name, {}).get("done")}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, config.crawl_workers)) as executor:
+            futures = [executor.submit(fetch, name, url) for name, url in todo.items()]
+            for future in as_completed(futures):
+                name, path, fetch_seconds = future.result()
+                crawl_details["pages"] += 1
+                crawl_details["busy_seconds"] = round(crawl_details["busy_seconds"] + fetch_seconds, 3)
+                page = {"file": crawled_file_name(name), "fallback": False}
+                if path is None:
+                    crawl_details["failed"] += 1
+                    published = os.path.join(config.html_dir, crawled_file_name(name))
+                    if not os.path.exists(published):
+                        logger.warning(f"Refresh: không tải được '{name}' và chưa có bản cũ; bỏ qua trang này.")
+                        pages[name] = {**page, "done": True, "missing": True}
+                        run.save()
+                        continue
+                    path = os.path.join(run.html_dir, page["file"])
+                    shutil.copyfile(published, path)
+                    page["fallback"] = True
+                    crawl_details["fallback"] += 1
+
+                # Chunk ngay trong luồng chính, song song với các trang còn đang tải
+                chunk_start = time.perf_counter()
+                page["hash"] = page_content_hash(path)
+                previous_page = previous_pages.get(name)
+                previous_chunks = previous.page_chunks_path(name) if previous is not None else None
+                can_reuse = previous_chunks is not None and os.path.exists(previous_chunks)
+                page["changed"] = previous_page is None or previous_page.get("hash") != page["hash"]
+                if not page["changed"] and can_reuse:
+                    shutil.copyfile(previous_chunks, run.page_chunks_path(name))
+                    page["chunks"], page["reused"] = previous_page.get("chunks", 0), True
+                    chunk_details["reused"] += 1
+                else:
+                    try:
+                        chunks = chunk_html_page(path, chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap, strategy=config.chunk_strategy)
+                    except Exception as e:
+                        if not can_reuse:
+                            raise
+                        # Lỗi khi chunk bản mới: giữ chunk của lần trước thay vì làm mất trang
+                        logger.error(f"Refresh: lỗi khi chunk '{name}': {e}. Dùng lại chunk của lần chạy trước.")
+                        shutil.copyfile(previous_chunks, run.page_chunks_path(name))
+                        page["chunks"], page["reused"], page["stale"] = previous_page.get("chunks", 0), True, True
+                        chunk_details["reused"] += 1
+                    else:
+                        _write_json_atomic(run.page_chunks_path(name), chunks)
+                        page["chunks"], page["reused"] = len(chunks), False
+                        chunk_details["chunked"] += 1
+                chunk_details["chunks"] += page["chunks"]
+                chunk_details["busy_seconds"] = round(chunk_details["busy_seconds"] + time.perf_counter() - chunk_start, 3)
+                pages[name] = {**page, "done": True}
+                run.save()
+    except BaseException as e:
+        run.end_stage("crawl", start, status="failed", error=str(e) or type(e).__name__)
+        run.end_stage("chunk", start, status="failed", error=str(e) or type(e).__name__)
+        raise
+    run.end_stage("crawl", start)
+    run.end_stage("chunk", start)
+
+
+def corpus_changed(run, config, previous):
+    """
+    Whether this run's pages (or corpus settings) differ from the last published run.
+    """
+    if previous is None:
+        return True
+    previous_config = previous.state.get("config", {})
+    if any(previous_config.get(key) != getattr(config, key) for key in _CORPUS_SETTINGS):
+        return True
+    current = {name: page.get("hash") for name, page in run.state["pages"].items() if not page.get("missing")}
+    published = {name: page.get("hash") for name, page in previous.state["pages"].items() if not page.get("missing")}
+    return current != published
+
+
+def merge_and_dedup(run, config, sources):
+    with run.stage("dedup") as details:
+        chunks = []
+        for name in sources:
+            path = run.page_chunks_path(name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    chunks.extend(json.load(f))
+        details["chunks_before"] = len(chunks)
+        if config.dedup_threshold:
+            chunks, report = deduplicate_chunks(chunks, threshold=config.dedup_threshold)
+            print_report(report)
+            details.update(removed=report["removed"], clusters=report["clusters"])
+        details["chunks_after"] = len(chunks)
+        if not chunks:
+            raise RuntimeError("Không có chunk nào sau khi crawl; giữ nguyên dữ liệu đang phục vụ.")
+        _write_json_atomic(run.chunks_path, chunks)
+
+
+def embed_chunks(run, config, chunks, embeddings):
+    from embedding_artifact import export_artifact, load_compatible_artifact, content_hash
+    from embedding_backends import EMBEDDING_BACKEND
+
+    with run.stage("embed") as details:
+        artifact = load_compatible_artifact(config.model_name)
+        reused = sum(content_hash(chunk.get("content", "")) in artifact.row_by_hash for chunk in chunks) if artifact is not None else 0
+        manifest = export_artifact(chunks, embeddings, config.model_name, backend=EMBEDDING_BACKEND, corpus_hash=corpus_hash(run.chunks_path))
+        details.update(chunks=len(chunks), reused_vectors=reused, embedded=len(chunks) - reused, dimension=manifest["dimension"])
+
+
+def upload_chunks(run, config, chunks, embeddings):
+    with run.stage("upload") as details:
+        if not config.upload_enabled():
+            run.state["stages"]["upload"]["status"] = "skipped"
+            details["reason"] = "REFRESH_UPLOAD tắt hoặc chưa có QDRANT_CLOUD_URL"
+            return
+        # embedding.py kiểm tra biến môi trường Qdrant khi import
+        import embedding as qdrant_indexer
+
+        documents = qdrant_indexer.documents_from_chunks(chunks)
+        client = qdrant_indexer.get_qdrant_client()
+        collection_name = qdrant_indexer.reindex_blue_green(documents, embeddings, client, model_name=config.model_name)
+        if collection_name is None:
+            raise RuntimeError("Collection mới không đạt kiểm tra; alias Qdrant được giữ nguyên.")
+        details["collection"] = collection_name
+
+
+def publish(run, config):
+    with run.stage("publish") as details:
+        os.makedirs(config.html_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(config.chunks_path), exist_ok=True)
+        copied = 0
+        for page in run.state["pages"].values():
+            if page.get("missing") or page.get("fallback"):
+                continue
+            _copy_atomic(os.path.join(run.html_dir, page["file"]), os.path.join(config.html_dir, page["file"]))
+            copied += 1
+        # Thay file chunk sau cùng: backend nhận ra corpus mới qua hash của file này
+        _copy_atomic(run.chunks_path, config.chunks_path)
+        details.update(html_files=copied, corpus_hash=corpus_hash(config.chunks_path))
+
+
+def prune_runs(config, keep_run):
+    runs = list_runs(config.refresh_dir)
+    for run in runs[:-config.keep_runs] if config.keep_runs > 0 else []:
+        if run.path != keep_run.path and run.state["status"] != "running":
+            shutil.rmtree(run.path, ignore_errors=True)
+
+
+def _execute(run, config, force, embeddings):
+    sources = config.sources()
+    previous = latest_run(config.refresh_dir, statuses=("done", "unchanged"))
+
+    if not (run.stage_done("crawl") and run.stage_done("chunk")):
+        crawl_and_chunk(run, config, sources, previous)
+        if not force and not corpus_changed(run, config, previous):
+            run.state["status"] = "unchanged"
+            # HTML của lần chạy không đổi không cần giữ; chunk được giữ để lần sau dùng lại
+            shutil.rmtree(run.html_dir, ignore_errors=True)
+            logger.info(f"Refresh {run.run_id}: nội dung không thay đổi so với lần {previous.run_id}.")
+            return
+
+    if not run.stage_done("dedup"):
+        merge_and_dedup(run, config, sources)
+    with open(run.chunks_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    if not (run.stage_done("embed") and run.stage_done("upload")) and embeddings is None:
+        from embedding_backends import create_embeddings
+        embeddings = create_embeddings(config.model_name)
+    if not run.stage_done("embed"):
+        embed_chunks(run, config, chunks, embeddings)
+    if not run.stage_done("upload"):
+        upload_chunks(run, config, chunks, embeddings)
+    if not run.stage_done("publish"):
+        publish(run, config)
+    run.state["status"] = "done"
+
+
+def run_refresh(config=None, resume=False, force=False, embeddings=None, min_interval=None):
+    """
+    Runs (or resumes) one refresh and returns its state dict, or None when skipped because another
+    refresh holds the lock or one started less than `min_interval` seconds ago. Errors are recorded in
+    the state (status "failed") and can be resumed with `resume=True`.
+    """
+    config = config or RefreshConfig()
+    with refresh_lock(config.refresh_dir) as acquired:
+        if not acquired:
+            logger.info("Refresh: một tiến trình khác đang chạy job làm mới; bỏ qua.")
+            return None
+        run = latest_run(config.refresh_dir, statuses=("running", "failed")) if resume else None
+        if run is not None:
+            config = RefreshConfig(**run.state["config"])
+            logger.info(f"Refresh: tiếp tục lần chạy {run.run_id}.")
+        else:
+            last = latest_run(config.refresh_dir)
+            if min_interval and last is not None:
+                started = time.mktime(time.strptime(last.state["started_at"], "%Y-%m-%dT%H:%M:%S"))
+                if time.time() - started < min_interval:
+                    return None
+            run = RefreshRun.create(config)
+            logger.info(f"Refresh: bắt đầu lần chạy {run.run_id}.")
+
+        run.state["status"] = "running"
+        run.state.pop("error", None)
+        start = time.perf_counter()
+        try:
+            _execute(run, config, force, embeddings)
+        except Exception as e:
+            run.state["status"] = "failed"
+            run.state["error"] = str(e) or type(e).__name__
+            logger.error(f"Refresh {run.run_id} lỗi: {e}\n{traceback.format_exc()}")
+        finally:
+            run.state["seconds"] = round(run.state.get("seconds", 0.0) + time.perf_counter() - start, 3)
+            if run.state["status"] != "running":
+                run.state["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            run.save()
+        if run.state["status"] in ("done", "unchanged"):
+            prune_runs(config, run)
+        return run.state
+
+
+def format_report(state):
+    lines = [f"Refresh {state['run_id']}: {state['status']} (tổng {state.get('seconds', 0):.1f}s, bắt đầu {state['started_at']})"]
+    for name in STAGES:
+        info = state["stages"].get(name)
+        if info is None:
+            continue
+        details = ", ".join(f"{key}={value}" for key, value in info.get("details", {}).items())
+        lines.append(f"  {name:<8} {info['status']:<8} {info.get('seconds', 0):8.2f}s  {details}")
+        if info.get("error"):
+            lines.append(f"           lỗi: {info['error']}")
+    changed = sorted(name for name, page in state.get("pages", {}).items() if page.get("changed") and not page.get("missing"))
+    if changed:
+        lines.append(f"  Trang thay đổi ({len(changed)}): {', '.join(changed)}")
+    if state.get("error") and not any(info.get("error") for info in state["stages"].values()):
+        lines.append(f"  Lỗi: {state['error']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job làm mới dữ liệu: crawl → chunk → dedup → embed → upload → publish")
+    parser.add_argument("--resume", action="store_true", help="Tiếp tục lần chạy dở / lỗi gần nhất")
+    parser.add_argument("--force", action="store_true", help="Chạy hết các bước kể cả khi nội dung không đổi")
+    parser.add_argument("--every", type=int, default=0, metavar="SECONDS", help="Chạy định kỳ mỗi SECONDS giây")
+    parser.add_argument("--report", nargs="?", const="", metavar="RUN_ID", help="In báo cáo của lần chạy gần nhất (hoặc RUN_ID)")
+    parser.add_argument("--refresh-dir", default=REFRESH_DIR, help="Thư mục chứa các lần chạy")
+    parser.add_argument("--html-dir", default=REFRESH_HTML_DIR, help="Thư mục HTML đang phục vụ")
+    parser.add_argument("--chunks-path", default=REFRESH_CHUNKS_PATH, help="File chunk JSON đang phục vụ")
+    parser.add_argument("--sources", default=REFRESH_SOURCES_PATH, help="File JSON {tên trang: URL}")
+    parser.add_argument("--workers", type=int, default=REFRESH_CRAWL_WORKERS, help="Số trang tải đồng thời")
+    parser.add_argument("--upload", choices=["auto", "true", "false"], default=REFRESH_UPLOAD, help="Tải lên Qdrant (blue/green)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Model embedding")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.report is not None:
+        report_run = RefreshRun.load(os.path.join(args.refresh_dir, args.report)) if args.report else latest_run(args.refresh_dir)
+        if report_run is None:
+            print("Chưa có lần chạy nào.")
+            sys.exit(1)
+        print(format_report(report_run.state))
+        sys.exit(0)
+
+    refresh_config = RefreshConfig(
+        refresh_dir=args.refresh_dir,
+        html_dir=args.html_dir,
+        chunks_path=args.chunks_path,
+        sources_path=args.sources,
+        crawl_workers=args.workers,
+        upload=args.upload,
+        model_name=args.model,
+    )
+    cached_embeddings = None
+    while True:
+        result = run_refresh(refresh_config, resume=args.resume, force=args.force, embeddings=cached_embeddings)
+        if result is not None:
+            print(format_report(result))
+        if not args.every:
+            sys.exit(0 if result is not None and result["status"] in ("done", "unchanged") else 1)
+        if cached_embeddings is None and result is not None and result["status"] == "done":
+            # Chế độ định kỳ: giữ model embedding trong bộ nhớ cho các lần sau
+            from embedding_backends import create_embeddings
+            cached_embeddings = create_embeddings(refresh_config.model_name)
+        args.resume = False
+        time.sleep(args.every)
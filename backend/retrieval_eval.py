@@ -0,0 +1,237 @@
+# --- Đánh giá chất lượng và độ trễ truy vấn (retrieval) trên corpus chunk APEC ---
+# Chạy offline trên index cục bộ (không cần Qdrant / Gemini). Với mỗi cấu hình trong lưới
+# (cách chunk x model embedding x retriever x k), tính recall@k, MRR@k, độ trễ tìm kiếm mỗi câu hỏi
+# và số token context ước tính, dựa trên tập câu hỏi đã gán nhãn question -> source_file.
+#
+# Cách dùng:
+#     python backend/retrieval_eval.py                                   # corpus JSON hiện tại, dense, k=3,5,10
+#     python backend/retrieval_eval.py --chunk-configs json,recursive:1000:200,structured:1200 \
+#         --retrievers dense,bm25,hybrid --k 3,5,10 --output backend/data/eval/results.json
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from corpus import DATA_DIR, load_chunks
+from prompts import estimate_tokens
+
+EVAL_QUESTIONS_PATH = os.path.join(DATA_DIR, "eval", "retrieval_questions.jsonl")
+HTML_DIR = os.path.join(DATA_DIR, "crawled_raw_html")
+
+
+def load_eval_questions(path=EVAL_QUESTIONS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_chunk_config(config):
+    """
+    Returns the chunk list for a chunk config string:
+      "json"                      -> the shipped corpus (backend/data/json_chunks/apec_all_chunks.json)
+      "recursive:<size>:<overlap>" -> re-chunk the crawled HTML with the character splitter
+      "structured[:<max_size>]"    -> re-chunk the crawled HTML along headings / articles / tables
+    """
+    if config == "json":
+        return load_chunks()
+    strategy, *params = config.split(":")
+    from data_preparation import build_chunks, DEFAULT_MAX_CHUNK_CHARS
+    if strategy == "recursive":
+        chunk_size, chunk_overlap = (int(p) for p in params)
+        return build_chunks(HTML_DIR, chunk_size=chunk_size, chunk_overlap=chunk_overlap, strategy="recursive")
+    if strategy == "structured":
+        chunk_size = int(params[0]) if params else DEFAULT_MAX_CHUNK_CHARS
+        return build_chunks(HTML_DIR, chunk_size=chunk_size, strategy="structured")
+    raise ValueError(f"Cấu hình chunk không hợp lệ: '{config}'")
+
+
+class BM25Index:
+    """
+    Minimal Okapi BM25 over chunk contents (lexical baseline, no external dependency).
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1, self.b = k1, b
+        self.doc_terms = [self.tokenize(chunk.get("content", "")) for chunk in chunks]
+        self.doc_lengths = [len(terms) for terms in self.doc_terms]
+        self.avg_length = sum(self.doc_lengths) / max(1, len(self.doc_lengths))
+        self.term_freqs = []
+        document_freq = {}
+        for terms in self.doc_terms:
+            freqs = {}
+            for term in terms:
+                freqs[term] = freqs.get(term, 0) + 1
+            self.term_freqs.append(freqs)
+            for term in freqs:
+                document_freq[term] = document_freq.get(term, 0) + 1
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_freq.items()}
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"\w+", text.lower())
+
+    def search(self, query, k):
+        scores = []
+        for i, freqs in enumerate(self.term_freqs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+            for term in self.tokenize(query):
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+        return [(self.chunks[i], scores[i]) for i in ranked]
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    # Trộn nhiều danh sách kết quả theo Reciprocal Rank Fusion
+    fused, by_id = {}, {}
+    for results in result_lists:
+        for rank, (chunk, _) in enumerate(results):
+            chunk_id = chunk.get("id") or id(chunk)
+            by_id[chunk_id] = chunk
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [(by_id[chunk_id], fused[chunk_id]) for chunk_id in ranked]
+
+
+def make_searchers(chunks, retrievers, embeddings, model_name=None):
+    """
+    Builds a `search(question, k) -> [(chunk, score)]` function per retriever name.
+    """
+    searchers = {}
+    dense_index = bm25_index = None
+    if any(name in ("dense", "hybrid") for name in retrievers):
+        from local_index import LocalVectorIndex
+        dense_index = LocalVectorIndex.build(chunks, embeddings, model_name=model_name)
+    if any(name in ("bm25", "hybrid") for name in retrievers):
+        bm25_index = BM25Index(chunks)
+
+    for name in retrievers:
+        if name == "dense":
+            searchers[name] = lambda q, k: dense_index.search(embeddings.embed_query(q), k)
+        elif name == "bm25":
+            searchers[name] = lambda q, k: bm25_index.search(q, k)
+        elif name == "hybrid":
+            searchers[name] = lambda q, k: reciprocal_rank_fusion(
+                [dense_index.search(embeddings.embed_query(q), k * 2), bm25_index.search(q, k * 2)], k
+            )
+        else:
+            raise ValueError(f"Retriever không hợp lệ: '{name}'. Các giá trị hợp lệ: dense, bm25, hybrid")
+    return searchers
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def evaluate(search, questions, k_values):
+    """
+    Runs every question once at max(k) and computes the metrics for each k from the same ranking.
+    """
+    max_k = max(k_values)
+    rankings, latencies = [], []
+    for item in questions:
+        start = time.perf_counter()
+        results = search(item["question"], max_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rankings.append(results)
+
+    rows = []
+    for k in k_values:
+        hits, reciprocal_ranks, context_tokens = 0, [], []
+        for item, results in zip(questions, rankings):
+            relevant = set(item["relevant_sources"])
+            top = results[:k]
+            first_rank = next((rank for rank, (chunk, _) in enumerate(top, start=1) if chunk.get("source_file") in relevant), None)
+            hits += first_rank is not None
+            reciprocal_ranks.append(1.0 / first_rank if first_rank else 0.0)
+            context_tokens.append(estimate_tokens("\n\n".join(chunk.get("content", "") for chunk, _ in top)))
+        rows.append({
+            "k": k,
+            "recall": hits / len(questions),
+            "mrr": sum(reciprocal_ranks) / len(questions),
+            "latency_ms_mean": sum(latencies) / len(latencies),
+            "latency_ms_p95": percentile(latencies, 0.95),
+            "context_tokens_mean": sum(context_tokens) / len(context_tokens),
+        })
+    return rows
+
+
+def run_grid(chunk_configs, models, retrievers, k_values, questions):
+    from embedding_backends import create_embeddings
+
+    results = []
+    embeddings_by_model = {}
+    # BM25 không phụ thuộc model embedding: chỉ chạy một lần cho mỗi cấu hình chunk (model=None)
+    runs = [(None, ["bm25"])] if "bm25" in retrievers else []
+    dense_retrievers = [name for name in retrievers if name != "bm25"]
+    if dense_retrievers:
+        runs += [(model, dense_retrievers) for model in models]
+    for chunk_config in chunk_configs:
+        chunks = load_chunk_config(chunk_config)
+        chunks = [chunk for chunk in chunks if chunk.get("content")]
+        for model, run_retrievers in runs:
+            if model is not None and model not in embeddings_by_model:
+                embeddings_by_model[model] = create_embeddings(model)
+            searchers = make_searchers(chunks, run_retrievers, embeddings_by_model.get(model), model_name=model)
+            for retriever, search in searchers.items():
+                for row in evaluate(search, questions, k_values):
+                    results.append({
+                        "chunks": chunk_config,
+                        "num_chunks": len(chunks),
+                        "model": model,
+                        "retriever": retriever,
+                        **row,
+                    })
+    return results
+
+
+def print_table(results):
+    header = f"{'chunks':<22} {'#chunks':>7} {'model':<28} {'retriever':<9} {'k':>3} {'recall@k':>9} {'MRR':>6} {'lat ms':>8} {'p95 ms':>8} {'ctx tok':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['chunks']:<22} {r['num_chunks']:>7} {(r['model'] or '-')[:28]:<28} {r['retriever']:<9} {r['k']:>3} "
+            f"{r['recall']:>9.3f} {r['mrr']:>6.3f} {r['latency_ms_mean']:>8.2f} {r['latency_ms_p95']:>8.2f} {r['context_tokens_mean']:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đánh giá recall@k / MRR / độ trễ truy vấn trên corpus APEC")
+    parser.add_argument("--questions", default=EVAL_QUESTIONS_PATH, help="File JSONL câu hỏi đã gán nhãn")
+    parser.add_argument("--chunk-configs", default="json", help="Danh sách cấu hình chunk, ví dụ: json,recursive:1000:200,structured:1200")
+    parser.add_argument("--models", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"), help="Danh sách model embedding, cách nhau bởi dấu phẩy")
+    parser.add_argument("--retrievers", default="dense", help="Danh sách retriever: dense, bm25, hybrid")
+    parser.add_argument("--k", default="3,5,10", help="Danh sách giá trị k")
+    parser.add_argument("--lang", default=None, help="Chỉ đánh giá câu hỏi của một ngôn ngữ (vi, en)")
+    parser.add_argument("--output", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    eval_questions = load_eval_questions(args.questions)
+    if args.lang:
+        eval_questions = [q for q in eval_questions if q.get("lang") == args.lang]
+    grid_results = run_grid(
+        chunk_configs=[c.strip() for c in args.chunk_configs.split(",") if c.strip()],
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        retrievers=[r.strip() for r in args.retrievers.split(",") if r.strip()],
+        k_values=[int(k) for k in args.k.split(",")],
+        questions=eval_questions,
+    )
+    print(f"\nĐánh giá {len(eval_questions)} câu hỏi từ '{args.questions}':\n")
+    print_table(grid_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(grid_results, f, ensure_ascii=False, indent=4)
+        print(f"\nĐã lưu kết quả vào '{args.output}'.")
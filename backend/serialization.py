@@ -0,0 +1,89 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+# orjson là tùy chọn: nếu chưa cài thì dùng json chuẩn (UTF-8, không escape ký tự tiếng Việt, không khoảng trắng thừa)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(payload) -> bytes:
+    """
+    Serializes to compact UTF-8 JSON bytes (orjson when installed).
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def ndjson_line(payload) -> bytes:
+    # Một dòng NDJSON cho /chat/stream và /chat/batch
+    return dumps(payload) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson (falls back to compact json.dumps).
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+if __name__ == "__main__":
+    # --- Benchmark: chi phí serialize một ChatResponse và kích thước sau khi nén ---
+    # Cách dùng: python backend/serialization.py [--iterations 20000]
+    import os
+    import sys
+    import gzip
+    import timeit
+    import argparse
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import BaseModel
+    from quick_replies import GENERAL_SUGGESTIONS
+
+    class ChatResponse(BaseModel):
+        answer: str
+        lang: str
+        suggestions: list[str] = []
+
+    parser = argparse.ArgumentParser(description="Đo chi phí serialize câu trả lời chat")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    answer = (
+        "Hội nghị các Nhà Lãnh đạo Kinh tế APEC 2025 được tổ chức tại Gyeongju, Hàn Quốc. "
+        "Chủ đề của năm APEC 2025 là 'Xây dựng một ngày mai bền vững: Kết nối, Đổi mới, Thịnh vượng'. "
+    ) * 6
+    response = ChatResponse(answer=answer, lang="vi", suggestions=GENERAL_SUGGESTIONS["vi"][:4])
+
+    candidates = {
+        "JSONResponse (jsonable_encoder + json.dumps)": lambda: JSONResponse(jsonable_encoder(response)).body,
+        "pydantic model_dump_json": lambda: response.model_dump_json().encode("utf-8"),
+        "FastJSONResponse (model_dump + orjson)" if orjson else "FastJSONResponse (model_dump + json)": lambda: FastJSONResponse(response.model_dump()).body,
+    }
+    print(f"Serialize một ChatResponse ({len(answer)} ký tự), {args.iterations} lần:")
+    for label, fn in candidates.items():
+        seconds = timeit.timeit(fn, number=args.iterations)
+        body = fn()
+        print(f"  {label:<48} {seconds / args.iterations * 1e6:8.2f} µs/response | {len(body):6d} bytes")
+
+    body = FastJSONResponse(response.model_dump()).body
+    print("\nKích thước sau khi nén:")
+    print(f"  không nén : {len(body):6d} bytes")
+    print(f"  gzip (6)  : {len(gzip.compress(body, compresslevel=6)):6d} bytes")
+    try:
+        import brotli
+        print(f"  brotli (4): {len(brotli.compress(body, quality=4)):6d} bytes")
+    except ImportError:
+        print("  brotli    : (chưa cài thư viện brotli)")
@@ -0,0 +1,95 @@
+# --- Entry point chạy backend ở chế độ production (nhiều worker) ---
+# Chạy `app:app` bằng gunicorn + uvicorn worker với `preload_app=True`: tiến trình master import app
+# và nạp model embedding MỘT lần rồi mới fork các worker. Trọng số model nằm trong các trang nhớ mà
+# worker chỉ đọc, nên được chia sẻ copy-on-write thay vì nhân bản theo số worker. Các client mạng
+# (Gemini, Qdrant) vẫn được tạo riêng trong từng worker ở sự kiện startup, sau khi fork.
+#
+# Cách dùng (chạy từ thư mục gốc của dự án hoặc từ backend/):
+#     python backend/serve.py --workers 4 --port 8000
+import os
+import gc
+import sys
+import argparse
+import logging
+
+# Cho phép chạy từ thư mục gốc: `python backend/serve.py`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+
+def default_worker_count():
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def limit_torch_threads(workers):
+    """
+    Splits the CPU cores between workers so N workers x M torch threads does not oversubscribe the node.
+    """
+    try:
+        import torch
+    except ImportError:
+        return
+    threads = int(os.getenv("TORCH_NUM_THREADS", max(1, (os.cpu_count() or 1) // workers)))
+    torch.set_num_threads(threads)
+    logger.info(f"Worker {os.getpid()}: torch dùng {threads} luồng CPU.")
+
+
+def run_gunicorn(host, port, workers, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("post_fork", lambda server, worker: limit_torch_threads(workers))
+
+        def load(self):
+            import app as backend_app
+            # Nạp model embedding trong tiến trình master, TRƯỚC khi fork các worker
+            backend_app.initialize_embeddings()
+            # Đưa các object đã tạo vào thế hệ "permanent" của GC để việc quét GC
+            # trong worker không ghi vào các trang nhớ dùng chung (tránh copy-on-write)
+            gc.freeze()
+            return backend_app.app
+
+    logger.info(f"Khởi động gunicorn với {workers} worker tại {host}:{port} (preload model trước khi fork).")
+    PreloadedApplication().run()
+
+
+def run_uvicorn(host, port):
+    import uvicorn
+    import app as backend_app
+    uvicorn.run(backend_app.app, host=host, port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APEC 2025 chatbot production server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_worker_count(),
+                        help="Số worker (mặc định: WEB_CONCURRENCY hoặc số lõi CPU)")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "180")),
+                        help="Thời gian tối đa (giây) cho một request trước khi worker bị khởi động lại")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.workers <= 1:
+        run_uvicorn(args.host, args.port)
+        return
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        # gunicorn không chạy trên Windows: quay về một tiến trình uvicorn
+        logger.warning("Không tìm thấy gunicorn (hoặc đang chạy trên Windows). Chạy một worker uvicorn duy nhất.")
+        run_uvicorn(args.host, args.port)
+        return
+    run_gunicorn(args.host, args.port, args.workers, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+
+class _StreamBroadcast:
+    """
+    Buffers the chunks of one in-flight stream so that any number of subscribers,
+    including late joiners, receive the full stream from the beginning.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._condition = asyncio.Condition()
+
+    async def run(self, stream_factory):
+        try:
+            async for chunk in stream_factory():
+                async with self._condition:
+                    self.chunks.append(chunk)
+                    self._condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: len(self.chunks) > position or self.done)
+                new_chunks = self.chunks[position:]
+                finished = self.done
+            for chunk in new_chunks:
+                yield chunk
+            position += len(new_chunks)
+            if finished and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The shared work runs in its own task, so a caller that disconnects does not
+    cancel the result for the other callers attached to it.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._inflight_streams = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _track(self, registry, key, value):
+        registry[key] = value
+
+        def _forget(_):
+            if registry.get(key) is value:
+                del registry[key]
+
+        return _forget
+
+    async def do(self, key, fn, retry_on=()):
+        """
+        Awaits `fn()` once per key; concurrent callers with the same key share its result (or exception).
+        Exceptions of the types in `retry_on` belong to the caller that started the execution (e.g. its
+        own admission failure): coalesced callers retry instead, starting or joining a new execution.
+        """
+        while True:
+            task = self._inflight.get(key)
+            leader = task is None or task.done()
+            if leader:
+                self.executions += 1
+                task = asyncio.ensure_future(fn())
+                task.add_done_callback(self._track(self._inflight, key, task))
+            else:
+                self.coalesced += 1
+                logger.info(f"Gộp yêu cầu trùng đang xử lý: {key} (đã gộp tổng cộng {self.coalesced}).")
+            try:
+                return await asyncio.shield(task)
+            except retry_on as e:
+                if leader:
+                    raise
+                logger.info(f"Lượt xử lý đã gộp cho {key} bị từ chối ({e}); thử lại với lượt riêng.")
+
+    async def stream(self, key, stream_factory, retry_on=()):
+        """
+        Iterates the chunks of `stream_factory()` (an async generator factory), sharing one
+        underlying stream between all concurrent callers with the same key. A coalesced caller
+        retries on `retry_on` exceptions raised before the first chunk (see `do`).
+        """
+        while True:
+            entry = self._inflight_streams.get(key)
+            leader = entry is None or entry[1].done()
+            if leader:
+                self.executions += 1
+                broadcast = _StreamBroadcast()
+                task = asyncio.ensure_future(broadcast.run(stream_factory))
+                entry = (broadcast, task)
+                task.add_done_callback(self._track(self._inflight_streams, key, entry))
+            else:
+                self.coalesced += 1
+                logger.info(f"Gộp luồng stream trùng đang xử lý: {key} (đã gộp tổng cộng {self.coalesced}).")
+            broadcast, _ = entry
+            received = 0
+            try:
+                async for chunk in broadcast.subscribe():
+                    received += 1
+                    yield chunk
+                return
+            except retry_on as e:
+                if leader or received:
+                    raise
+                logger.info(f"Luồng stream đã gộp cho {key} bị từ chối ({e}); thử lại với lượt riêng.")
+
+    def stats(self):
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight) + len(self._inflight_streams),
+        }
@@ -0,0 +1,94 @@
+# --- Báo cáo thời gian import khi khởi động backend (giống `python -X importtime`) ---
+# Chạy `import app` (hoặc module khác) trong một tiến trình con với `-X importtime`, gom thời gian theo
+# package gốc và in ra các package tốn thời gian nhất. Tùy chọn --init đo thêm thời gian khởi tạo
+# embedding model (import lazy của backend embedding đã cấu hình).
+#
+# Cách dùng:
+#     python backend/startup_profile.py                 # báo cáo import app.py
+#     python backend/startup_profile.py --top 30 --init
+#     python backend/startup_profile.py --raw           # in nguyên log -X importtime
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr_text):
+    """
+    Parses `-X importtime` output into a list of (module, self_us, cumulative_us, depth).
+    """
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        raw_name = parts[2]
+        # Mỗi cấp import lồng nhau được thụt thêm 2 khoảng trắng sau dấu "|"
+        depth = (len(raw_name) - len(raw_name.lstrip(" ")) - 1) // 2
+        rows.append((raw_name.strip(), self_us, cumulative_us, depth))
+    return rows
+
+
+def summarize_by_package(rows):
+    # Cộng thời gian "self" theo package gốc (ví dụ: torch.nn.functional -> torch)
+    totals = {}
+    for module, self_us, _, _ in rows:
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_import(module="app", init_embeddings=False):
+    code = f"import {module}"
+    if init_embeddings:
+        code += f"; {module}.initialize_embeddings()"
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    wall_time = time.perf_counter() - start
+    return result, wall_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Báo cáo thời gian import lúc khởi động backend")
+    parser.add_argument("--module", default="app", help="Module cần đo (mặc định: app)")
+    parser.add_argument("--top", type=int, default=20, help="Số package/module tốn thời gian nhất cần in")
+    parser.add_argument("--init", action="store_true", help="Đo thêm thời gian khởi tạo embedding model")
+    parser.add_argument("--raw", action="store_true", help="In nguyên log -X importtime")
+    args = parser.parse_args()
+
+    result, wall_time = profile_import(args.module, init_embeddings=args.init)
+    if args.raw:
+        print(result.stderr)
+    rows = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        # Vẫn in phần đã import được, nhưng báo lỗi (ví dụ thiếu biến môi trường trong .env)
+        error_lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print("Tiến trình con kết thúc với lỗi:\n" + "\n".join(error_lines[-10:]))
+
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    print(f"\n=== Khởi động '{args.module}'{' + initialize_embeddings()' if args.init else ''} ===")
+    print(f"Thời gian thực (cả tiến trình con): {wall_time:.2f}s | tổng thời gian import: {total_us / 1e6:.2f}s | {len(rows)} module")
+
+    print(f"\n--- Top {args.top} package theo thời gian import (self, cộng dồn theo package) ---")
+    for package, us in summarize_by_package(rows)[:args.top]:
+        print(f"  {us / 1000:9.1f} ms  {package}")
+
+    print(f"\n--- Top {args.top} import trực tiếp (cấp 1) theo thời gian cumulative ---")
+    top_level = sorted((row for row in rows if row[3] == 1), key=lambda row: row[2], reverse=True)
+    for module, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {module}")
@@ -0,0 +1,257 @@
+import os
+import re
+import uuid
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+# --- Chunker theo cấu trúc HTML (heading, <article> của Press Release, bảng) ---
+# Thay vì làm phẳng cả trang rồi cắt theo số ký tự, mỗi chunk nằm gọn trong một section (theo heading),
+# một bài Press Release (<article data-source-url=...>) hoặc một nhóm dòng của bảng (mỗi dòng ghi kèm tên cột).
+# Mỗi chunk mang tiêu đề section, source_url thật và bỏ qua các đoạn boilerplate gần như rỗng.
+
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+BLOCK_TAGS = {"p", "div", "li", "ul", "ol", "dl", "dt", "dd", "section", "br", "hr", "blockquote", "tr", "caption"}
+# Các thẻ / class không chứa nội dung (menu tab, ô tìm kiếm, phân trang, ảnh...).
+# Không bỏ <form>: danh sách bài của các trang board (Notices) nằm bên trong form tìm kiếm.
+REMOVED_TAGS = ["script", "style", "nav", "select", "input", "label", "img", "svg", "header", "footer", "noscript", "button"]
+REMOVED_SELECTORS = [".webtong_tab", ".webtong-paging", ".select-box", ".location", ".sns", ".print"]
+
+DEFAULT_MAX_CHUNK_CHARS = 1200
+DEFAULT_MIN_CHUNK_CHARS = 80
+
+
+def _clean_text(text):
+    return " ".join(text.split())
+
+
+def _main_content(soup):
+    # Trang thường: <div id="contents">; file Press Release tổng hợp: <main> chứa các <article>
+    root = soup.find("div", id="contents") or soup.find("main") or soup.body or soup
+    for comment in root.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in root(REMOVED_TAGS):
+        tag.decompose()
+    for selector in REMOVED_SELECTORS:
+        for tag in root.select(selector):
+            tag.decompose()
+    return root
+
+
+def _table_rows(table):
+    """
+    Returns (caption, header cells, data rows) of a table as plain text.
+    """
+    caption_tag = table.find("caption")
+    caption = _clean_text(caption_tag.get_text(" ")) if caption_tag else ""
+    header, rows = [], []
+    for tr in table.find_all("tr"):
+        cells = [_clean_text(cell.get_text(" ")) for cell in tr.find_all(["th", "td"])]
+        if not any(cells):
+            continue
+        if not header and tr.find("th") and not tr.find("td"):
+            header = cells
+        else:
+            rows.append(cells)
+    return caption, header, rows
+
+
+def _format_table_row(header, cells):
+    if header and len(header) == len(cells):
+        return " | ".join(f"{name}: {value}" for name, value in zip(header, cells) if value)
+    return " | ".join(cell for cell in cells if cell)
+
+
+def _split_long_paragraph(paragraph, max_chars):
+    # Cắt đoạn quá dài theo câu; câu vẫn quá dài thì cắt cứng theo số ký tự
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _pack_paragraphs(paragraphs, max_chars):
+    """
+    Greedily packs paragraphs (never splitting one unless it alone exceeds max_chars) into chunk texts.
+    """
+    chunks, current = [], []
+    current_len = 0
+    for paragraph in paragraphs:
+        for piece in _split_long_paragraph(paragraph, max_chars):
+            if current and current_len + 1 + len(piece) > max_chars:
+                chunks.append("\n".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class _SectionCollector:
+    """
+    Walks the main content in document order and groups text into sections keyed by the heading path.
+    Tables become their own sections so rows are never split from their column headers.
+    """
+
+    def __init__(self):
+        self.sections = []  # (heading_path, chunk_type, paragraphs)
+        self.heading_path = []  # [(level, title)]
+        self.paragraphs = []
+        self.buffer = []
+
+    def _flush_buffer(self):
+        text = _clean_text("".join(self.buffer))
+        if text:
+            self.paragraphs.append(text)
+        self.buffer = []
+
+    def _flush_section(self):
+        self._flush_buffer()
+        if self.paragraphs:
+            self.sections.append(([title for _, title in self.heading_path], "text", self.paragraphs))
+        self.paragraphs = []
+
+    def _heading(self, tag):
+        title = _clean_text(tag.get_text(" "))
+        if not title:
+            return
+        self._flush_section()
+        level = int(tag.name[1])
+        self.heading_path = [(lvl, t) for lvl, t in self.heading_path if lvl < level] + [(level, title)]
+
+    def _table(self, tag):
+        self._flush_section()
+        caption, header, rows = _table_rows(tag)
+        lines = [_format_table_row(header, cells) for cells in rows]
+        lines = [line for line in lines if line]
+        if lines:
+            path = [title for _, title in self.heading_path]
+            if caption and caption not in path:
+                path = path + [caption]
+            self.sections.append((path, "table", lines))
+
+    def walk(self, node):
+        for child in node.children:
+            if isinstance(child, NavigableString):
+                self.buffer.append(str(child))
+            elif isinstance(child, Tag):
+                if child.name in HEADING_TAGS:
+                    self._heading(child)
+                elif child.name == "table":
+                    self._table(child)
+                else:
+                    is_block = child.name in BLOCK_TAGS
+                    if is_block:
+                        self._flush_buffer()
+                    else:
+                        # Tách chữ giữa các thẻ inline liền nhau (ví dụ: <strong>SPRING</strong><span>March</span>)
+                        self.buffer.append(" ")
+                    self.walk(child)
+                    if is_block:
+                        self._flush_buffer()
+                    else:
+                        self.buffer.append(" ")
+
+    def finish(self):
+        self._flush_section()
+        return self.sections
+
+
+def _article_section(article):
+    """
+    Turns one crawled press release (<article data-source-url data-article-id>) into a section.
+    """
+    title_tag = article.select_one(".title") or article.find(HEADING_TAGS)
+    title = _clean_text(title_tag.get_text(" ")) if title_tag else ""
+    options = article.select_one(".options")
+    date = ""
+    if options:
+        date_match = re.search(r"\d{4}-\d{2}-\d{2}", options.get_text(" "))
+        date = date_match.group(0) if date_match else ""
+    body_tag = article.select_one(".con_txt")
+    if body_tag is None:
+        for tag in article.select(".title, .options, .no"):
+            tag.decompose()
+        body_tag = article
+    body = _clean_text(body_tag.get_text(" "))
+    paragraphs = [p for p in (f"Date: {date}" if date else "", body) if p]
+    return title, paragraphs
+
+
+def chunk_id(source_file, source_url, sub_topic, ordinal):
+    """
+    Deterministic chunk id (uuid5) from the source file, source URL, section path and the chunk's
+    ordinal within that section, so re-chunking the same HTML yields the same ids.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_url or 'N/A'}#{source_file}#{sub_topic}#{ordinal}"))
+
+
+def _topic_from_file(file_name):
+    return file_name.replace(".html", "").replace("_combined", "").replace("_page_", " Page ").replace("_", " ")
+
+
+def chunk_html_file(html_file, source_url=None, max_chunk_chars=DEFAULT_MAX_CHUNK_CHARS, min_chunk_chars=DEFAULT_MIN_CHUNK_CHARS):
+    """
+    Splits one crawled HTML file into chunk dicts along its structure (articles, headings, tables).
+    Chunk content starts with the page topic and section title; chunks whose body is shorter than `min_chunk_chars`
+    (menus, empty sections) and exact duplicates are skipped.
+    """
+    with open(html_file, "r", encoding="utf-8") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    file_name = os.path.basename(html_file)
+    topic = _topic_from_file(file_name)
+    root = _main_content(soup)
+
+    # (sub_topic, chunk_type, paragraphs, source_url, extra metadata)
+    sections = []
+    articles = root.find_all("article")
+    if articles:
+        for article in articles:
+            title, paragraphs = _article_section(article)
+            extra = {"article_id": article.get("data-article-id")} if article.get("data-article-id") else {}
+            sections.append((title or topic, "article", paragraphs, article.get("data-source-url") or source_url, extra))
+    else:
+        collector = _SectionCollector()
+        collector.walk(root)
+        for path, chunk_type, paragraphs in collector.finish():
+            sections.append((" > ".join(path) if path else topic, chunk_type, paragraphs, source_url, {}))
+
+    chunks, seen = [], set()
+    # Số thứ tự chunk trong từng (source_url, section) để id không đổi giữa các lần chunk lại
+    ordinals = {}
+    for sub_topic, chunk_type, paragraphs, url, extra in sections:
+        # Dòng tiêu đề của chunk: tên trang (theo tên file, ví dụ "Heritage Gyeongju") + đường dẫn heading
+        heading = sub_topic if sub_topic.startswith(topic) else f"{topic} | {sub_topic}"
+        # Dòng bảng được gói nguyên dòng như các đoạn văn
+        for body in _pack_paragraphs(paragraphs, max_chunk_chars):
+            if len(body) < min_chunk_chars or body in seen:
+                continue
+            seen.add(body)
+            ordinal = ordinals.get((url, sub_topic), 0)
+            ordinals[(url, sub_topic)] = ordinal + 1
+            chunk = {
+                "id": chunk_id(file_name, url, sub_topic, ordinal),
+                "topic": topic,
+                "sub_topic": sub_topic,
+                "content": f"{heading}\n{body}",
+                "source_file": file_name,
+                "source_url": url or "N/A",
+                "chunk_type": chunk_type,
+            }
+            chunk.update(extra)
+            chunks.append(chunk)
+    return chunks
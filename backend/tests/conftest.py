@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module backend import lẫn nhau theo tên phẳng (`from corpus import ...`), như khi chạy từ thư mục backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
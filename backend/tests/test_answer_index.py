@@ -0,0 +1,68 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+from answer_index import AnswerIndex, build_answer_index, normalize_question, ANSWER_INDEX_RETRY_BASE
+
+QUESTIONS = [("APEC là gì?", "vi"), ("Overview of APEC 2025", "en"), ("Entry support", "en")]
+
+
+def fake_answer_fn(failing, calls):
+    async def answer(question, lang):
+        calls.append(question)
+        if question in failing:
+            raise RuntimeError("LLM error")
+        return SimpleNamespace(answer=f"answer: {question}", lang=lang, suggestions=[])
+    return answer
+
+
+def build(questions, answer_fn, base=None):
+    return asyncio.run(build_answer_index(answer_fn, questions, "hash", "v1", concurrency=2, base=base))
+
+
+def test_normalize_question():
+    assert normalize_question("  APEC   là gì ?? ") == normalize_question("apec là gì")
+
+
+def test_failed_question_is_recorded_with_backoff():
+    calls = []
+    index = build(QUESTIONS, fake_answer_fn({"Entry support"}, calls))
+    assert len(index) == 2
+    failure = index.failures[normalize_question("Entry support")]
+    assert failure["attempts"] == 1
+    assert "LLM error" in failure["last_error"]
+    # Câu lỗi đang chờ thử lại: index vẫn được coi là mới, không tạo lại
+    assert index.is_fresh("hash", "v1", QUESTIONS)
+    assert index.pending_questions(QUESTIONS) == []
+    assert index.pending_questions(QUESTIONS, now=failure["retry_at"]) == [("Entry support", "en")]
+    assert not index.is_fresh("hash", "v1", QUESTIONS, now=failure["retry_at"])
+
+
+def test_backoff_doubles_and_only_pending_questions_are_regenerated():
+    calls = []
+    index = build(QUESTIONS, fake_answer_fn({"Entry support"}, calls))
+    retry_at = index.failures[normalize_question("Entry support")]["retry_at"]
+
+    calls.clear()
+    pending = index.pending_questions(QUESTIONS, now=retry_at)
+    index = build(pending, fake_answer_fn({"Entry support"}, calls), base=index)
+    assert calls == ["Entry support"]
+    failure = index.failures[normalize_question("Entry support")]
+    assert failure["attempts"] == 2
+    assert failure["retry_at"] - time.time() > 1.5 * ANSWER_INDEX_RETRY_BASE
+
+    calls.clear()
+    index = build(pending, fake_answer_fn(set(), calls), base=index)
+    assert calls == ["Entry support"]
+    assert len(index) == 3
+    assert index.failures == {}
+
+
+def test_failures_survive_save_and_load(tmp_path):
+    index = build(QUESTIONS, fake_answer_fn({"Entry support"}, []))
+    path = tmp_path / "answers.json"
+    index.save(str(path))
+    loaded = AnswerIndex.load(str(path))
+    assert loaded.failures == index.failures
+    assert loaded.matches("hash", "v1")
+    assert not loaded.matches("other-hash", "v1")
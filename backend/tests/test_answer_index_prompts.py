@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+import app as backend_app
+import prompts
+from prompts import PromptRegistry
+
+QUESTIONS = [("APEC là gì?", "vi"), ("Overview of APEC 2025", "en")]
+
+
+def test_template_change_triggers_answer_index_rebuild(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_generate_answer(question, lang, strict=False, context_str=None):
+        calls.append(question)
+        return SimpleNamespace(answer=f"answer: {question}", lang=lang, suggestions=[])
+
+    monkeypatch.setattr(backend_app, "generate_answer", fake_generate_answer)
+    monkeypatch.setattr(backend_app, "all_canned_questions", lambda: list(QUESTIONS))
+    monkeypatch.setattr(backend_app, "ANSWER_INDEX_PATH", str(tmp_path / "answers.json"))
+    monkeypatch.setattr(backend_app, "corpus_hash", lambda: "hash")
+    monkeypatch.setattr(backend_app, "prompt_registry", PromptRegistry())
+    monkeypatch.setattr(backend_app, "answer_index", None)
+
+    index = asyncio.run(backend_app.rebuild_answer_index())
+    assert sorted(calls) == sorted(q for q, _ in QUESTIONS)
+    assert index.is_fresh("hash", backend_app.prompt_registry.fingerprint, QUESTIONS)
+
+    calls.clear()
+    asyncio.run(backend_app.rebuild_answer_index())
+    assert calls == []
+
+    # Sửa nội dung template (cùng phiên bản v2): index cũ không còn mới, mọi câu được tạo lại
+    monkeypatch.setattr(prompts, "HUMAN_TEMPLATE", prompts.HUMAN_TEMPLATE + "\nTrả lời ngắn gọn.")
+    monkeypatch.setattr(backend_app, "prompt_registry", PromptRegistry())
+    assert not index.is_fresh("hash", backend_app.prompt_registry.fingerprint, QUESTIONS)
+
+    asyncio.run(backend_app.rebuild_answer_index())
+    assert sorted(calls) == sorted(q for q, _ in QUESTIONS)
@@ -0,0 +1,36 @@
+import asyncio
+import io
+import json
+
+import app as backend_app
+from answer_index import AnswerIndex, normalize_question
+from batch_chat import parse_jsonl_questions, run_in_process
+
+
+def test_parse_jsonl_questions():
+    items = parse_jsonl_questions(['{"id": "a", "message": "APEC?"}', '"Jeju?"', "", "not json"])
+
+    assert [item["id"] for item in items] == ["a", 2, 4]
+    assert items[1]["message"] == "Jeju?"
+    assert "error" in items[2]
+
+
+def test_batch_mode_serves_answer_index_hits(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "answers.json")
+    entry = {"question": "APEC 2025 tổ chức ở đâu?", "answer": "APEC 2025 được tổ chức tại Gyeongju.", "lang": "vi", "suggestions": ["APEC là gì?"]}
+    AnswerIndex(entries={normalize_question("APEC 2025 tổ chức ở đâu?"): entry}, corpus_hash="hash", prompt_version="v2").save(index_path)
+
+    async def no_models():
+        pass
+
+    # Không nạp LLM / embedding / retriever: câu hỏi có sẵn trong answer index không cần tới chúng
+    monkeypatch.setattr(backend_app, "startup_event", no_models)
+    monkeypatch.setattr(backend_app, "ANSWER_INDEX_PATH", index_path)
+    monkeypatch.setattr(backend_app, "answer_index", None)
+    output = io.StringIO()
+
+    asyncio.run(run_in_process([{"id": 1, "message": "APEC 2025 tổ chức ở đâu?"}], output))
+
+    result = json.loads(output.getvalue())
+    assert result["source"] == "answer_index"
+    assert result["answer"] == entry["answer"]
@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+
+NDJSON_LINES = [f'{{"delta": "part {i} {"x" * 300}"}}\n'.encode() for i in range(3)]
+
+
+def make_app(chunks, content_type=b"application/x-ndjson"):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type)]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for position, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": position < len(chunks) - 1})
+    return app
+
+
+def run(app, accept_encoding):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=500)(scope, receive, send))
+    headers = {key.decode().lower(): value.decode() for key, value in messages[0]["headers"]}
+    return headers, [message["body"] for message in messages[1:]]
+
+
+def test_choose_encoding_respects_q_values(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("gzip, deflate, br") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("") is None
+
+
+def test_small_body_is_sent_uncompressed():
+    headers, bodies = run(make_app([b'{"answer": "ok"}'], b"application/json"), "gzip")
+
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert bodies == [b'{"answer": "ok"}']
+
+
+def test_single_body_gzip_has_matching_content_length():
+    body = b"APEC 2025 " * 200
+    headers, bodies = run(make_app([body], b"application/json"), "gzip")
+
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(bodies[0])
+    assert gzip.decompress(bodies[0]) == body
+
+
+def test_streamed_gzip_chunks_decode_as_they_arrive():
+    headers, bodies = run(make_app(NDJSON_LINES), "gzip")
+
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Mỗi frame được flush nên giải nén được ngay, không cần đợi frame sau
+    assert [decoder.decompress(body) for body in bodies] == NDJSON_LINES
+    assert decoder.eof
+
+
+def test_streamed_brotli_chunks_decode_as_they_arrive(monkeypatch):
+    brotli = pytest.importorskip("brotli")
+    monkeypatch.setattr(compression, "brotli", brotli)
+    headers, bodies = run(make_app(NDJSON_LINES), "gzip, br")
+
+    assert headers["content-encoding"] == "br"
+    decoder = brotli.Decompressor()
+    assert [decoder.process(body) for body in bodies] == NDJSON_LINES
+    assert decoder.is_finished()
+
+
+def test_excluded_content_type_passes_through():
+    body = b"data: x\n\n" * 100
+    headers, bodies = run(make_app([body], b"text/event-stream"), "gzip")
+
+    assert "content-encoding" not in headers
+    assert bodies == [body]
@@ -0,0 +1,80 @@
+from dedup import MinHasher, _shingles, deduplicate_chunks, estimated_jaccard
+
+WORDS = [f"word{i}" for i in range(200)]
+TEXT = " ".join(WORDS)
+ONE_WORD_CHANGED = " ".join(WORDS[:100] + ["changed"] + WORDS[101:])
+EVERY_TENTH_CHANGED = " ".join(f"other{i}" if i % 10 == 0 else word for i, word in enumerate(WORDS))
+
+
+def true_jaccard(a, b, size=5):
+    shingles_a, shingles_b = _shingles(a, size), _shingles(b, size)
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+def chunk(chunk_id, content, source_file="a.html"):
+    return {"id": chunk_id, "content": content, "source_file": source_file}
+
+
+def test_minhash_estimate_is_close_to_true_jaccard():
+    hasher = MinHasher()
+    for other in (ONE_WORD_CHANGED, EVERY_TENTH_CHANGED):
+        estimate = estimated_jaccard(hasher.signature(TEXT), hasher.signature(other))
+        assert abs(estimate - true_jaccard(TEXT, other)) < 0.1
+
+
+def test_near_duplicate_is_merged_into_longest_chunk():
+    chunks = [
+        chunk("short", ONE_WORD_CHANGED, "press.html"),
+        chunk("unrelated", " ".join(f"topic{i}" for i in range(200))),
+        chunk("long", TEXT + " extra", "documents.html"),
+    ]
+
+    kept, report = deduplicate_chunks(chunks, threshold=0.8)
+
+    assert [c["id"] for c in kept] == ["unrelated", "long"]
+    assert [source["id"] for source in kept[1]["merged_sources"]] == ["short"]
+    assert report["removed"] == 1 and report["clusters"] == 1
+
+
+def test_threshold_controls_what_counts_as_duplicate():
+    assert true_jaccard(TEXT, ONE_WORD_CHANGED) > 0.9
+    assert true_jaccard(TEXT, EVERY_TENTH_CHANGED) < 0.5
+
+    kept, _ = deduplicate_chunks([chunk("a", TEXT), chunk("b", ONE_WORD_CHANGED)], threshold=0.99)
+    assert len(kept) == 2
+
+    kept, _ = deduplicate_chunks([chunk("a", TEXT), chunk("b", EVERY_TENTH_CHANGED)], threshold=0.8)
+    assert len(kept) == 2
+
+
+def test_exact_duplicates_keep_first_chunk():
+    kept, report = deduplicate_chunks([chunk("first", TEXT), chunk("second", TEXT), chunk("third", TEXT)])
+
+    assert [c["id"] for c in kept] == ["first"]
+    assert [source["id"] for source in kept[0]["merged_sources"]] == ["second", "third"]
+    assert report["chars_after"] == len(TEXT)
+
+
+def edited(positions):
+    return " ".join(f"edit{i}" if i in positions else word for i, word in enumerate(WORDS))
+
+
+def test_chained_member_far_from_canonical_is_kept():
+    # B≈A và A≈C, nhưng C khác xa B (chunk chuẩn của cụm)
+    b, a, c = TEXT, edited({40, 100, 160}), edited({20, 40, 70, 100, 130, 160})
+    assert true_jaccard(b, a) > 0.8 and true_jaccard(a, c) > 0.8 and true_jaccard(b, c) < 0.75
+
+    kept, report = deduplicate_chunks([chunk("b", b), chunk("a", a), chunk("c", c)], threshold=0.8)
+
+    assert [item["id"] for item in kept] == ["b", "c"]
+    assert [source["id"] for source in kept[0]["merged_sources"]] == ["a"]
+    assert report["removed"] == 1
+
+
+def test_input_chunks_are_not_modified():
+    chunks = [chunk("first", TEXT), chunk("second", TEXT)]
+
+    kept, _ = deduplicate_chunks(chunks)
+
+    assert "merged_sources" not in chunks[0]
+    assert kept[0] is not chunks[0] and kept[0]["merged_sources"]
@@ -0,0 +1,87 @@
+from disk_cache import DiskCache, MemoryLRU, TieredCache
+
+
+def make_cache(tmp_path):
+    return TieredCache(disk_cache=DiskCache(path=str(tmp_path / "cache.sqlite3")), memory_cache=MemoryLRU())
+
+
+def test_entries_of_other_versions_are_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set_version("answers", "v1")
+    cache.set("answers", "q", b"old")
+    cache.set_version("answers", "v2")
+
+    assert cache.get("answers", "q") is None
+    cache.set("answers", "q", b"new")
+    assert cache.get("answers", "q") == b"new"
+
+
+def test_version_change_keeps_memory_entries_of_other_namespaces(tmp_path):
+    cache = TieredCache(memory_cache=MemoryLRU())
+    cache.set_version("answers", "v1")
+    cache.set_version("embeddings", "e1")
+    cache.set("answers", "q", b"answer")
+    cache.set("embeddings", "q", b"vector")
+
+    cache.set_version("answers", "v2")
+
+    assert cache.get("embeddings", "q") == b"vector"
+    assert cache.get("answers", "q") is None
+    assert len(cache.memory) == 1
+
+
+def test_lagging_worker_does_not_purge_newer_version(tmp_path):
+    updated = make_cache(tmp_path)
+    updated.set_version("answers", "v1")
+    updated.set_version("answers", "v2")
+    updated.set("answers", "q", b"new")
+
+    # Worker khởi động sau nhưng vẫn ở phiên bản cũ
+    lagging = make_cache(tmp_path)
+    lagging.set_version("answers", "v1")
+    assert lagging.get("answers", "q") is None
+
+    fresh = make_cache(tmp_path)
+    fresh.set_version("answers", "v2")
+    assert fresh.get("answers", "q") == b"new"
+
+
+def test_lagging_worker_does_not_overwrite_newer_entry(tmp_path):
+    updated = make_cache(tmp_path)
+    updated.set_version("answers", "v1")
+    updated.set_version("answers", "v2")
+    updated.set("answers", "q", b"new")
+
+    lagging = make_cache(tmp_path)
+    lagging.set_version("answers", "v1")
+    lagging.set("answers", "q", b"old")
+
+    fresh = make_cache(tmp_path)
+    fresh.set_version("answers", "v2")
+    assert fresh.get("answers", "q") == b"new"
+
+    # Cùng phiên bản vẫn ghi đè được
+    updated.set("answers", "q", b"newer")
+    other = make_cache(tmp_path)
+    other.set_version("answers", "v2")
+    assert other.get("answers", "q") == b"newer"
+
+
+def test_newer_version_purges_older_entries(tmp_path):
+    old = make_cache(tmp_path)
+    old.set_version("answers", "v1")
+    old.set("answers", "q", b"old")
+
+    new = make_cache(tmp_path)
+    new.set_version("answers", "v2")
+
+    assert "answers" not in new.disk.stats()["namespaces"]
+
+
+def test_namespace_without_version_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("answers", "q", b"unversioned")
+
+    assert cache.get("answers", "q") is None
+    assert "answers" not in cache.disk.stats()["namespaces"]
+    assert len(cache.memory) == 0
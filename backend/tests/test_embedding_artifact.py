@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import embedding_backends
+from embedding_artifact import EmbeddingArtifact, MANIFEST_FILE_NAME, VECTORS_FILE_NAME, export_artifact, load_compatible_artifact
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text)), 0.5]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+CHUNKS = [{"id": "a", "content": "APEC 2025"}, {"id": "b", "content": "Gyeongju"}]
+
+
+def test_manifest_records_model_prefixes(tmp_path):
+    manifest = export_artifact(CHUNKS, FakeEmbeddings(), "intfloat/multilingual-e5-small", output_dir=str(tmp_path))
+
+    assert (manifest["query_prefix"], manifest["document_prefix"]) == ("query: ", "passage: ")
+    assert EmbeddingArtifact.load(str(tmp_path)).incompatibility("intfloat/multilingual-e5-small") is None
+
+
+def test_artifact_without_prefixes_is_rejected_for_e5(tmp_path):
+    export_artifact(CHUNKS, FakeEmbeddings(), "intfloat/multilingual-e5-small", output_dir=str(tmp_path))
+    manifest_path = os.path.join(str(tmp_path), MANIFEST_FILE_NAME)
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    del manifest["query_prefix"], manifest["document_prefix"]
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    assert EmbeddingArtifact.load(str(tmp_path)).incompatibility("intfloat/multilingual-e5-small") is not None
+
+
+def test_onnx_dir_override_applies_only_to_primary_model(monkeypatch):
+    monkeypatch.setattr(embedding_backends, "ONNX_MODEL_DIR", "/models/custom")
+    monkeypatch.setattr(embedding_backends, "PRIMARY_EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+    assert embedding_backends.onnx_model_dir("all-MiniLM-L6-v2") == "/models/custom"
+    assert embedding_backends.onnx_model_dir("intfloat/multilingual-e5-small").endswith("intfloat__multilingual-e5-small")
+
+
+def test_vectors_from_another_export_are_rejected(tmp_path):
+    export_artifact(CHUNKS, FakeEmbeddings(), "all-MiniLM-L6-v2", output_dir=str(tmp_path / "old"))
+    export_artifact(list(reversed(CHUNKS)), FakeEmbeddings(), "all-MiniLM-L6-v2", output_dir=str(tmp_path / "new"))
+    # Export đang chạy dở: vectors.npy mới, index.json và manifest.json cũ (cùng số hàng)
+    shutil.copyfile(str(tmp_path / "new" / VECTORS_FILE_NAME), str(tmp_path / "old" / VECTORS_FILE_NAME))
+
+    with pytest.raises(ValueError):
+        EmbeddingArtifact.load(str(tmp_path / "old"))
+    assert load_compatible_artifact("all-MiniLM-L6-v2", artifact_dir=str(tmp_path / "old")) is None
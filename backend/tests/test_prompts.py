@@ -0,0 +1,50 @@
+import pytest
+
+import prompts
+from prompts import PromptRegistry, parse_ab_weights
+
+
+def test_parse_ab_weights():
+    assert parse_ab_weights("v1:10, v2:90") == {"v1": 10, "v2": 90}
+    assert parse_ab_weights("") == {}
+    with pytest.raises(ValueError):
+        parse_ab_weights("v9:10")
+    with pytest.raises(ValueError):
+        parse_ab_weights("v1:0,v2:0")
+
+
+def test_without_split_the_default_version_is_used():
+    registry = PromptRegistry(default_version="v1")
+
+    assert registry.select("vi", routing_key="APEC 2025 tổ chức ở đâu?").version == "v1"
+    assert registry.select("fr", routing_key="Où?").lang == "default"
+
+
+def test_ab_routing_is_deterministic_and_follows_weights():
+    registry = PromptRegistry(ab_weights={"v1": 20, "v2": 80})
+    questions = [f"question {i}" for i in range(2000)]
+
+    first = [registry.select("en", routing_key=q).version for q in questions]
+    second = [registry.select("en", routing_key=q).version for q in questions]
+
+    assert first == second
+    assert 0.15 < first.count("v1") / len(first) < 0.25
+
+
+def test_zero_weight_version_is_never_selected():
+    registry = PromptRegistry(ab_weights={"v1": 0, "v2": 1})
+
+    assert {registry.select("vi", routing_key=f"q{i}").version for i in range(200)} == {"v2"}
+
+
+def test_fingerprint_covers_templates_and_routing(monkeypatch):
+    baseline = PromptRegistry().fingerprint
+
+    assert PromptRegistry().fingerprint == baseline
+    assert PromptRegistry(default_version="v1").fingerprint != baseline
+    assert PromptRegistry(ab_weights={"v1": 50, "v2": 50}).fingerprint != baseline
+
+    monkeypatch.setattr(prompts, "HUMAN_TEMPLATE", prompts.HUMAN_TEMPLATE + "\n")
+    changed = PromptRegistry()
+    assert changed.static_prefix_fingerprint == PromptRegistry().static_prefix_fingerprint
+    assert changed.fingerprint != baseline
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from rate_limit import TokenBucket, RateLimiter, FairScheduler, RateLimitExceeded, client_key_for
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate_per_second=1.0, capacity=2, now=0.0)
+    assert bucket.try_acquire(1, now=0.0) == 0
+    assert bucket.try_acquire(1, now=0.0) == 0
+    assert bucket.try_acquire(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.try_acquire(1, now=1.0) == 0
+    # Không vượt quá dung lượng dù chờ lâu
+    bucket.try_acquire(0, now=100.0)
+    assert bucket.tokens == 2
+
+
+def test_rate_limiter_rejects_after_burst_per_client():
+    limiter = RateLimiter(per_minute=60, burst=2, max_clients=10)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.check("a")
+    assert error.value.reason == "rate_limit"
+    assert 0 < error.value.retry_after <= 1
+    limiter.check("b")
+    assert limiter.stats()["rejected"] == 1
+    assert limiter.stats()["top_rejected_clients"] == {"a": 1}
+
+
+def test_rate_limiter_evicts_least_recent_client():
+    limiter = RateLimiter(per_minute=60, burst=1, max_clients=2)
+    limiter.check("a")
+    limiter.check("b")
+    limiter.check("c")
+    assert limiter.stats()["tracked_clients"] == 2
+    # "a" đã bị loại khỏi LRU nên được cấp bucket mới
+    limiter.check("a")
+
+
+def test_client_key_prefers_hashed_api_key():
+    key = client_key_for({"x-api-key": "secret"}, "10.0.0.1")
+    assert key.startswith("key:") and "secret" not in key
+    assert client_key_for({}, "10.0.0.1") == "ip:10.0.0.1"
+
+
+def test_scheduler_serves_light_client_before_bursting_client():
+    async def main():
+        scheduler = FairScheduler(max_concurrent=2, max_queue_per_client=10, queue_timeout=5)
+        order = []
+
+        async def job(client, name):
+            async with scheduler.slot(client):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.ensure_future(job("burst", f"burst-{i}")) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(job("interactive", "interactive")))
+        await asyncio.gather(*tasks)
+        return scheduler, order
+
+    scheduler, order = asyncio.run(main())
+    # Slot trống đầu tiên thuộc về client có ít request đang chạy nhất
+    assert order[:3] == ["burst-0", "burst-1", "interactive"]
+    assert scheduler.stats()["running"] == 0
+    assert scheduler.stats()["granted"] == 5
+
+
+def test_scheduler_queue_full_and_timeout():
+    async def main():
+        scheduler = FairScheduler(max_concurrent=1, max_queue_per_client=1, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("a"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded) as full:
+            async with scheduler.slot("a"):
+                pass
+        with pytest.raises(RateLimitExceeded) as timeout:
+            await waiter
+        release.set()
+        await holder
+        return scheduler, full.value, timeout.value
+
+    scheduler, full, timeout = asyncio.run(main())
+    assert full.reason == "queue_full"
+    assert timeout.reason == "queue_timeout"
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert stats["rejected_queue_full"] == 1 and stats["timed_out"] == 1
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import embedding_artifact
+import refresh_pipeline
+from refresh_pipeline import RefreshConfig, RefreshRun, run_refresh
+
+CRAWLED_HTML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crawled_raw_html")
+SOURCES = {"About_Busan": "https://example.com/busan", "About_Jeju": "https://example.com/jeju"}
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text) % 7), float(len(text.split()) % 5)]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_artifact, "EMBEDDING_ARTIFACTS_DIR", str(tmp_path / "embeddings"))
+    sources_path = tmp_path / "sources.json"
+    sources_path.write_text(json.dumps(SOURCES), encoding="utf-8")
+    return RefreshConfig(
+        refresh_dir=str(tmp_path / "refresh"),
+        html_dir=str(tmp_path / "html"),
+        chunks_path=str(tmp_path / "chunks.json"),
+        sources_path=str(sources_path),
+        crawl_workers=1,
+        upload="false",
+    )
+
+
+@pytest.fixture
+def crawled(monkeypatch):
+    calls = []
+    failing = set()
+
+    def fake_crawl_page(name, url, output_dir, overwrite=False):
+        calls.append(name)
+        if name in failing:
+            raise ConnectionError(f"{name} bị ngắt")
+        destination = os.path.join(output_dir, refresh_pipeline.crawled_file_name(name))
+        shutil.copyfile(os.path.join(CRAWLED_HTML_DIR, f"{name}.html"), destination)
+        return destination
+
+    monkeypatch.setattr(refresh_pipeline, "crawl_page", fake_crawl_page)
+    return calls, failing
+
+
+def saved_state(config, run_id):
+    return RefreshRun.load(os.path.join(config.refresh_dir, run_id)).state
+
+
+def test_resume_skips_stages_recorded_as_done(config, crawled, monkeypatch):
+    calls, _ = crawled
+    embed_chunks = refresh_pipeline.embed_chunks
+
+    def failing_embed(*args, **kwargs):
+        raise RuntimeError("embed lỗi")
+
+    monkeypatch.setattr(refresh_pipeline, "embed_chunks", failing_embed)
+    failed = run_refresh(config, embeddings=FakeEmbeddings())
+
+    state = saved_state(config, failed["run_id"])
+    assert state["status"] == "failed"
+    assert [state["stages"][name]["status"] for name in ("crawl", "chunk", "dedup")] == ["done", "done", "done"]
+    assert not os.path.exists(config.chunks_path)
+
+    monkeypatch.setattr(refresh_pipeline, "embed_chunks", embed_chunks)
+    calls.clear()
+    resumed = run_refresh(config, resume=True, embeddings=FakeEmbeddings())
+
+    assert resumed["run_id"] == failed["run_id"]
+    assert resumed["status"] == "done"
+    assert calls == []
+    assert saved_state(config, resumed["run_id"])["stages"]["embed"]["status"] == "done"
+    with open(config.chunks_path, encoding="utf-8") as f:
+        assert {chunk["source_file"] for chunk in json.load(f)} == {"About_Busan.html", "About_Jeju.html"}
+
+
+def test_resume_crawls_only_pages_not_done(config, crawled):
+    calls, failing = crawled
+    failing.add("About_Jeju")
+
+    failed = run_refresh(config, embeddings=FakeEmbeddings())
+
+    state = saved_state(config, failed["run_id"])
+    assert state["status"] == "failed"
+    assert state["pages"]["About_Busan"]["done"] and "About_Jeju" not in state["pages"]
+
+    failing.clear()
+    calls.clear()
+    resumed = run_refresh(config, resume=True, embeddings=FakeEmbeddings())
+
+    assert resumed["run_id"] == failed["run_id"]
+    assert resumed["status"] == "done"
+    assert calls == ["About_Jeju"]
+
+
+def test_unchanged_pages_stop_after_crawl(config, crawled):
+    assert run_refresh(config, embeddings=FakeEmbeddings())["status"] == "done"
+
+    again = run_refresh(config, embeddings=FakeEmbeddings())
+
+    assert again["status"] == "unchanged"
+    assert "embed" not in again["stages"]
@@ -0,0 +1,22 @@
+import embedding_backends
+import retrieval_eval
+
+QUESTIONS = [{"question": "Where is APEC 2025 held?", "relevant_sources": ["Information_of_Apec.html"]}]
+CHUNKS = [{"id": "1", "content": "APEC 2025 is held in Gyeongju.", "source_file": "Information_of_Apec.html"}]
+
+
+def test_bm25_runs_once_per_chunk_config(monkeypatch):
+    built = []
+
+    def fake_make_searchers(chunks, retrievers, embeddings, model_name=None):
+        built.append((model_name, list(retrievers)))
+        return {name: (lambda q, k: [(CHUNKS[0], 1.0)]) for name in retrievers}
+
+    monkeypatch.setattr(retrieval_eval, "load_chunk_config", lambda config: CHUNKS)
+    monkeypatch.setattr(retrieval_eval, "make_searchers", fake_make_searchers)
+    monkeypatch.setattr(embedding_backends, "create_embeddings", lambda model: object())
+
+    results = retrieval_eval.run_grid(["json"], ["model-a", "model-b"], ["dense", "bm25"], [3], QUESTIONS)
+
+    assert built == [(None, ["bm25"]), ("model-a", ["dense"]), ("model-b", ["dense"])]
+    assert [(r["model"], r["retriever"]) for r in results] == [(None, "bm25"), ("model-a", "dense"), ("model-b", "dense")]
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("q", work) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_run_separately_and_key_is_released():
+    async def main():
+        flight = SingleFlight()
+        first = await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0, "a")), flight.do("b", lambda: asyncio.sleep(0, "b")))
+        again = await flight.do("a", lambda: asyncio.sleep(0, "a2"))
+        return flight, first, again
+
+    flight, first, again = asyncio.run(main())
+    assert first == ["a", "b"]
+    assert again == "a2"
+    assert flight.executions == 3
+
+
+def test_exception_is_shared_with_all_callers():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("q", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("q", work))
+        second = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first
+
+    result, first = asyncio.run(main())
+    assert result == "done"
+    assert first.cancelled()
+
+
+def test_stream_late_joiner_receives_full_stream():
+    async def chunks():
+        for part in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield part
+
+    async def collect(flight, delay=0):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in flight.stream("q", chunks)]
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(collect(flight), collect(flight, delay=0.015))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert flight.executions == 1
+
+
+def test_stream_error_reaches_subscribers_after_buffered_chunks():
+    async def chunks():
+        yield "a"
+        raise ValueError("stream failed")
+
+    async def main():
+        flight = SingleFlight()
+        received = []
+        with pytest.raises(ValueError):
+            async for chunk in flight.stream("q", chunks):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(main()) == ["a"]
+
+
+class AdmissionError(Exception):
+    pass
+
+
+def test_follower_retries_on_leader_admission_error():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        def make(caller, fail):
+            async def work():
+                calls.append(caller)
+                await asyncio.sleep(0.01)
+                if fail:
+                    raise AdmissionError(caller)
+                return caller
+            return work
+
+        leader = asyncio.ensure_future(flight.do("q", make("leader", True), retry_on=(AdmissionError,)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("q", make("follower", False), retry_on=(AdmissionError,)))
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return calls, results
+
+    calls, (leader_result, follower_result) = asyncio.run(main())
+    assert isinstance(leader_result, AdmissionError)
+    assert follower_result == "follower"
+    assert calls == ["leader", "follower"]
+
+
+def test_stream_follower_retries_on_leader_admission_error():
+    def make(caller, fail):
+        async def chunks():
+            await asyncio.sleep(0.01)
+            if fail:
+                raise AdmissionError(caller)
+            yield caller
+        return chunks
+
+    async def collect(flight, caller, fail, delay=0):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in flight.stream("q", make(caller, fail), retry_on=(AdmissionError,))]
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(collect(flight, "leader", True), collect(flight, "follower", False, delay=0.001), return_exceptions=True)
+
+    leader_result, follower_result = asyncio.run(main())
+    assert isinstance(leader_result, AdmissionError)
+    assert follower_result == ["follower"]
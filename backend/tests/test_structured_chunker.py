@@ -0,0 +1,27 @@
+from structured_chunker import chunk_html_file
+
+PARAGRAPH = "APEC 2025 Korea brings together leaders and ministers from twenty-one member economies."
+PAGE = f"""<html><body><div id="contents">
+<h2>Overview</h2>{"".join(f"<p>{PARAGRAPH} Part {i}.</p>" for i in range(6))}
+<h2>Venues</h2><p>{PARAGRAPH} Gyeongju hosts the Leaders' Week.</p>
+</div></body></html>"""
+
+
+def test_rechunking_the_same_html_keeps_chunk_ids(tmp_path):
+    html_file = tmp_path / "Information_of_Apec.html"
+    html_file.write_text(PAGE, encoding="utf-8")
+    first = chunk_html_file(str(html_file), source_url="https://apec2025.kr/?menuno=89", max_chunk_chars=300)
+    second = chunk_html_file(str(html_file), source_url="https://apec2025.kr/?menuno=89", max_chunk_chars=300)
+
+    assert len(first) > 2
+    assert [c["id"] for c in first] == [c["id"] for c in second]
+    assert len({c["id"] for c in first}) == len(first)
+
+
+def test_chunk_ids_depend_on_source_url(tmp_path):
+    html_file = tmp_path / "Information_of_Apec.html"
+    html_file.write_text(PAGE, encoding="utf-8")
+    ids = [c["id"] for c in chunk_html_file(str(html_file), source_url="https://apec2025.kr/?menuno=89")]
+    other_ids = [c["id"] for c in chunk_html_file(str(html_file), source_url="https://apec2025.kr/?menuno=91")]
+
+    assert not set(ids) & set(other_ids)
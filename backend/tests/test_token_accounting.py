@@ -0,0 +1,31 @@
+from token_accounting import (
+    TokenAccountant, TokenUsage, normal_retrieval_limits, REDUCED_RETRIEVAL_K, REDUCED_CONTEXT_TOKENS,
+    BUDGET_NORMAL, BUDGET_REDUCED, BUDGET_CACHED_ONLY,
+)
+
+
+def usage(tokens):
+    return TokenUsage(input_tokens=tokens, estimated=False)
+
+
+def test_budget_levels_and_retrieval_limits():
+    accountant = TokenAccountant(budget=1000, window=3600, reduce_ratio=0.8)
+    assert accountant.level() == BUDGET_NORMAL
+    assert accountant.retrieval_limits(8) == normal_retrieval_limits(8)
+
+    accountant.record(usage(850))
+    assert accountant.level() == BUDGET_REDUCED
+    limits = accountant.retrieval_limits(8)
+    assert limits == (min(8, REDUCED_RETRIEVAL_K), REDUCED_CONTEXT_TOKENS)
+    # app.py chỉ cache câu trả lời khi dùng giới hạn bình thường
+    assert limits != normal_retrieval_limits(8)
+
+    accountant.record(usage(200))
+    assert accountant.level() == BUDGET_CACHED_ONLY
+
+
+def test_unlimited_budget_stays_normal():
+    accountant = TokenAccountant(budget=0)
+    accountant.record(usage(10 ** 9))
+    assert accountant.level() == BUDGET_NORMAL
+    assert accountant.stats()["budget"]["used_ratio"] is None
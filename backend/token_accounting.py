@@ -0,0 +1,209 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+from prompts import estimate_tokens
+
+logger = logging.getLogger("apec_chatbot_backend")
+
+# --- Ngân sách token cho các lời gọi LLM (in-memory, riêng cho từng worker) ---
+# TOKEN_BUDGET_PER_WINDOW = 0: không giới hạn (chỉ thống kê)
+# Mỗi worker đếm riêng: với N worker (serve.py --workers N), tổng token thực tế có thể tới N x ngân sách,
+# nên đặt TOKEN_BUDGET_PER_WINDOW = ngân sách tổng / N
+TOKEN_BUDGET_PER_WINDOW = int(os.getenv("TOKEN_BUDGET_PER_WINDOW", "0"))
+TOKEN_BUDGET_WINDOW = int(os.getenv("TOKEN_BUDGET_WINDOW", "3600"))  # giây
+# Khi đã dùng quá tỉ lệ này của ngân sách: giảm k và độ dài context; khi hết ngân sách: chỉ trả lời từ cache
+TOKEN_BUDGET_REDUCE_RATIO = float(os.getenv("TOKEN_BUDGET_REDUCE_RATIO", "0.8"))
+REDUCED_RETRIEVAL_K = int(os.getenv("REDUCED_RETRIEVAL_K", "4"))
+REDUCED_CONTEXT_TOKENS = int(os.getenv("REDUCED_CONTEXT_TOKENS", "1200"))
+# Giới hạn độ dài context ở chế độ bình thường (0 = không giới hạn)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+
+# Đơn giá ước tính (USD / 1 triệu token), mặc định theo bảng giá gemini-1.5-flash
+LLM_PRICE_INPUT_PER_1M = float(os.getenv("LLM_PRICE_INPUT_PER_1M", "0.075"))
+LLM_PRICE_OUTPUT_PER_1M = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", "0.30"))
+
+BUDGET_NORMAL = "normal"
+BUDGET_REDUCED = "reduced"
+BUDGET_CACHED_ONLY = "cached_only"
+
+# Các cửa sổ thống kê trả về ở /admin/tokens
+STATS_WINDOWS = {"5m": 300, "1h": 3600, "24h": 86400}
+_BUCKET_SECONDS = 60
+
+
+@dataclass
+class TokenUsage:
+    """
+    Tokens of one LLM call, split by prompt part. `input_tokens` / `output_tokens` come from the
+    response's usage_metadata when available (`estimated=False`); the per-part split is estimated
+    from text length and scaled to the reported input total.
+    """
+    instruction_tokens: int = 0
+    context_tokens: int = 0
+    question_tokens: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    estimated: bool = True
+
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def cost_usd(self):
+        return (self.input_tokens * LLM_PRICE_INPUT_PER_1M + self.output_tokens * LLM_PRICE_OUTPUT_PER_1M) / 1e6
+
+
+def prompt_token_breakdown(compiled_prompt, context: str, question: str) -> TokenUsage:
+    """
+    Estimates instruction / context / question tokens of a compiled prompt before the call.
+    """
+    template_only = compiled_prompt.human_template.format(context="", question="")
+    instruction_tokens = estimate_tokens(compiled_prompt.system_prompt or "") + estimate_tokens(template_only)
+    context_tokens, question_tokens = estimate_tokens(context), estimate_tokens(question)
+    return TokenUsage(
+        instruction_tokens=instruction_tokens,
+        context_tokens=context_tokens,
+        question_tokens=question_tokens,
+        input_tokens=instruction_tokens + context_tokens + question_tokens,
+    )
+
+
+def apply_usage_metadata(usage: TokenUsage, usage_metadata, answer_text: str) -> TokenUsage:
+    """
+    Fills actual input/output counts from LangChain's `usage_metadata` (falls back to estimates)
+    and rescales the per-part estimates so they add up to the reported input tokens.
+    """
+    if usage_metadata and usage_metadata.get("input_tokens"):
+        estimated_input = max(1, usage.instruction_tokens + usage.context_tokens + usage.question_tokens)
+        scale = usage_metadata["input_tokens"] / estimated_input
+        usage.instruction_tokens = round(usage.instruction_tokens * scale)
+        usage.question_tokens = round(usage.question_tokens * scale)
+        usage.context_tokens = usage_metadata["input_tokens"] - usage.instruction_tokens - usage.question_tokens
+        usage.input_tokens = usage_metadata["input_tokens"]
+        usage.output_tokens = usage_metadata.get("output_tokens", 0)
+        usage.estimated = False
+    else:
+        usage.output_tokens = estimate_tokens(answer_text)
+    return usage
+
+
+def merge_usage_metadata(left, right):
+    # Các chunk stream báo usage riêng phần: cộng từng trường như AIMessageChunk.__add__
+    return {key: left.get(key, 0) + right.get(key, 0) for key in ("input_tokens", "output_tokens", "total_tokens")}
+
+
+def normal_retrieval_limits(default_k):
+    # (k, giới hạn token context) ở chế độ ngân sách bình thường
+    return default_k, CONTEXT_TOKEN_BUDGET or None
+
+
+def truncate_context_documents(documents, max_tokens, format_document):
+    """
+    Keeps the leading (best-ranked) documents whose formatted text fits in `max_tokens`; always keeps the first one.
+    """
+    kept, used = [], 0
+    for doc in documents:
+        doc_tokens = estimate_tokens(format_document(doc))
+        if kept and used + doc_tokens > max_tokens:
+            break
+        kept.append(doc)
+        used += doc_tokens
+    return kept
+
+
+_COUNTER_FIELDS = ("requests", "instruction_tokens", "context_tokens", "question_tokens", "input_tokens", "output_tokens", "estimated_requests", "cost_usd")
+
+
+class TokenAccountant:
+    """
+    Aggregates token usage in one-minute buckets (kept for the longest stats window) and derives the
+    budget level over the last `window` seconds.
+    """
+
+    def __init__(self, budget=TOKEN_BUDGET_PER_WINDOW, window=TOKEN_BUDGET_WINDOW, reduce_ratio=TOKEN_BUDGET_REDUCE_RATIO):
+        self.budget = budget
+        self.window = window
+        self.reduce_ratio = reduce_ratio
+        self.retention = max(window, *STATS_WINDOWS.values())
+        self._buckets = deque()  # (bucket_start, counters)
+        self._lock = threading.Lock()
+        self._level = BUDGET_NORMAL
+        self.cached_only_rejections = 0
+
+    def record(self, usage: TokenUsage):
+        now = time.time()
+        bucket_start = now - now % _BUCKET_SECONDS
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != bucket_start:
+                self._buckets.append((bucket_start, dict.fromkeys(_COUNTER_FIELDS, 0)))
+            while self._buckets and self._buckets[0][0] < now - self.retention - _BUCKET_SECONDS:
+                self._buckets.popleft()
+            counters = self._buckets[-1][1]
+            counters["requests"] += 1
+            for field in ("instruction_tokens", "context_tokens", "question_tokens", "input_tokens", "output_tokens"):
+                counters[field] += getattr(usage, field)
+            counters["estimated_requests"] += int(usage.estimated)
+            counters["cost_usd"] += usage.cost_usd
+        logger.info(
+            f"Token: vào {usage.input_tokens} (chỉ dẫn {usage.instruction_tokens}, context {usage.context_tokens}, "
+            f"câu hỏi {usage.question_tokens}), ra {usage.output_tokens}{' (ước tính)' if usage.estimated else ''}, "
+            f"~${usage.cost_usd:.6f}"
+        )
+        self._update_level()
+
+    def totals(self, seconds):
+        since = time.time() - seconds
+        totals = dict.fromkeys(_COUNTER_FIELDS, 0)
+        with self._lock:
+            for bucket_start, counters in self._buckets:
+                if bucket_start + _BUCKET_SECONDS > since:
+                    for field in _COUNTER_FIELDS:
+                        totals[field] += counters[field]
+        totals["total_tokens"] = totals["input_tokens"] + totals["output_tokens"]
+        totals["cost_usd"] = round(totals["cost_usd"], 6)
+        return totals
+
+    def _update_level(self):
+        if self.budget <= 0:
+            level = BUDGET_NORMAL
+        else:
+            used = self.totals(self.window)["total_tokens"] / self.budget
+            level = BUDGET_CACHED_ONLY if used >= 1 else BUDGET_REDUCED if used >= self.reduce_ratio else BUDGET_NORMAL
+        if level != self._level:
+            logger.warning(f"Ngân sách token: chuyển chế độ {self._level} -> {level}.")
+            self._level = level
+        return level
+
+    def level(self):
+        # Cửa sổ trượt: mức dùng giảm dần theo thời gian kể cả khi không có lời gọi mới
+        return self._update_level()
+
+    def retrieval_limits(self, default_k):
+        """
+        Returns (k, max_context_tokens or None) for the current budget level.
+        """
+        if self.level() == BUDGET_NORMAL:
+            return normal_retrieval_limits(default_k)
+        return min(default_k, REDUCED_RETRIEVAL_K), REDUCED_CONTEXT_TOKENS
+
+    def stats(self):
+        window_totals = self.totals(self.window)
+        return {
+            "level": self.level(),
+            "budget": {
+                "tokens_per_window": self.budget,
+                "window_seconds": self.window,
+                "used": window_totals["total_tokens"],
+                "used_ratio": round(window_totals["total_tokens"] / self.budget, 4) if self.budget > 0 else None,
+                "reduce_ratio": self.reduce_ratio,
+            },
+            "windows": {name: self.totals(seconds) for name, seconds in STATS_WINDOWS.items()},
+            "cached_only_rejections": self.cached_only_rejections,
+            "prices_per_1m": {"input": LLM_PRICE_INPUT_PER_1M, "output": LLM_PRICE_OUTPUT_PER_1M},
+        }
+
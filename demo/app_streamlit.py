@@ -1,10 +1,21 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import requests
-import json
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Cấu hình API Backend ---
-BACKEND_API_URL = "http://localhost:8000/chat" 
+BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:8000/chat")
+# Endpoint stream NDJSON của backend: câu trả lời hiện dần thay vì chờ cả câu dưới spinner
+BACKEND_STREAM_URL = BACKEND_API_URL.rstrip("/") + "/stream"
+# Gợi ý ban đầu do backend cung cấp (backend/quick_replies.py), giao diện không giữ bản sao riêng
+BACKEND_SUGGESTIONS_URL = BACKEND_API_URL.rstrip("/") + "/suggestions"
+# Chu kỳ (giây) cập nhật phần câu trả lời đang nhận
+ANSWER_POLL_INTERVAL = 0.3
 
 st.set_page_config(
     page_title="APEC 2025 Chatbot | Trợ lý AI",
@@ -144,6 +155,95 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# --- Kết nối HTTP dùng chung (giữ kết nối keep-alive giữa các lượt hỏi và các lần chạy lại script) ---
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, backoff_factor=0.3, allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Luồng nền gọi backend: request không chặn lần chạy script, và không bị hủy khi Streamlit chạy lại script
+@st.cache_resource
+def get_request_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="apec-backend")
+
+
+# Không cache khi lỗi (st.cache_data bỏ qua exception): lần chạy sau sẽ thử lại khi backend đã sẵn sàng
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_initial_suggestions(lang: str = "vi"):
+    response = get_http_session().get(BACKEND_SUGGESTIONS_URL, params={"lang": lang}, timeout=5)
+    response.raise_for_status()
+    return response.json().get("suggestions", [])
+
+def get_initial_suggestions():
+    try:
+        return fetch_initial_suggestions()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Không lấy được gợi ý ban đầu từ backend: {e}")
+        return []
+
+
+class PendingAnswer:
+    """
+    Answer being received in a background thread; the UI reads it on each fragment refresh.
+    """
+
+    def __init__(self, message: str):
+        self.message = message
+        self.text = ""
+        self.lang = "?"
+        self.suggestions = []
+        self.error = None
+        self.done = threading.Event()
+
+
+def stream_answer_from_backend(pending: PendingAnswer):
+    """
+    Gửi câu hỏi tới endpoint stream của backend (chạy trong luồng nền) và ghi dần câu trả lời vào `pending`.
+    Không gọi hàm st.* nào ở đây.
+    """
+    print(f"Người dùng gửi: {pending.message}")
+    try:
+        with get_http_session().post(
+            BACKEND_STREAM_URL,
+            json={"message": pending.message},
+            stream=True,
+            timeout=(5, 180),
+        ) as response:
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "?")
+                pending.error = f"Bạn đang gửi quá nhiều câu hỏi. Vui lòng thử lại sau {retry_after} giây."
+                return
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "lang" in event:
+                    pending.lang = event["lang"]
+                if "delta" in event:
+                    pending.text += event["delta"]
+                if "error" in event:
+                    pending.error = event["error"]
+                if event.get("done"):
+                    pending.suggestions = event.get("suggestions", [])
+    except requests.exceptions.ConnectionError:
+        pending.error = "Lỗi kết nối: Không thể kết nối tới API backend. Đảm bảo backend đang chạy tại " + BACKEND_API_URL
+    except requests.exceptions.Timeout:
+        pending.error = "Lỗi timeout: API backend không phản hồi kịp thời. Vui lòng thử lại."
+    except requests.exceptions.RequestException as e:
+        pending.error = f"Lỗi yêu cầu API: {e}. Vui lòng kiểm tra log backend."
+    except json.JSONDecodeError:
+        pending.error = "Lỗi phân tích phản hồi JSON từ API backend."
+    except Exception as e:
+        pending.error = f"Một lỗi không mong muốn đã xảy ra: {e}"
+    finally:
+        pending.done.set()
+
+
 # --- Tiêu đề và mô tả chính ---
 st.title("🤖 APEC 2025 Chatbot")
 st.markdown(
@@ -151,14 +251,49 @@ st.markdown(
     "Hỏi tôi bất cứ điều gì về sự kiện, lịch trình, địa điểm, thủ tục nhập cảnh, văn hóa và nhiều hơn nữa."
 )
 
+# --- Khởi tạo session state ---
+if "messages" not in st.session_state:
+    st.session_state.messages = [] 
+if "last_suggestions" not in st.session_state:
+    st.session_state.last_suggestions = []
+if "pending_answer" not in st.session_state:
+    st.session_state.pending_answer = None
+if "last_error" not in st.session_state:
+    st.session_state.last_error = None
+# Lỗi của câu trả lời gần nhất: hiện cho tới khi gửi câu hỏi mới
+if "answer_error" not in st.session_state:
+    st.session_state.answer_error = None
+
+# --- Callback khi người dùng gửi câu hỏi (ô nhập hoặc nút gợi ý) ---
+# Callback chạy trước lần chạy lại script nên tin nhắn mới hiện ngay, không cần st.rerun()
+def submit_question(message: str):
+    message = (message or "").strip()
+    if not message:
+        return
+    if st.session_state.pending_answer is not None:
+        st.session_state.last_error = "Vui lòng chờ câu trả lời hiện tại hoàn tất rồi gửi câu hỏi tiếp theo."
+        return
+    st.session_state.messages.append({"role": "user", "content": message})
+    st.session_state.last_suggestions = []
+    st.session_state.answer_error = None
+    pending = PendingAnswer(message)
+    st.session_state.pending_answer = pending
+    get_request_executor().submit(stream_answer_from_backend, pending)
+
+def submit_chat_input():
+    submit_question(st.session_state.main_chat_input)
+
+def clear_conversation():
+    st.session_state.messages = []
+    st.session_state.last_suggestions = []
+    st.session_state.pending_answer = None
+    st.session_state.last_error = None
+    st.session_state.answer_error = None
+
 # --- Sidebar với các chức năng bổ sung ---
 with st.sidebar:
     st.header("Tùy chọn")
-    if st.button("🗑️ Xóa cuộc trò chuyện", use_container_width=True):
-        st.session_state.messages = []
-        st.session_state.last_suggestions = [] 
-        st.session_state.temp_user_input = "" # Đảm bảo xóa input tạm thời
-        st.rerun()
+    st.button("🗑️ Xóa cuộc trò chuyện", use_container_width=True, on_click=clear_conversation)
         
     st.markdown("---")
     st.markdown(
@@ -169,108 +304,80 @@ with st.sidebar:
         unsafe_allow_html=True
     )
 
-# --- Khởi tạo session state ---
-if "messages" not in st.session_state:
-    st.session_state.messages = [] 
-if "last_suggestions" not in st.session_state:
-    st.session_state.last_suggestions = []
-if "temp_user_input" not in st.session_state: 
-    st.session_state.temp_user_input = ""
-
-# --- Hàm gửi tin nhắn đến Backend API ---
-def send_message_to_backend(message: str, chat_history: list):
-    """
-    Gửi tin nhắn của người dùng và lịch sử chat đến API backend
-    và nhận câu trả lời.
-    """
-    print(f"Người dùng gửi: {message}")
-    
-    try:
-        with st.spinner("Bot đang suy nghĩ..."): 
-            response = requests.post(
-                BACKEND_API_URL,
-                json={"message": message}, 
-                timeout=180 
-            )
-            response.raise_for_status() 
-
-            data = response.json()
-            return data["answer"], data.get("lang", "?"), data.get("suggestions", []) 
-    except requests.exceptions.ConnectionError:
-        st.error("Lỗi kết nối: Không thể kết nối tới API backend. Đảm bảo backend đang chạy tại " + BACKEND_API_URL)
-    except requests.exceptions.Timeout:
-        st.error("Lỗi timeout: API backend không phản hồi kịp thời. Vui lòng thử lại.")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Lỗi yêu cầu API: {e}. Vui lòng kiểm tra log backend.")
-    except json.JSONDecodeError:
-        st.error("Lỗi phân tích phản hồi JSON từ API backend.")
-    except Exception as e:
-        st.error(f"Một lỗi không mong muốn đã xảy ra: {e}")
-    return None, "?", [] 
-
 # --- Hiển thị lịch sử cuộc trò chuyện ---
-for message in st.session_state.messages:
+def render_message(message):
     with st.chat_message(message["role"], avatar="🙋‍♂️" if message["role"] == "user" else "🤖"):
         st.markdown(message["content"])
 
-# --- Xử lý input từ người dùng (text input) ---
-if prompt := st.chat_input("Gõ câu hỏi của bạn ở đây...", key="main_chat_input"):
-    st.session_state.temp_user_input = prompt 
+for message in st.session_state.messages:
+    render_message(message)
 
-# --- Xử lý khi có input (từ chat_input hoặc quick reply) ---
-if st.session_state.temp_user_input:
-    user_message = st.session_state.temp_user_input
-    st.session_state.temp_user_input = "" # Xóa tạm để tránh lặp
-    
-    st.session_state.messages.append({"role": "user", "content": user_message})
-    with st.chat_message("user", avatar="🙋‍♂️"):
-        st.markdown(user_message)
-
-    current_chat_history = [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages]
-    
-    answer, lang, suggestions = send_message_to_backend(user_message, current_chat_history)
-    
-    if answer: 
-        st.session_state.messages.append({"role": "assistant", "content": answer, "lang": lang})
-        st.session_state.last_suggestions = suggestions
-    
-    st.rerun() 
+if st.session_state.last_error:
+    st.error(st.session_state.last_error)
+    st.session_state.last_error = None
 
 # --- Hiển thị các câu hỏi gợi ý nhanh ---
 # Chỉ hiển thị quick replies nếu không có tin nhắn nào trong lịch sử HOẶC có gợi ý từ tin nhắn gần nhất
-if not st.session_state.messages or st.session_state.last_suggestions:
-    st.markdown("---") 
-    suggestions_container = st.container()
-    with suggestions_container:
-        st.markdown("<p style='text-align: center; font-weight: 500;'>Hoặc thử một trong các câu hỏi sau:</p>", unsafe_allow_html=True)
-        
-        suggestions_to_display = []
-        if st.session_state.last_suggestions: 
-            suggestions_to_display = st.session_state.last_suggestions
-        elif not st.session_state.messages: 
-            suggestions_to_display = [
-                "APEC 2025 tổ chức ở đâu?",
-                "Lịch trình chính của hội nghị?",
-                "Các chủ đề thảo luận chính là gì?",
-                "Giới thiệu về văn hóa Việt Nam ở Phú Quốc?", 
-                "Thông tin về các thành viên APEC?"
-            ]
-        
-        if suggestions_to_display:
-            # Sửa đổi logic tạo cột và phân phối nút
-            num_suggestions = len(suggestions_to_display)
-            # Giới hạn số cột hiển thị trên một hàng để tránh quá nhỏ, ví dụ max 3 cột
-            max_cols_per_row = 3
-            num_rows = (num_suggestions + max_cols_per_row - 1) // max_cols_per_row # Tính số hàng cần thiết
-
-            for row in range(num_rows):
-                # Tạo số cột bằng max_cols_per_row
-                cols = st.columns(max_cols_per_row)
-                for col_idx in range(max_cols_per_row):
-                    sug_idx = row * max_cols_per_row + col_idx
-                    if sug_idx < num_suggestions:
-                        sug = suggestions_to_display[sug_idx]
-                        with cols[col_idx]:
-                            if st.button(sug, key=f"sug_btn_{sug_idx}", use_container_width=True): 
-                                st.session_state.temp_user_input = sug 
-                                st.rerun()
\ No newline at end of file
+def render_suggestions():
+    suggestions_to_display = []
+    if st.session_state.last_suggestions:
+        suggestions_to_display = st.session_state.last_suggestions
+    elif not st.session_state.messages:
+        suggestions_to_display = get_initial_suggestions()
+    if not suggestions_to_display:
+        return
+
+    st.markdown("---")
+    st.markdown("<p style='text-align: center; font-weight: 500;'>Hoặc thử một trong các câu hỏi sau:</p>", unsafe_allow_html=True)
+    num_suggestions = len(suggestions_to_display)
+    # Giới hạn số cột hiển thị trên một hàng để tránh quá nhỏ, ví dụ max 3 cột
+    max_cols_per_row = 3
+    num_rows = (num_suggestions + max_cols_per_row - 1) // max_cols_per_row # Tính số hàng cần thiết
+
+    for row in range(num_rows):
+        # Tạo số cột bằng max_cols_per_row
+        cols = st.columns(max_cols_per_row)
+        for col_idx in range(max_cols_per_row):
+            sug_idx = row * max_cols_per_row + col_idx
+            if sug_idx < num_suggestions:
+                sug = suggestions_to_display[sug_idx]
+                with cols[col_idx]:
+                    # Gửi câu hỏi qua callback: không chặn giao diện và không cần st.rerun()
+                    st.button(sug, key=f"sug_btn_{sug_idx}", use_container_width=True, on_click=submit_question, args=(sug,))
+
+# --- Câu trả lời đang nhận ---
+# Chỉ fragment này được chạy lại theo chu kỳ trong lúc chờ backend; lịch sử phía trên không bị vẽ lại.
+# Khi câu trả lời xong, chạy lại toàn trang đúng một lần: câu trả lời được vẽ cùng lịch sử, và vì không còn
+# câu trả lời đang chờ nên fragment không được gọi nữa, Streamlit ngừng chạy lại nó theo chu kỳ.
+@st.fragment(run_every=ANSWER_POLL_INTERVAL)
+def render_pending_answer():
+    pending = st.session_state.pending_answer
+    if pending is None or pending.done.is_set():
+        if pending is not None:
+            st.session_state.pending_answer = None
+            if pending.error:
+                st.session_state.answer_error = pending.error
+            elif pending.text:
+                st.session_state.messages.append({"role": "assistant", "content": pending.text, "lang": pending.lang})
+                st.session_state.last_suggestions = pending.suggestions
+        st.rerun(scope="app")
+    with st.chat_message("assistant", avatar="🤖"):
+        if pending.text:
+            st.markdown(pending.text + "▌")
+        else:
+            st.markdown("_Bot đang suy nghĩ..._")
+
+if st.session_state.pending_answer is not None:
+    render_pending_answer()
+else:
+    if st.session_state.answer_error:
+        st.error(st.session_state.answer_error)
+    render_suggestions()
+
+# --- Ô nhập câu hỏi ---
+# Không khóa trong lúc chờ: trạng thái khóa chỉ đổi được khi chạy lại toàn trang (câu hỏi gửi khi đang chờ được báo lỗi)
+st.chat_input(
+    "Gõ câu hỏi của bạn ở đây...",
+    key="main_chat_input",
+    on_submit=submit_chat_input,
+)